@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Binary LD matrix formats, so fine-mapping tools can np.memmap LD instead of
+parsing PLINK's gzipped text with np.loadtxt.
+
+Both formats share the same preamble:
+  magic       6 bytes, b'\\x93LDMAT' or b'\\x93LDBND'
+  version     2 bytes (major, minor)
+  header_len  uint32, little endian
+  header      JSON, space padded so the data starts on a 64-byte boundary
+
+Dense .ldm: the header holds dtype, n_snps and snps; an n_snps x n_snps
+row-major little-endian float32/float16 matrix follows. The SNP order in
+the header is the row/column order of the matrix.
+
+Banded .ldband (whole chromosomes): only pairs within a kb/SNP window are
+stored, as the upper triangle in CSR form over SNPs sorted by position.
+The header holds snps, the window and the offset of each array (positions,
+indptr, indices, values); see BandedLD for region slicing.
+
+Run as a script to convert an existing .ld.gz + SNP list to .ldm, or to
+slice a region out of a .ldband file.
+
+gwas_suite/ and fine/ each carry a copy of this module, since every tool
+directory is shipped on its own; keep the two identical
+(gwas_suite/tests/test_vendored_copies.py checks this).
+"""
+import argparse
+import gzip
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+LD_MAGIC = b'\x93LDMAT'
+BAND_MAGIC = b'\x93LDBND'
+LD_VERSION = (1, 0)
+LD_DTYPES = {'float32': '<f4', 'float16': '<f2'}
+ALIGNMENT = 64
+ROWS_PER_CHUNK = 1024
+
+
+def _has_magic(path, magic):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(magic)) == magic
+    except OSError:
+        return False
+
+
+def is_ld_binary(path):
+    """True if path starts with the dense binary LD magic"""
+    return _has_magic(path, LD_MAGIC)
+
+
+def is_ld_band(path):
+    """True if path starts with the banded LD magic"""
+    return _has_magic(path, BAND_MAGIC)
+
+
+def _encode_header(meta, magic=LD_MAGIC):
+    header = json.dumps(meta).encode()
+    prefix_len = len(magic) + 2 + 4
+    total = prefix_len + len(header) + 1
+    header += b' ' * (-total % ALIGNMENT) + b'\n'
+    return magic + bytes(LD_VERSION) + struct.pack('<I', len(header)) + header
+
+
+def read_ld_header(path, magic=LD_MAGIC):
+    """Return (header dict, byte offset of the data)"""
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            kind = 'banded' if magic == BAND_MAGIC else 'binary'
+            raise ValueError(f"{path} is not a {kind} LD matrix")
+        major, _minor = f.read(2)
+        if major != LD_VERSION[0]:
+            raise ValueError(f"Unsupported binary LD version {major} in {path}")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len))
+        return header, f.tell()
+
+
+def open_ld_binary(path, mmap=True):
+    """Return (matrix, snps). With mmap the matrix is a read-only np.memmap."""
+    header, offset = read_ld_header(path)
+    n = header['n_snps']
+    dtype = np.dtype(header['dtype'])
+    if mmap:
+        matrix = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n, n))
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            matrix = np.fromfile(f, dtype=dtype, count=n * n).reshape(n, n)
+    return matrix, header['snps']
+
+
+def write_ld_binary(path, rows, snps, dtype='float32'):
+    """
+    Write a binary LD matrix. rows is a 2-D array or an iterable of 2-D row
+    blocks (so large matrices never need to be held in memory at once).
+    """
+    if dtype not in LD_DTYPES:
+        raise ValueError(f"Unsupported LD dtype: {dtype} (choose from {', '.join(LD_DTYPES)})")
+    n = len(snps)
+    if isinstance(rows, np.ndarray):
+        rows = [rows]
+    out_dtype = np.dtype(LD_DTYPES[dtype])
+    written = 0
+    with open(path, 'wb') as f:
+        f.write(_encode_header({'dtype': LD_DTYPES[dtype], 'n_snps': n, 'snps': list(snps)}))
+        for block in rows:
+            block = np.asarray(block)
+            if block.ndim != 2 or block.shape[1] != n:
+                raise ValueError(f"LD rows have shape {block.shape}, expected (*, {n})")
+            f.write(np.ascontiguousarray(block, dtype=out_dtype).tobytes())
+            written += block.shape[0]
+    if written != n:
+        os.remove(path)
+        raise ValueError(f"LD matrix has {written} rows but {n} SNPs")
+    return path
+
+
+def raw_row_blocks(raw_path, n, src_dtype='<f4', rows_per_chunk=ROWS_PER_CHUNK):
+    """Row blocks of a headerless square matrix, e.g. PLINK --r square bin4"""
+    row_bytes = n * np.dtype(src_dtype).itemsize
+    with open(raw_path, 'rb') as f:
+        while True:
+            buf = f.read(row_bytes * rows_per_chunk)
+            if not buf:
+                break
+            yield np.frombuffer(buf, dtype=src_dtype).reshape(-1, n)
+
+
+def text_row_blocks(ld_path, rows_per_chunk=ROWS_PER_CHUNK):
+    """Row blocks of a PLINK square text matrix, plain or gzipped (detected by magic bytes)"""
+    opener = gzip.open if _has_magic(ld_path, b'\x1f\x8b') else open
+    with opener(ld_path, 'rt') as f:
+        for chunk in pd.read_csv(f, sep=r'\s+', header=None, dtype=np.float32,
+                                 chunksize=rows_per_chunk, engine='c'):
+            yield chunk.to_numpy()
+
+
+def write_ld_band(path, snps, positions, rows, cols, values, window_kb=None, window_snps=None):
+    """
+    Write a banded LD file from pair lists: rows/cols index into snps, values
+    are r. Pairs may come in either orientation and any order; SNPs are
+    re-ordered by position. Self pairs are dropped (the diagonal is implied).
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    n = len(snps)
+    order = np.argsort(positions, kind='stable')
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    r = rank[np.asarray(rows, dtype=np.int64)]
+    c = rank[np.asarray(cols, dtype=np.int64)]
+    values = np.asarray(values, dtype=np.float32)
+    keep = r != c
+    r, c, values = r[keep], c[keep], values[keep]
+    r, c = np.minimum(r, c), np.maximum(r, c)
+    pair_order = np.lexsort((c, r))
+    r, c, values = r[pair_order], c[pair_order], values[pair_order]
+
+    arrays = {
+        'positions': positions[order].astype('<i8'),
+        'indptr': np.concatenate(([0], np.cumsum(np.bincount(r, minlength=n)))).astype('<i8'),
+        'indices': c.astype('<i4'),
+        'values': values.astype('<f4'),
+    }
+    meta = {'n_snps': n, 'nnz': int(len(values)), 'window_kb': window_kb, 'window_snps': window_snps,
+            'snps': [snps[i] for i in order], 'arrays': {}}
+
+    # Array offsets are relative to the end of the header and kept aligned
+    offset = 0
+    for name, arr in arrays.items():
+        meta['arrays'][name] = {'dtype': arr.dtype.str, 'length': len(arr), 'offset': offset}
+        offset += arr.nbytes + (-arr.nbytes % ALIGNMENT)
+
+    with open(path, 'wb') as f:
+        f.write(_encode_header(meta, magic=BAND_MAGIC))
+        for arr in arrays.values():
+            f.write(arr.tobytes())
+            f.write(b'\0' * (-arr.nbytes % ALIGNMENT))
+    return path
+
+
+class BandedLD:
+    """Read-only view of a .ldband file; arrays are memory-mapped.
+
+    Pairs further apart than the stored window read back as 0, so a slice is
+    only exact for regions no wider than the window it was computed with.
+    """
+
+    def __init__(self, path):
+        header, data_offset = read_ld_header(path, magic=BAND_MAGIC)
+        self.path = path
+        self.snps = header['snps']
+        self.window_kb = header['window_kb']
+        self.window_snps = header['window_snps']
+        for name, spec in header['arrays'].items():
+            arr = (np.memmap(path, dtype=spec['dtype'], mode='r', offset=data_offset + spec['offset'],
+                             shape=(spec['length'],)) if spec['length'] else np.empty(0, dtype=spec['dtype']))
+            setattr(self, name, arr)
+
+    def __len__(self):
+        return len(self.snps)
+
+    def region_indices(self, start, end):
+        """Half-open index range of SNPs with start <= BP <= end"""
+        return (int(np.searchsorted(self.positions, start, side='left')),
+                int(np.searchsorted(self.positions, end, side='right')))
+
+    def block(self, i0, i1):
+        """Dense float32 LD for SNPs i0..i1-1 (position order)"""
+        n = i1 - i0
+        matrix = np.zeros((n, n), dtype=np.float32)
+        lo, hi = int(self.indptr[i0]), int(self.indptr[i1])
+        if hi > lo:
+            rows = np.repeat(np.arange(n), np.diff(self.indptr[i0:i1 + 1]))
+            cols = np.asarray(self.indices[lo:hi]) - i0
+            inside = cols < n
+            matrix[rows[inside], cols[inside]] = self.values[lo:hi][inside]
+        matrix += matrix.T
+        np.fill_diagonal(matrix, 1.0)
+        return matrix
+
+    def slice(self, start, end):
+        """Return (dense LD, SNP IDs) for the SNPs with start <= BP <= end"""
+        i0, i1 = self.region_indices(start, end)
+        return self.block(i0, i1), self.snps[i0:i1]
+
+
+def read_snp_list(snps_path):
+    with open(snps_path) as f:
+        return [line.split()[0] for line in f if line.strip() and not line.startswith('#')]
+
+
+def convert_ld_text(ld_path, snps_path, output_path, dtype='float32'):
+    """Convert an existing PLINK .ld.gz and its SNP list to the binary format"""
+    snps = read_snp_list(snps_path)
+    return write_ld_binary(output_path, text_row_blocks(ld_path), snps, dtype=dtype)
+
+
+def slice_ld_band(band_path, start, end, output_ld_path, output_snps_path, dtype='float32'):
+    """Cut a region out of a .ldband file into a dense .ldm matrix and SNP list"""
+    band = BandedLD(band_path)
+    matrix, snps = band.slice(start, end)
+    if band.window_kb is not None and end - start > band.window_kb * 1000:
+        print(f"Warning: region is wider than the stored {band.window_kb} kb window; "
+              "pairs further apart are reported as 0.")
+    write_ld_binary(output_ld_path, matrix, snps, dtype=dtype)
+    with open(output_snps_path, 'w') as f:
+        for snp in snps:
+            f.write(f"{snp}\n")
+    return len(snps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Binary LD matrix utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert = sub.add_parser("convert", help="Convert a PLINK text LD matrix to the binary LD format.")
+    convert.add_argument("--ld", required=True, help="PLINK --r square output (.ld or .ld.gz)")
+    convert.add_argument("--snps", required=True, help="SNP list in matrix order (one ID per line)")
+    convert.add_argument("--output", required=True)
+    convert.add_argument("--dtype", choices=list(LD_DTYPES), default="float32")
+
+    band = sub.add_parser("slice", help="Extract a region from a banded whole-chromosome LD file.")
+    band.add_argument("--band", required=True, help="Banded LD file from calc_ld_matrix.py --ld_format banded")
+    band.add_argument("--start", required=True, type=int, help="Region start (bp, inclusive)")
+    band.add_argument("--end", required=True, type=int, help="Region end (bp, inclusive)")
+    band.add_argument("--output_ld", required=True)
+    band.add_argument("--output_snps", required=True)
+    band.add_argument("--dtype", choices=list(LD_DTYPES), default="float32")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "convert":
+            convert_ld_text(args.ld, args.snps, args.output, dtype=args.dtype)
+            header, _ = read_ld_header(args.output)
+            print(f"Wrote {header['n_snps']} x {header['n_snps']} {args.dtype} LD matrix to {args.output}")
+        else:
+            n = slice_ld_band(args.band, args.start, args.end, args.output_ld, args.output_snps, dtype=args.dtype)
+            print(f"Sliced {n} SNPs from {args.band} ({args.start}-{args.end})")
+    except Exception as e:
+        sys.exit(f"An error occurred: {e}")
@@ -6,14 +6,42 @@ import pandas as pd
 import numpy as np
 import gzip
 from pysusie import susie  # adjust import based on your PySuSiE installation
+from ld_formats import is_ld_binary, open_ld_binary
+
+SUMSTATS_COLUMNS = {'SNP': str, 'BETA': np.float64, 'SE': np.float64}
+
+def _open_text(file_path):
+    """Open plain or gzipped text (detected by magic bytes, Galaxy datasets have no .gz suffix)."""
+    with open(file_path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    return gzip.open(file_path, 'rt') if gzipped else open(file_path)
+
+def detect_separator(file_path):
+    """Tab, comma or whitespace, from the header line (replaces the python engine's sniffing)."""
+    with _open_text(file_path) as f:
+        header = f.readline()
+    if '\t' in header:
+        return '\t'
+    if ',' in header:
+        return ','
+    return r'\s+'
 
 def load_sumstats(file_path):
-    """Load summary statistics, skip duplicate headers if present."""
+    """Load SNP/BETA/SE from summary statistics with the C parser; skip duplicate headers if present."""
     try:
-        sumstats = pd.read_csv(file_path, sep=None, engine='python')
-        # Detect actual header row if there are duplicates
-        if sumstats.iloc[0,0] == 'SNP':
-            sumstats = sumstats[1:]  # remove duplicated header row
+        sep = detect_separator(file_path)
+        with _open_text(file_path) as f:
+            try:
+                sumstats = pd.read_csv(f, sep=sep, engine='c', usecols=list(SUMSTATS_COLUMNS),
+                                       dtype=SUMSTATS_COLUMNS)
+            except ValueError:
+                sumstats = None
+        if sumstats is None:
+            # Typed parse failed, e.g. a duplicated header row inside the data
+            with _open_text(file_path) as f:
+                sumstats = pd.read_csv(f, sep=sep, engine='c', usecols=list(SUMSTATS_COLUMNS), dtype=str)
+            sumstats = sumstats[sumstats['SNP'] != 'SNP']  # remove duplicated header rows
+            sumstats = sumstats.astype(SUMSTATS_COLUMNS)
         sumstats = sumstats.reset_index(drop=True)
         return sumstats
     except Exception as e:
@@ -21,42 +49,76 @@ def load_sumstats(file_path):
         sys.exit(1)
 
 def load_snp_list(file_path):
-    """Load SNP list and detect first column automatically."""
+    """Load SNP list (first column, '#' lines ignored)."""
     try:
-        snp_df = pd.read_csv(file_path, sep=None, engine='python', header=None)
-        snp_df.columns = ['SNP']  # assume first column contains SNPs
+        with _open_text(file_path) as f:
+            snp_df = pd.read_csv(f, sep=r'\s+', engine='c', header=None, usecols=[0], dtype=str, comment='#')
+        snp_df.columns = ['SNP']
         return snp_df
     except Exception as e:
         print(f"Error loading SNP list: {e}", file=sys.stderr)
         sys.exit(1)
 
 def load_ld_matrix(file_path):
-    """Load LD matrix as a numpy array. Supports plain text or gzipped files."""
+    """
+    Load LD matrix as a numpy array. Binary (.ldm) matrices and .npy files
+    are memory-mapped; plain text or gzipped text goes through the C parser.
+    Returns (matrix, SNP order from the file header or None).
+    """
     try:
-        if file_path.endswith('.gz'):
-            with gzip.open(file_path, 'rt') as f:
-                return np.loadtxt(f)
-        else:
-            return np.loadtxt(file_path)
+        if is_ld_binary(file_path):
+            return open_ld_binary(file_path)
+        with open(file_path, 'rb') as f:
+            if f.read(6) == b'\x93NUMPY':
+                return np.load(file_path, mmap_mode='r'), None
+        with _open_text(file_path) as f:
+            matrix = pd.read_csv(f, sep=r'\s+', engine='c', header=None, dtype=np.float64).to_numpy()
+        return matrix, None
     except Exception as e:
         print(f"Error loading LD matrix: {e}", file=sys.stderr)
         sys.exit(1)
 
+def align_to_ld(sumstats, ld_matrix, ld_snps):
+    """
+    Index-join sumstats onto the LD SNP order. SNPs of the LD matrix that are
+    missing from the sumstats are dropped from the matrix as well, so
+    beta/se/R always line up. Returns (aligned sumstats, R).
+    """
+    if len(ld_snps) != ld_matrix.shape[0]:
+        raise ValueError(f"LD matrix has {ld_matrix.shape[0]} rows but the SNP list has {len(ld_snps)} SNPs.")
+    by_snp = sumstats.drop_duplicates('SNP').set_index('SNP')
+    aligned = by_snp.reindex(pd.Index(ld_snps, name='SNP'))
+    keep = aligned['BETA'].notna().to_numpy() & aligned['SE'].notna().to_numpy()
+    if not keep.all():
+        print(f"{(~keep).sum()} LD SNPs have no summary statistics and are dropped.")
+        idx = np.flatnonzero(keep)
+        ld_matrix = ld_matrix[np.ix_(idx, idx)]
+        aligned = aligned[keep]
+    return aligned.reset_index(), np.asarray(ld_matrix, dtype=np.float64)
+
 def run_susier_analysis(sumstats_file, ld_matrix_file, snp_list_file, n, output_creds, output_pips):
     print("--- Step 1: Loading input data ---")
     sumstats = load_sumstats(sumstats_file)
     snp_list = load_snp_list(snp_list_file)
-    ld_matrix = load_ld_matrix(ld_matrix_file)
+    ld_matrix, ld_snps = load_ld_matrix(ld_matrix_file)
+    if ld_snps is None:
+        ld_snps = snp_list['SNP'].tolist()
+    elif ld_snps != snp_list['SNP'].tolist():
+        print("SNP list differs from the order stored in the binary LD matrix; using the matrix order.")
 
-    # Filter sumstats to SNPs in the list
-    filtered_sumstats = sumstats[sumstats['SNP'].isin(snp_list['SNP'])]
+    # Align sumstats to the LD matrix order
+    try:
+        filtered_sumstats, ld_matrix = align_to_ld(sumstats, ld_matrix, ld_snps)
+    except ValueError as e:
+        print(f"Error aligning SNPs: {e}", file=sys.stderr)
+        sys.exit(1)
     if filtered_sumstats.empty:
         print("No SNPs matched between sumstats and SNP list.", file=sys.stderr)
         sys.exit(1)
 
     # Extract effect sizes and standard errors
-    beta = filtered_sumstats['BETA'].astype(float).to_numpy()
-    se = filtered_sumstats['SE'].astype(float).to_numpy()
+    beta = filtered_sumstats['BETA'].to_numpy()
+    se = filtered_sumstats['SE'].to_numpy()
 
     # Run SuSiE
     print("--- Step 2: Running SuSiE ---")
@@ -70,7 +132,7 @@ def run_susier_analysis(sumstats_file, ld_matrix_file, snp_list_file, n, output_
     print("--- Step 3: Saving outputs ---")
     try:
         pd.DataFrame(susie_res['sets']['cs']).to_csv(output_creds, index=False)
-        pd.DataFrame(susie_res['pip'], columns=['PIP']).to_csv(output_pips, index=False)
+        pd.DataFrame({'SNP': filtered_sumstats['SNP'], 'PIP': susie_res['pip']}).to_csv(output_pips, index=False)
     except Exception as e:
         print(f"Error saving outputs: {e}", file=sys.stderr)
         sys.exit(1)
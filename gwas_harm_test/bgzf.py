@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Minimal BGZF writer and tabix (.tbi) index builder, so ssf_converter can
+compress and index its output in the same pass that produces it instead of
+running bgzip and tabix over the finished file.
+"""
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BLOCK_SIZE = 0xff00  # uncompressed bytes per block, same as bgzip
+# gzip member header with the BGZF 'BC' extra field, up to (not including) BSIZE
+_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+EOF_BLOCK = _HEADER + b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+TBI_MIN_SHIFT = 14
+TBI_LEAF_BIN = 4681  # first bin of the 16 kb level
+TBI_META_BIN = 37450
+
+
+def compress_block(data, level=6):
+    """Compress up to BLOCK_SIZE bytes into one BGZF block"""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = c.compress(data) + c.flush()
+    bsize = len(_HEADER) + 2 + len(cdata) + 8
+    return (_HEADER + struct.pack('<H', bsize - 1) + cdata +
+            struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+
+
+class BgzfWriter:
+    """Write BGZF to a binary sink, compressing blocks on a thread pool.
+
+    Keeps the compressed start of every block so uncompressed positions can
+    be turned into tabix virtual offsets once writing is done.
+    """
+
+    def __init__(self, sink, threads=1, level=6):
+        self._sink = sink
+        self._level = level
+        self._buf = bytearray()
+        self._pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._batch = BLOCK_SIZE * max(1, threads) * 4
+        self._coffset = 0
+        self.block_offsets = [0]
+        self.uncompressed_size = 0
+
+    def write(self, data):
+        self._buf += data
+        self.uncompressed_size += len(data)
+        if len(self._buf) >= self._batch:
+            self._flush_blocks(final=False)
+        return len(data)
+
+    def _flush_blocks(self, final):
+        n = len(self._buf) // BLOCK_SIZE
+        if final and len(self._buf) % BLOCK_SIZE:
+            n += 1
+        blocks = [bytes(self._buf[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]) for i in range(n)]
+        del self._buf[:n * BLOCK_SIZE]
+        if self._pool:
+            compressed = self._pool.map(lambda b: compress_block(b, self._level), blocks)
+        else:
+            compressed = (compress_block(b, self._level) for b in blocks)
+        for block in compressed:
+            self._sink.write(block)
+            self._coffset += len(block)
+            self.block_offsets.append(self._coffset)
+
+    def virtual_offsets(self, positions):
+        """Map uncompressed byte positions to BGZF virtual offsets (after close)"""
+        offsets = np.asarray(self.block_offsets, dtype=np.uint64)
+        positions = np.asarray(positions, dtype=np.uint64)
+        block = positions // np.uint64(BLOCK_SIZE)
+        return (offsets[block] << np.uint64(16)) | (positions % np.uint64(BLOCK_SIZE))
+
+    def close(self):
+        self._flush_blocks(final=True)
+        self._sink.write(EOF_BLOCK)
+        if self._pool:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class TabixIndexBuilder:
+    """Accumulate a tabix index for single-position records written in order.
+
+    Records are described by their uncompressed line start/end, so the index
+    can be built while streaming and resolved to virtual offsets at the end.
+    Input that is not sorted (a chromosome reappears, or positions go
+    backwards) cannot be tabix-indexed; `valid` turns False and the caller
+    should skip the index, as `tabix` would fail on it.
+    """
+
+    def __init__(self, seq_col=1, beg_col=2, end_col=2, meta_char='N', skip=1):
+        self.seq_col = seq_col
+        self.beg_col = beg_col
+        self.end_col = end_col
+        self.meta_char = meta_char
+        self.skip = skip
+        self.valid = True
+        self.names = []
+        self._refs = {}
+        self._current = None
+        self._last_pos = 0
+
+    def invalidate(self, reason):
+        if self.valid:
+            print(f"Warning: not writing tabix index ({reason})")
+        self.valid = False
+
+    def add(self, chroms, positions, starts, ends):
+        """Add records; chroms is an array of str, positions are 1-based ints"""
+        if not self.valid or len(chroms) == 0:
+            return
+        change = np.flatnonzero(chroms[1:] != chroms[:-1]) + 1
+        bounds = np.concatenate(([0], change, [len(chroms)]))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            name = chroms[a]
+            pos = positions[a:b]
+            if name != self._current:
+                if name in self._refs:
+                    self.invalidate(f"chromosome {name} is not contiguous")
+                    return
+                self._refs[name] = {'bins': {}, 'linear': {}, 'start': starts[a], 'end': ends[a], 'n': 0}
+                self.names.append(name)
+                self._current = name
+                self._last_pos = 1
+            if pos[0] < self._last_pos or np.any(np.diff(pos) < 0):
+                self.invalidate(f"positions on chromosome {name} are not sorted")
+                return
+
+            ref = self._refs[name]
+            # Single-position records always fall in the 16 kb leaf bin of their window
+            windows = (pos - 1) >> TBI_MIN_SHIFT
+            uniq, first = np.unique(windows, return_index=True)
+            last = np.append(first[1:], len(pos)) - 1
+            for w, f, l in zip(uniq.tolist(), first.tolist(), last.tolist()):
+                chunk = ref['bins'].get(TBI_LEAF_BIN + w)
+                if chunk is None:
+                    ref['bins'][TBI_LEAF_BIN + w] = [starts[a + f], ends[a + l]]
+                    ref['linear'][w] = starts[a + f]
+                else:
+                    chunk[1] = ends[a + l]
+            ref['end'] = ends[b - 1]
+            ref['n'] += b - a
+            self._last_pos = pos[-1]
+
+    def write(self, path, to_virtual):
+        """Write the .tbi, resolving positions with to_virtual (BgzfWriter.virtual_offsets)"""
+        names = b''.join(n.encode() + b'\x00' for n in self.names)
+        out = [b'TBI\x01', struct.pack('<8i', len(self.names), 0, self.seq_col, self.beg_col,
+                                       self.end_col, ord(self.meta_char), self.skip, len(names)), names]
+        for name in self.names:
+            ref = self._refs[name]
+            bin_ids = np.fromiter(ref['bins'].keys(), dtype=np.uint32)
+            order = np.argsort(bin_ids)
+            chunks = np.array(list(ref['bins'].values()), dtype=np.uint64)[order]
+            ref_start, ref_end = to_virtual([ref['start'], ref['end']]).tolist()
+
+            bins = np.zeros(len(bin_ids), dtype=[('bin', '<u4'), ('n', '<i4'), ('beg', '<u8'), ('end', '<u8')])
+            bins['bin'] = bin_ids[order]
+            bins['n'] = 1
+            bins['beg'] = to_virtual(chunks[:, 0])
+            bins['end'] = to_virtual(chunks[:, 1])
+            out.append(struct.pack('<i', len(bins) + 1))
+            out.append(bins.tobytes())
+            out.append(struct.pack('<IiQQQQ', TBI_META_BIN, 2, ref_start, ref_end, ref['n'], 0))
+
+            # Empty windows take the previous window's offset (the chromosome
+            # start before the first one), as htslib does
+            windows = np.fromiter(ref['linear'].keys(), dtype=np.int64)
+            starts = np.fromiter(ref['linear'].values(), dtype=np.uint64)
+            n_intv = int(windows.max()) + 1
+            filled = np.full(n_intv, -1, dtype=np.int64)
+            filled[windows] = np.arange(len(windows))
+            filled = np.maximum.accumulate(filled)
+            linear = np.where(filled >= 0, to_virtual(starts[np.maximum(filled, 0)]), np.uint64(ref_start))
+            out.append(struct.pack('<i', n_intv))
+            out.append(linear.astype('<u8').tobytes())
+        out.append(struct.pack('<Q', 0))
+
+        with open(path, 'wb') as f, BgzfWriter(f) as bgzf:
+            bgzf.write(b''.join(out))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Write files while computing their MD5 checksum, so the SSF metadata can
+record data_file_md5sum without reading the finished file back.
+"""
+import hashlib
+
+BLOCK_SIZE = 1 << 20
+
+
+class HashingWriter:
+    """File-like writer that feeds every byte it writes into an MD5 digest.
+
+    Opened in text mode ('w') it accepts str and encodes it, so it can be
+    handed straight to pandas.to_csv or csv.writer. In binary mode ('wb')
+    it accepts bytes, e.g. from shutil.copyfileobj or a bgzip pipe.
+    """
+
+    def __init__(self, path, mode='w', encoding='utf-8'):
+        if mode not in ('w', 'wb'):
+            raise ValueError(f"Unsupported mode for HashingWriter: {mode}")
+        self.name = path
+        self.mode = mode
+        self.encoding = encoding
+        self.bytes_written = 0
+        self._md5 = hashlib.md5()
+        self._fh = open(path, 'wb')
+
+    def write(self, data):
+        raw = data if 'b' in self.mode else data.encode(self.encoding)
+        self._md5.update(raw)
+        self._fh.write(raw)
+        self.bytes_written += len(raw)
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def flush(self):
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+    @property
+    def closed(self):
+        return self._fh.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def copy_with_md5(src, dst_path):
+    """Copy a readable binary stream to dst_path and return the MD5 of what was written."""
+    with HashingWriter(dst_path, 'wb') as out:
+        while True:
+            block = src.read(BLOCK_SIZE)
+            if not block:
+                break
+            out.write(block)
+    return out.hexdigest()
+
+
+def file_md5(path):
+    """MD5 of an existing file, read in fixed-size blocks."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
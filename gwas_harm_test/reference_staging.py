@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Stage per-chromosome reference files for the harmonizer container without
+copying them on every run.
+
+Strategies, tried in this order by 'auto':
+  hardlink - same filesystem, no I/O and visible inside the container
+  bind     - symlink the files and bind-mount their real directory into the
+             container (needs singularity/apptainer)
+  cache    - copy once into a persistent, content-addressed cache on the node
+             and hardlink or symlink from there; later jobs reuse the cached
+             copy. The cache is capped in size and evicts least recently
+             used objects.
+  copy     - the old behaviour: plain copy into local_reference
+"""
+import hashlib
+import os
+import shutil
+import time
+
+from hashing_writer import copy_with_md5
+
+STAGING_MODES = ['auto', 'hardlink', 'bind', 'cache', 'copy']
+DEFAULT_CACHE_DIR = os.environ.get(
+    'GWAS_REF_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'gwas_harmonizer', 'references'))
+DEFAULT_CACHE_MAX_GB = float(os.environ.get('GWAS_REF_CACHE_MAX_GB', 100))
+# Objects used this recently are never evicted: a running job may still read
+# them through a symlink
+EVICTION_GRACE_SECONDS = 24 * 3600
+
+
+def reference_files(ref_path, chromlist):
+    """Yield existing reference file paths for the chromosome list"""
+    chroms = [c.strip() for c in chromlist.split(',') if c.strip()]
+    for chrom in chroms:
+        vcf = os.path.join(ref_path, f"homo_sapiens-chr{chrom}.vcf.gz")
+        # The index is staged after its VCF so it never looks older than the data
+        for path in (vcf, vcf + '.tbi', os.path.join(ref_path, f"homo_sapiens-chr{chrom}.parquet")):
+            if os.path.isfile(path):
+                yield path
+
+
+def container_runtime_available():
+    return bool(shutil.which('singularity') or shutil.which('apptainer'))
+
+
+def try_hardlink(src, dst):
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        return False
+
+
+def cached_object(src, cache_dir):
+    """Return the cache path holding src's content, copying it in on a miss.
+
+    Objects live under objects/<md5>/<name>. A small key file per
+    (real path, size, mtime) remembers the digest, so a hit costs one stat.
+    """
+    real = os.path.realpath(src)
+    st = os.stat(real)
+    key = hashlib.sha1(f"{real}\0{st.st_size}\0{st.st_mtime_ns}".encode()).hexdigest()
+    key_file = os.path.join(cache_dir, 'keys', key)
+    name = os.path.basename(src)
+
+    if os.path.isfile(key_file):
+        with open(key_file) as f:
+            md5 = f.read().strip()
+        obj = os.path.join(cache_dir, 'objects', md5, name)
+        if os.path.isfile(obj) and os.path.getsize(obj) == st.st_size:
+            _touch(os.path.dirname(obj))
+            return obj, True
+
+    # Miss: copy while hashing, then publish atomically so concurrent jobs
+    # on the same node never see a partial object
+    tmp_dir = os.path.join(cache_dir, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp = os.path.join(tmp_dir, f"{key}.{os.getpid()}")
+    with open(real, 'rb') as f_in:
+        md5 = copy_with_md5(f_in, tmp)
+    shutil.copystat(real, tmp)
+    obj_dir = os.path.join(cache_dir, 'objects', md5)
+    os.makedirs(obj_dir, exist_ok=True)
+    obj = os.path.join(obj_dir, name)
+    os.replace(tmp, obj)
+    _touch(obj_dir)
+
+    os.makedirs(os.path.dirname(key_file), exist_ok=True)
+    tmp_key = f"{key_file}.{os.getpid()}"
+    with open(tmp_key, 'w') as f:
+        f.write(md5)
+    os.replace(tmp_key, key_file)
+    return obj, False
+
+
+def _touch(path):
+    """Mark a cache object directory as just used (its mtime is the LRU clock)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_cache(cache_dir, max_gb=None):
+    """
+    Remove least recently used objects until the cache fits in max_gb.
+    Objects used within EVICTION_GRACE_SECONDS are kept even above the cap.
+    Returns the number of objects evicted.
+    """
+    max_bytes = int((DEFAULT_CACHE_MAX_GB if max_gb is None else max_gb) * 1024 ** 3)
+    objects_dir = os.path.join(cache_dir, 'objects')
+    try:
+        entries = list(os.scandir(objects_dir))
+    except OSError:
+        return 0
+    objects = []
+    for entry in entries:
+        try:
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            objects.append((entry.stat().st_mtime, size, entry.path))
+        except OSError:
+            continue  # removed by another job meanwhile
+    total = sum(size for _, size, _ in objects)
+    evicted = 0
+    cutoff = time.time() - EVICTION_GRACE_SECONDS
+    for last_used, size, path in sorted(objects):
+        if total <= max_bytes or last_used > cutoff:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        evicted += 1
+    if evicted:
+        print(f"Reference cache: evicted {evicted} object(s), {total / 1024 ** 3:.1f} GB left in {cache_dir}")
+    return evicted
+
+
+def stage_reference_files(ref_path, chromlist, local_ref='local_reference', mode='auto', cache_dir=None,
+                          cache_max_gb=None):
+    """
+    Make the reference files visible under local_ref.
+    Returns (absolute local_ref, directories that must be bind-mounted into the container).
+    """
+    if mode not in STAGING_MODES:
+        raise ValueError(f"Unknown staging mode: {mode}")
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    can_bind = container_runtime_available()
+    print(f"Staging reference files for chromosomes: {chromlist} (mode: {mode})")
+
+    if os.path.isdir(local_ref):
+        shutil.rmtree(local_ref)
+    os.makedirs(local_ref)
+    bind_paths = set()
+    used_cache = False
+
+    for src in reference_files(ref_path, chromlist):
+        dst = os.path.join(local_ref, os.path.basename(src))
+        real = os.path.realpath(src)
+
+        if mode == 'copy':
+            shutil.copy2(src, dst)
+            print(f"✓ Copied: {dst}")
+            continue
+
+        if mode in ('auto', 'hardlink') and try_hardlink(real, dst):
+            print(f"✓ Hardlinked: {dst}")
+            continue
+
+        if mode == 'bind' or (mode == 'auto' and can_bind):
+            os.symlink(real, dst)
+            bind_paths.add(os.path.dirname(real))
+            print(f"✓ Symlinked (bind-mounted): {dst}")
+            continue
+
+        # hardlink failed or no container binds: go through the node cache
+        try:
+            obj, hit = cached_object(src, cache_dir)
+        except OSError as e:
+            print(f"Warning: reference cache unavailable ({e}), copying {src}")
+            shutil.copy2(src, dst)
+            print(f"✓ Copied: {dst}")
+            continue
+        used_cache = True
+        state = 'cache hit' if hit else 'cached'
+        if try_hardlink(obj, dst):
+            print(f"✓ Hardlinked from cache ({state}): {dst}")
+        else:
+            # Never a second copy: link to the cached object, bind-mounting the
+            # cache when a runtime that takes binds is available
+            os.symlink(os.path.realpath(obj), dst)
+            if can_bind:
+                bind_paths.add(os.path.realpath(cache_dir))
+            print(f"✓ Symlinked from cache ({state}): {dst}")
+
+    if used_cache:
+        evict_cache(cache_dir, cache_max_gb)
+    return os.path.abspath(local_ref), sorted(bind_paths)
+
+
+def write_bind_config(bind_paths, config_path='reference_binds.config'):
+    """
+    Nextflow config that bind-mounts bind_paths into singularity containers,
+    appended to any runOptions the pipeline or user config already sets
+    """
+    binds = ','.join(f"{p}:{p}" for p in bind_paths)
+    with open(config_path, 'w') as f:
+        f.write(f"singularity.runOptions = \"${{singularity.runOptions ?: ''}} -B {binds}\"\n")
+    return os.path.abspath(config_path)
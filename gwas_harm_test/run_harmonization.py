@@ -747,8 +747,11 @@ import shutil
 import gzip
 import glob
 
+from hashing_writer import copy_with_md5, file_md5
+from reference_staging import STAGING_MODES, stage_reference_files, write_bind_config
+
 def decompress_file(input_path, original_name):
-    """Decompress file if needed and return path to working file"""
+    """Decompress file if needed and return path to working file and its MD5 (None if not decompressed)"""
     print(f"Checking if file is compressed: {input_path}")
     
     # Check if file is compressed by reading first few bytes
@@ -758,7 +761,7 @@ def decompress_file(input_path, original_name):
             is_compressed = (magic_number == b'\x1f\x8b')  # gzip magic number
     except Exception as e:
         print(f"ERROR: Could not read file {input_path}: {e}")
-        return input_path, False
+        return input_path, False, None
     
     if is_compressed:
         print(f"File is compressed (gzip), decompressing...")
@@ -768,23 +771,24 @@ def decompress_file(input_path, original_name):
         
         try:
             with gzip.open(input_path, 'rb') as f_in:
-                with open(uncompressed_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+                md5 = copy_with_md5(f_in, uncompressed_path)
             
             print(f"Successfully decompressed to: {uncompressed_path}")
             # Verify the decompressed file
             file_size = os.path.getsize(uncompressed_path)
             print(f"Decompressed file size: {file_size} bytes")
-            return uncompressed_path, True
+            return uncompressed_path, True, md5
         except Exception as e:
             print(f"ERROR: Failed to decompress file: {e}")
-            return input_path, False
+            return input_path, False, None
     else:
         print(f"File is not compressed, using as-is")
-        return input_path, False
+        return input_path, False, None
 
-def create_metadata_file(input_path, build_num):
+def create_metadata_file(input_path, build_num, md5=None):
     """Create required metadata file"""
+    if md5 is None:
+        md5 = file_md5(input_path)
     metadata_path = input_path + '-meta.yaml'
     
     print(f"Creating metadata file: {metadata_path}")
@@ -799,7 +803,7 @@ coordinate_system: 1-based
 # Summary Statistic information
 data_file_name: {os.path.basename(input_path)}
 file_type: GWAS-SSF v0.1
-data_file_md5sum: placeholder_md5
+data_file_md5sum: {md5}
 
 # Harmonization status
 is_harmonised: false
@@ -807,43 +811,6 @@ is_sorted: false
 """)
     return metadata_path
 
-def copy_reference_files_locally(ref_path, chromlist):
-    """Copy reference files to local directory for container access"""
-    print(f"Copying reference files for chromosomes: {chromlist}")
-    
-    # Create local reference directory
-    local_ref = "local_reference"
-    os.makedirs(local_ref, exist_ok=True)
-    
-    # Parse chromosome list
-    chroms = [c.strip() for c in chromlist.split(',') if c.strip()]
-    
-    for chrom in chroms:
-        if chrom:  # Skip empty strings
-            # Copy VCF file
-            vcf_src = os.path.join(ref_path, f"homo_sapiens-chr{chrom}.vcf.gz")
-            vcf_dst = os.path.join(local_ref, f"homo_sapiens-chr{chrom}.vcf.gz")
-            
-            if os.path.isfile(vcf_src):
-                shutil.copy2(vcf_src, vcf_dst)
-                print(f"✓ Copied VCF: {vcf_dst}")
-            
-            # Copy TBI file
-            tbi_src = vcf_src + '.tbi'
-            tbi_dst = vcf_dst + '.tbi'
-            if os.path.isfile(tbi_src):
-                shutil.copy2(tbi_src, tbi_dst)
-                print(f"✓ Copied TBI: {tbi_dst}")
-            
-            # Copy parquet file
-            parquet_src = os.path.join(ref_path, f"homo_sapiens-chr{chrom}.parquet")
-            parquet_dst = os.path.join(local_ref, f"homo_sapiens-chr{chrom}.parquet")
-            if os.path.isfile(parquet_src):
-                shutil.copy2(parquet_src, parquet_dst)
-                print(f"✓ Copied parquet: {parquet_dst}")
-    
-    return os.path.abspath(local_ref)
-
 def find_harmonized_output():
     """Find harmonized output files - look in current directory structure"""
     print("Searching for harmonized output in current directory...")
@@ -899,6 +866,12 @@ def main():
     parser.add_argument('--threshold', required=True, help='Palindromic threshold')
     parser.add_argument('--chromlist', required=True, help='Chromosome list')
     parser.add_argument('--output', required=True, help='Output harmonized file')
+    parser.add_argument('--ref_staging', default='auto', choices=STAGING_MODES,
+                        help='How to make reference files available to the container')
+    parser.add_argument('--ref_cache_dir', default=None,
+                        help='Persistent node-local reference cache (default: $GWAS_REF_CACHE or ~/.cache/gwas_harmonizer/references)')
+    parser.add_argument('--ref_cache_max_gb', type=float, default=None,
+                        help='Size cap of the reference cache; least recently used files are evicted (default: $GWAS_REF_CACHE_MAX_GB or 100)')
     
     args = parser.parse_args()
     
@@ -929,19 +902,23 @@ def main():
         print(f"ERROR: Input file not found: {args.input}")
         sys.exit(1)
     
-    # Copy reference files locally to ensure container access
+    # Stage reference files locally to ensure container access
     print("\n=== Preparing reference files for container ===")
-    local_ref_path = copy_reference_files_locally(args.ref_path, args.chromlist)
+    local_ref_path, bind_paths = stage_reference_files(
+        args.ref_path, args.chromlist, mode=args.ref_staging, cache_dir=args.ref_cache_dir,
+        cache_max_gb=args.ref_cache_max_gb)
     print(f"Using local reference directory: {local_ref_path}")
     
     # Handle file decompression - use original filename to maintain consistency
     print("\n=== Checking file compression ===")
-    working_input, temp_file_created = decompress_file(args.input, original_filename)
+    working_input, temp_file_created, md5 = decompress_file(args.input, original_filename)
     
     if temp_file_created:
         print(f"Using decompressed file: {working_input}")
     else:
         print(f"Using original file: {working_input}")
+        # Not rewritten by us, so hash it in blocks
+        md5 = file_md5(working_input)
     
     # Create metadata file
     print("\n=== Creating metadata ===")
@@ -957,7 +934,7 @@ coordinate_system: 1-based
 # Summary Statistic information
 data_file_name: {working_input}
 file_type: GWAS-SSF v0.1
-data_file_md5sum: placeholder_md5
+data_file_md5sum: {md5}
 
 # Harmonization status
 is_harmonised: false
@@ -983,6 +960,9 @@ is_sorted: false
         '-resume',
         '--outdir', output_dir
     ]
+    if bind_paths:
+        cmd += ['-c', write_bind_config(bind_paths)]
+        print(f"Bind-mounting reference directories: {', '.join(bind_paths)}")
     
     print("\n=== Running Nextflow ===")
     print("Command:", ' '.join(cmd))
@@ -251,102 +251,191 @@
 #!/usr/bin/env python3
 import sys
 import os
+import gzip
+import shutil
 import argparse
 import subprocess
 from datetime import datetime
-import hashlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from bgzf import BgzfWriter, TabixIndexBuilder
+from hashing_writer import HashingWriter, file_md5
+
+SSF_HEADER = "chromosome\tbase_pair_location\teffect_allele\tother_allele\tbeta\tstandard_error\tp_value\teffect_allele_frequency\trsid\n"
+SKIPPED_CHROMOSOMES = ['X', 'Y', 'MT', '23', '24', '26']
 
 def main():
-    parser = argparse.ArgumentParser(description='Convert GWAS summary statistics to SSF format using Bash/AWK logic')
+    parser = argparse.ArgumentParser(description='Convert GWAS summary statistics to SSF format')
     parser.add_argument('--input', required=True, help='Input GWAS file')
     parser.add_argument('--build', required=True, choices=['GRCh37', 'GRCh38'], help='Genome build')
     parser.add_argument('--coord', required=True, choices=['1-based', '0-based'], help='Coordinate system')
     parser.add_argument('--output_ssf', required=True, help='Output SSF file')
     parser.add_argument('--output_yaml', required=True, help='Output YAML file')
     parser.add_argument('--output_chromosomes', required=True, help='Output chromosome list')
+    parser.add_argument('--threads', type=int, default=1, help='Threads for decompression, parsing and compression')
     args = parser.parse_args()
 
-    # Convert GWAS → SSF using Bash/AWK
-    run_bash_gwas_to_ssf(args.input, args.output_ssf)
-
-    # Compress and create tabix index
-    compress_output(args.output_ssf, args.output_ssf)
+    # Convert GWAS → bgzipped, tabix-indexed SSF in a single pass
+    try:
+        md5_hash, chromosomes = convert_gwas_to_ssf(args.input, args.output_ssf, args.threads)
+    except Exception as e:
+        sys.stderr.write(f"ERROR: Failed to process file: {str(e)}\n")
+        sys.exit(1)
 
     # Create YAML metadata
-    create_yaml_metadata(args.output_ssf, args.build, args.coord, args.output_yaml)
+    create_yaml_metadata(args.output_ssf, args.build, args.coord, args.output_yaml, md5_hash)
 
     # Create chromosome list
-    create_chromosome_list_from_ssf(args.output_ssf, args.output_chromosomes)
-
-
-def run_bash_gwas_to_ssf(input_file, output_file):
-    """Use Bash/AWK to convert GWAS summary stats to SSF (matches harmonizer.sh behavior)"""
-    input_file = os.path.abspath(input_file)
-    output_file = os.path.abspath(output_file)
-
-    bash_script = f'''
-READER="cat"
-case "{input_file}" in *.gz|*.bgz) READER="bgzip -dc";; esac
-
-$READER "{input_file}" | awk -v OFS="\\t" '
-BEGIN {{
-    print "chromosome\\tbase_pair_location\\teffect_allele\\tother_allele\\tbeta\\tstandard_error\\tp_value\\teffect_allele_frequency\\trsid"
-}}
-NR==1 {{
-    for(i=1;i<=NF;i++) h[tolower($i)]=i
-    is_neale = h["variant"] && (h["beta"]||h["or"]) && (h["se"]||h["stderr"]||h["standard_error"]) && (h["pval"]||h["p"])
-    is_plink = ((h["chr"]||h["chrom"]) && (h["bp"]||h["pos"]) && h["a1"] && h["a2"] && (h["beta"]||h["or"]) && (h["se"]||h["stderr"]||h["standard_error"]) && (h["p"]||h["pval"]))
-    if(!is_neale && !is_plink) {{ print "ERROR: unknown layout" > "/dev/stderr"; exit 2 }}
-    next
-}}
-{{
-    chrom=""; pos=""; ea=""; oa=""; beta=""; se=""; p=""; eaf=""; rsid=""
-
-    if(is_neale){{
-        split($h["variant"], v, ":"); chrom=v[1]; pos=v[2]; oa=v[3]; ea=v[4]
-        if(h["beta"]) beta=$h["beta"]
-        if(h["se"]) se=$h["se"]; else if(h["stderr"]) se=$h["stderr"]; else if(h["standard_error"]) se=$h["standard_error"]
-        if(h["pval"]) p=$h["pval"]; else if(h["p"]) p=$h["p"]
-        if(h["af"]) eaf=$h["af"]; else if(h["minor_af"]) eaf=$h["minor_af"]; else if(h["effect_allele_frequency"]) eaf=$h["effect_allele_frequency"]
-        if(h["rsid"]) rsid=$h["rsid"]; else if(h["snp"]) rsid=$h["snp"]
-    }} else {{
-        chrom = (h["chr"]? $h["chr"] : $h["chrom"])
-        pos   = (h["bp"]?  $h["bp"]  : $h["pos"])
-        ea    = $h["a1"]; oa=$h["a2"]
-        if(h["beta"]) beta=$h["beta"]
-        if(h["se"]) se=$h["se"]; else if(h["stderr"]) se=$h["stderr"]; else if(h["standard_error"]) se=$h["standard_error"]
-        p     = (h["p"]? $h["p"] : $h["pval"])
-        if(h["a1_freq"]) eaf=$h["a1_freq"]; else if(h["frq"]) eaf=$h["frq"]; else if(h["effect_allele_frequency"]) eaf=$h["effect_allele_frequency"]
-        if(h["id"]) rsid=$h["id"]; else if(h["snp"]) rsid=$h["snp"]; else if(h["rsid"]) rsid=$h["rsid"]
-    }}
-
-    sub(/^chr/,"",chrom)
-    if(chrom=="23") chrom="X"; else if(chrom=="24") chrom="Y"; else if(chrom=="26") chrom="MT"
-    if (chrom=="X" || chrom=="Y" || chrom=="MT") next
-    if(eaf=="") eaf="NA"; if(rsid=="") rsid="NA"
-    print chrom, pos, toupper(ea), toupper(oa), beta, se, p, eaf, rsid
-}}
-' > "{output_file}"
-'''
-    subprocess.run(bash_script, shell=True, check=True, executable='/bin/bash')
-
-
-def compress_output(input_tsv, output_gz):
-    """Compress TSV and create tabix index"""
-    subprocess.run(['bgzip', '-f', input_tsv], check=True)
-    temp_gz = input_tsv + '.gz'
-    if os.path.exists(temp_gz):
-        os.rename(temp_gz, output_gz)
+    create_chromosome_list(chromosomes, args.output_chromosomes)
+
+
+def open_input(input_file, threads):
+    """Open the input as a binary stream, decompressing gzip/bgzip with bgzip -@ when available"""
+    with open(input_file, 'rb') as f:
+        is_compressed = f.read(2) == b'\x1f\x8b'
+    if not is_compressed:
+        return open(input_file, 'rb'), None
+    if shutil.which('bgzip'):
+        proc = subprocess.Popen(['bgzip', '-dc', '-@', str(threads), input_file], stdout=subprocess.PIPE)
+        return proc.stdout, proc
+    return gzip.open(input_file, 'rb'), None
+
+
+def detect_layout(header):
+    """Return (is_neale, column index by lowercase name), matching harmonizer.sh"""
+    h = {name.lower(): i for i, name in enumerate(header)}
+    has_effect = 'beta' in h or 'or' in h
+    has_se = 'se' in h or 'stderr' in h or 'standard_error' in h
+    is_neale = 'variant' in h and has_effect and has_se and ('pval' in h or 'p' in h)
+    is_plink = (('chr' in h or 'chrom' in h) and ('bp' in h or 'pos' in h) and 'a1' in h and 'a2' in h
+                and has_effect and has_se and ('p' in h or 'pval' in h))
+    if not is_neale and not is_plink:
+        raise ValueError(f"unknown layout - cannot detect Neale or PLINK format (columns: {', '.join(h)})")
+    return is_neale, h
+
+
+def first_present(batch, h, names):
+    """Column for the first name present in the header, or an empty string"""
+    for name in names:
+        if name in h:
+            return batch.column(h[name])
+    return pa.scalar('')
+
+
+def batch_to_ssf(batch, is_neale, h):
+    """Vectorized GWAS → SSF columns for one record batch"""
+    if is_neale:
+        # Pad so missing ':' fields come back empty, like awk's split()
+        parts = pc.split_pattern(pc.binary_join_element_wise(batch.column(h['variant']), ':::', ''), ':')
+        chrom, pos, oa, ea = (pc.list_element(parts, i) for i in range(4))
+        beta = first_present(batch, h, ['beta'])
+        se = first_present(batch, h, ['se', 'stderr', 'standard_error'])
+        p = first_present(batch, h, ['pval', 'p'])
+        eaf = first_present(batch, h, ['af', 'minor_af', 'effect_allele_frequency'])
+        rsid = first_present(batch, h, ['rsid', 'snp'])
+    else:
+        chrom = first_present(batch, h, ['chr', 'chrom'])
+        pos = first_present(batch, h, ['bp', 'pos'])
+        ea = batch.column(h['a1'])
+        oa = batch.column(h['a2'])
+        beta = first_present(batch, h, ['beta'])
+        se = first_present(batch, h, ['se', 'stderr', 'standard_error'])
+        p = first_present(batch, h, ['p', 'pval'])
+        eaf = first_present(batch, h, ['a1_freq', 'frq', 'effect_allele_frequency'])
+        rsid = first_present(batch, h, ['id', 'snp', 'rsid'])
+
+    chrom = pc.replace_substring_regex(chrom, '^chr', '', max_replacements=1)
+    keep = pc.invert(pc.is_in(chrom, value_set=pa.array(SKIPPED_CHROMOSOMES)))
+    if isinstance(eaf, pa.Scalar):
+        eaf = pa.scalar('NA')
+    else:
+        eaf = pc.if_else(pc.equal(eaf, ''), 'NA', eaf)
+    if isinstance(rsid, pa.Scalar):
+        rsid = pa.scalar('NA')
+    else:
+        rsid = pc.if_else(pc.equal(rsid, ''), 'NA', rsid)
+
+    columns = [chrom, pos, pc.utf8_upper(ea), pc.utf8_upper(oa), beta, se, p, eaf, rsid]
+    columns = [c if isinstance(c, pa.Scalar) else pc.filter(c, keep) for c in columns]
+    lines = pc.binary_join_element_wise(*columns, '\t')
+    return columns[0], columns[1], pc.binary_join_element_wise(lines, '\n', '')
+
+
+def line_buffer(lines):
+    """Concatenated bytes and line boundary offsets (n + 1) of a string array"""
+    lines = lines.combine_chunks() if isinstance(lines, pa.ChunkedArray) else lines
+    offset_type = np.int64 if pa.types.is_large_string(lines.type) else np.int32
+    offsets = np.frombuffer(lines.buffers()[1], dtype=offset_type)[lines.offset:lines.offset + len(lines) + 1]
+    data = lines.buffers()[2]
+    if data is None:
+        return b'', offsets.astype(np.int64)
+    return data.to_pybytes()[offsets[0]:offsets[-1]], (offsets - offsets[0]).astype(np.int64)
+
+
+def convert_gwas_to_ssf(input_file, output_file, threads=1):
+    """
+    Convert GWAS summary stats to SSF (matches harmonizer.sh behavior) in one
+    pass over the input: the bgzipped output, its tabix index, its MD5 and
+    the set of chromosomes are all produced while streaming.
+    """
+    stream, proc = open_input(input_file, threads)
     try:
-        subprocess.run(['tabix', '-c', 'N', '-S', '1', '-s', '1', '-b', '2', '-e', '2', output_gz],
-                       check=True, stderr=subprocess.DEVNULL)
-    except:
-        pass
-
-
-def create_yaml_metadata(ssf_file, build, coord, yaml_file):
-    with open(ssf_file, 'rb') as f:
-        md5_hash = hashlib.md5(f.read()).hexdigest()
+        header = stream.readline().decode().rstrip('\r\n').split('\t')
+        is_neale, h = detect_layout(header)
+        print(f"Detected format: {'Neale' if is_neale else 'PLINK'}")
+
+        names = [f'c{i}' for i in range(len(header))]
+        reader = pacsv.open_csv(
+            stream,
+            read_options=pacsv.ReadOptions(column_names=names, block_size=16 << 20, use_threads=threads > 1),
+            parse_options=pacsv.ParseOptions(delimiter='\t', quote_char=False),
+            convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names}),
+        )
+
+        index = TabixIndexBuilder()
+        chromosomes = set()
+        line_count = 0
+        with HashingWriter(output_file, 'wb') as sink:
+            bgzf = BgzfWriter(sink, threads=threads)
+            bgzf.write(SSF_HEADER.encode())
+            for batch in reader:
+                chrom, pos, lines = batch_to_ssf(batch, is_neale, h)
+                data, offsets = line_buffer(lines)
+                base = bgzf.uncompressed_size
+                bgzf.write(data)
+
+                chromosomes.update(pc.unique(chrom).to_pylist())
+                line_count += len(lines)
+                if index.valid and len(lines):
+                    # tabix skips lines starting with the meta char 'N'
+                    indexed = pc.invert(pc.starts_with(chrom, 'N')).to_numpy(zero_copy_only=False)
+                    try:
+                        positions = pc.cast(pos, pa.int64()).to_numpy()
+                    except (pa.ArrowInvalid, pa.ArrowTypeError):
+                        index.invalidate("non-numeric base_pair_location")
+                        continue
+                    offsets = offsets + base
+                    index.add(chrom.to_numpy(zero_copy_only=False)[indexed], positions[indexed],
+                              offsets[:-1][indexed], offsets[1:][indexed])
+            bgzf.close()
+    finally:
+        stream.close()
+        if proc is not None and proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+    print(f"Processed {line_count} variants")
+    if index.valid:
+        index.write(output_file + '.tbi', bgzf.virtual_offsets)
+    return sink.hexdigest(), chromosomes
+
+
+def create_yaml_metadata(ssf_file, build, coord, yaml_file, md5_hash=None):
+    if md5_hash is None:
+        md5_hash = file_md5(ssf_file)
     build_num = '37' if build == 'GRCh37' else '38'
     with open(yaml_file, 'w') as f:
         f.write(f"""# Study meta-data
@@ -367,16 +456,10 @@ is_sorted: false
 """)
 
 
-def create_chromosome_list_from_ssf(ssf_file, output_file):
-    """Generate ordered chromosome list from SSF"""
-    reader = "cat"
-    if ssf_file.endswith(('.gz', '.bgz')):
-        reader = "bgzip -dc"
-    cmd = f'{reader} "{ssf_file}" | awk -F"\\t" \'NR>1{{print $1}}\' | sort -u'
-    result = subprocess.run(cmd, shell=True, check=True, capture_output=True, text=True)
-    present = result.stdout.strip().splitlines()
+def create_chromosome_list(chromosomes_found, output_file):
+    """Create ordered chromosome list"""
     order = ['1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16','17','18','19','20','21','22']
-    have = [ch for ch in order if ch in present]
+    have = [ch for ch in order if ch in chromosomes_found]
     if not have:
         have = order
     with open(output_file, 'w') as f:
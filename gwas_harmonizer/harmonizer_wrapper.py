@@ -1,5 +1,3 @@
-<<<<<<< HEAD
-=======
 # #!/usr/bin/env python3
 # import os
 # import sys
@@ -1581,7 +1579,6 @@
 
 
 
->>>>>>> be076ce9b6ce3c3e056304b37d89147b32711e88
 #!/usr/bin/env python3
 import os
 import sys
@@ -1592,14 +1589,12 @@ from pathlib import Path
 import datetime
 import hashlib
 import yaml
-<<<<<<< HEAD
-import importlib
-=======
 # importlib is no longer needed
->>>>>>> be076ce9b6ce3c3e056304b37d89147b32711e88
 import pandas as pd
 import tempfile
 
+from hashing_writer import HashingWriter
+
 def main():
     parser = argparse.ArgumentParser(description='GWAS Harmonizer Wrapper')
     parser.add_argument('--code-repo', required=True, help='Path to harmonizer code repository')
@@ -1609,22 +1604,11 @@ def main():
     parser.add_argument('--genome-assembly', default='GRCh38', help='Genome assembly (if no meta file)')
     parser.add_argument('--coordinate-system', default='1-based', help='Coordinate system (if no meta file)')
     parser.add_argument('--output-dir', default='harmonized_output', help='Output directory for results')
+    parser.add_argument('--chunk-size', type=int, default=0, help='Rows per chunk for streaming preprocessing (0 loads the whole file)')
     
     args = parser.parse_args()
     
     args.output_dir = os.path.abspath(args.output_dir)
-<<<<<<< HEAD
-    args.ref_dir = os.path.abspath(args.ref_dir)
-    args.code_repo = os.path.abspath(args.code_repo)
-    
-    # Install missing packages inside virtualenv
-    packages = [
-        ('duckdb', '1.1.1'),
-        ('pyarrow', '15.0.1'),
-        ('pyliftover', '0.4'),
-        ('pandas', '2.2.3'),
-        ('gwas-sumstats-tools', '1.2.0')
-=======
     
     args.ref_dir = os.path.abspath(args.ref_dir)
     if not os.path.isdir(args.ref_dir):
@@ -1670,77 +1654,87 @@ def main():
         run_harmonizer(args, env)
 
 
-def run_harmonizer(args, env):
+# The harmonizer needs 'p_value', not 'pval'.
+STANDARD_HEADERS = ['variant', 'minor_allele', 'minor_af', 'low_confidence_variant', 'n_complete_samples', 'ac', 'ytx', 'beta', 'se', 'tstat', 'p_value']
+
+COLUMN_MAP = {
+    'chr': 'chromosome', 'chrom': 'chromosome', 'chrm': 'chromosome',
+    'pos': 'base_pair_location', 'bp': 'base_pair_location', 'position': 'base_pair_location', 'base_pair': 'base_pair_location',
+    'ea': 'effect_allele', 'a1': 'effect_allele', 'effect': 'effect_allele', 'alt': 'effect_allele',
+    'oa': 'other_allele', 'a2': 'other_allele', 'other': 'other_allele', 'ref': 'other_allele',
+    'snp': 'variant_id', 'rsid': 'rsid', 'id': 'variant_id', 'marker': 'variant_id', 'markername': 'variant_id',
+    'variant': 'variant_id'
+}
+
+
+def detect_header_row(path):
     """
-    Contains the main execution logic for Nextflow.
+    Returns the row index to use as header (1 for generic 'Column X' headers).
     """
-    
-    # Create output directory
-    os.makedirs(args.output_dir, exist_ok=True)
-    
-    # Set up work directory for inputs
-    work_dir = os.path.join(args.output_dir, 'input')
-    os.makedirs(work_dir, exist_ok=True)
-    
-    # Copy data file to work_dir with standard name
-    data_base = 'input.tsv'
-    data_target = os.path.join(work_dir, data_base)
-    shutil.copy2(args.data_file, data_target)
-    
-    # --- Data Preprocessing (with 'p_value' fix) ---
-    
-    header_to_use = 0
     try:
-        with open(data_target, 'r') as f:
+        with open(path, 'r') as f:
             first_line = f.readline().strip()
         first_line_lower = first_line.lower()
         if first_line_lower.startswith('column 1\t') or first_line_lower.startswith('column 1 '):
             print("Detected generic 'Column X' header. Using second row as header.")
-            header_to_use = 1 # Use second row (index 1)
-        else:
-            print("Using first row as header.")
+            return 1 # Use second row (index 1)
+        print("Using first row as header.")
+        return 0
     except Exception as e:
         sys.exit(f"Error reading header: {e}")
 
-    try:
-        df = pd.read_csv(data_target, sep='\t', header=header_to_use, dtype=str)
-        df.columns = df.columns.str.strip().str.lower()
-        
-        # --- THIS IS BUG FIX #1 ---
-        # If the header is "variant...pval", this renames it to "p_value"
-        if 'pval' in df.columns and 'p_value' not in df.columns:
+
+def standardize_columns(df, verbose=True):
+    """
+    Lowercases the header and renames known aliases to harmonizer column names.
+    """
+    df.columns = df.columns.str.strip().str.lower()
+
+    # --- THIS IS BUG FIX #1 ---
+    # If the header is "variant...pval", this renames it to "p_value"
+    if 'pval' in df.columns and 'p_value' not in df.columns:
+        if verbose:
             print("Renaming 'pval' to 'p_value'.")
-            df.rename(columns={'pval': 'p_value'}, inplace=True)
+        df.rename(columns={'pval': 'p_value'}, inplace=True)
 
-        # --- THIS IS BUG FIX #2 ---
-        # If the header *was* "Column 1...", this renames it correctly.
-        if 'column 1' in df.columns:
+    # --- THIS IS BUG FIX #2 ---
+    # If the header *was* "Column 1...", this renames it correctly.
+    if 'column 1' in df.columns:
+        if verbose:
             print("Renaming 'Column X' headers...")
-            
-            # The harmonizer needs 'p_value', not 'pval'.
-            standard_headers = ['variant', 'minor_allele', 'minor_af', 'low_confidence_variant', 'n_complete_samples', 'ac', 'ytx', 'beta', 'se', 'tstat', 'p_value']
 
-            if len(df.columns) <= len(standard_headers):
-                rename_map = {f'column {i+1}': standard_headers[i] for i in range(len(df.columns))}
-                df.rename(columns=rename_map, inplace=True)
-            else:
-                 print(f"Warning: File has {len(df.columns)} columns, but standard_headers has {len(standard_headers)}. Renaming first {len(standard_headers)}.")
-                 rename_map = {f'column {i+1}': standard_headers[i] for i in range(len(standard_headers))}
-                 df.rename(columns=rename_map, inplace=True)
-        # --- END OF BUG FIXES ---
+        if len(df.columns) <= len(STANDARD_HEADERS):
+            rename_map = {f'column {i+1}': STANDARD_HEADERS[i] for i in range(len(df.columns))}
+            df.rename(columns=rename_map, inplace=True)
+        else:
+             if verbose:
+                 print(f"Warning: File has {len(df.columns)} columns, but standard_headers has {len(STANDARD_HEADERS)}. Renaming first {len(STANDARD_HEADERS)}.")
+             rename_map = {f'column {i+1}': STANDARD_HEADERS[i] for i in range(len(STANDARD_HEADERS))}
+             df.rename(columns=rename_map, inplace=True)
+    # --- END OF BUG FIXES ---
 
-        
-        column_map = {
-            'chr': 'chromosome', 'chrom': 'chromosome', 'chrm': 'chromosome',
-            'pos': 'base_pair_location', 'bp': 'base_pair_location', 'position': 'base_pair_location', 'base_pair': 'base_pair_location',
-            'ea': 'effect_allele', 'a1': 'effect_allele', 'effect': 'effect_allele', 'alt': 'effect_allele',
-            'oa': 'other_allele', 'a2': 'other_allele', 'other': 'other_allele', 'ref': 'other_allele',
-            'snp': 'variant_id', 'rsid': 'rsid', 'id': 'variant_id', 'marker': 'variant_id', 'markername': 'variant_id',
-            'variant': 'variant_id'
-        }
-        df.rename(columns=column_map, inplace=True)
+    df.rename(columns=COLUMN_MAP, inplace=True)
+
+
+def needs_variant_parsing(columns):
+    return 'chromosome' not in columns and 'base_pair_location' not in columns and 'variant_id' in columns
+
+
+def preprocess_in_memory(source, data_target):
+    """
+    Loads the whole input with pandas, standardizes it and writes data_target.
+    Returns the MD5 of the written file.
+    """
+    # Copy data file to work_dir with standard name
+    shutil.copy2(source, data_target)
+
+    header_to_use = detect_header_row(data_target)
+
+    try:
+        df = pd.read_csv(data_target, sep='\t', header=header_to_use, dtype=str)
+        standardize_columns(df)
 
-        if 'chromosome' not in df.columns and 'base_pair_location' not in df.columns and 'variant_id' in df.columns:
+        if needs_variant_parsing(df.columns):
             print("Parsing 'variant_id' column to find chr, pos, ref, alt.")
             try:
                 parsed = df['variant_id'].str.split(':', expand=True)
@@ -1765,18 +1759,124 @@ def run_harmonizer(args, env):
              if dropped_rows > 0:
                   print(f"Dropped {dropped_rows} rows with missing chromosome or position.")
         
-        df.to_csv(data_target, sep='\t', index=False, na_rep="NA")
+        with HashingWriter(data_target) as out:
+            df.to_csv(out, sep='\t', index=False, na_rep="NA")
         print(f"Successfully preprocessed input file and saved to {data_target}")
+        return out.hexdigest()
 
     except Exception as e:
         print(f"Error during pandas processing: {e}", file=sys.stderr)
         sys.exit(1)
-    # --- END OF DATA PREPROCESSING ---
 
-    # Compute MD5
-    with open(data_target, 'rb') as f:
-        md5 = hashlib.md5(f.read()).hexdigest()
+
+def preprocess_streaming(source, data_target, header_to_use, chunk_size):
+    """
+    Chunked version of the in-memory preprocessing above. Memory stays bounded
+    by chunk_size and the output is byte-identical to the whole-frame path.
+
+    The whole-frame path decides two things from the complete variant_id
+    column: how many ':' fields were split out, and whether the parsed
+    position became float (any unparseable value). Both can only widen, so
+    we start from the narrowest guess and rewrite the output if a later chunk
+    disagrees with what was already written. In practice the first chunk
+    settles both and the file is read once.
+
+    Returns the MD5 of the written file, computed as it is written.
+    """
+    parsed_width = 0
+    pos_as_float = False
+    first_attempt = True
+
+    while True:
+        restart = False
+        dropped_rows = 0
+        reader = pd.read_csv(source, sep='\t', header=header_to_use, dtype=str, chunksize=chunk_size)
+        with reader, HashingWriter(data_target) as out:
+            for i, chunk in enumerate(reader):
+                standardize_columns(chunk, verbose=first_attempt and i == 0)
+
+                if needs_variant_parsing(chunk.columns):
+                    if first_attempt and i == 0:
+                        print("Parsing 'variant_id' column to find chr, pos, ref, alt.")
+                    try:
+                        parsed = chunk['variant_id'].str.split(':', expand=True)
+                        width = 4 if parsed.shape[1] >= 4 else 2 if parsed.shape[1] >= 2 else 0
+                        if width > parsed_width:
+                            parsed_width = width
+                            if i > 0:
+                                restart = True
+                                break
+                        parsed = parsed.reindex(columns=range(max(parsed_width, parsed.shape[1])))
+                        if parsed_width >= 4:
+                            chunk['chromosome'] = parsed[0]
+                            chunk['base_pair_location'] = parsed[1]
+                            chunk['other_allele'] = parsed[2]
+                            chunk['effect_allele'] = parsed[3]
+                        elif parsed_width >= 2:
+                            chunk['chromosome'] = parsed[0]
+                            chunk['base_pair_location'] = parsed[1]
+
+                        if 'base_pair_location' in chunk.columns:
+                            positions = pd.to_numeric(chunk['base_pair_location'], errors='coerce')
+                            if positions.dtype.kind == 'f' and not pos_as_float:
+                                pos_as_float = True
+                                if i > 0:
+                                    restart = True
+                                    break
+                            if pos_as_float:
+                                positions = positions.astype('float64')
+                            chunk['base_pair_location'] = positions
+                    except Exception as e:
+                        if first_attempt and i == 0:
+                            print(f"Warning: Could not parse all variant_ids: {str(e)}")
+
+                if 'chromosome' in chunk.columns and 'base_pair_location' in chunk.columns:
+                    original_rows = len(chunk)
+                    chunk.dropna(subset=['chromosome', 'base_pair_location'], inplace=True)
+                    dropped_rows += original_rows - len(chunk)
+
+                chunk.to_csv(out, sep='\t', index=False, na_rep="NA", header=(i == 0))
+
+        if not restart:
+            break
+        first_attempt = False
+        print(f"Re-reading input with {parsed_width} parsed variant fields (float positions: {pos_as_float}).")
+
+    if dropped_rows > 0:
+        print(f"Dropped {dropped_rows} rows with missing chromosome or position.")
+    return out.hexdigest()
+
+
+def run_harmonizer(args, env):
+    """
+    Contains the main execution logic for Nextflow.
+    """
+    
+    # Create output directory
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    # Set up work directory for inputs
+    work_dir = os.path.join(args.output_dir, 'input')
+    os.makedirs(work_dir, exist_ok=True)
     
+    data_base = 'input.tsv'
+    data_target = os.path.join(work_dir, data_base)
+
+    # --- Data Preprocessing (with 'p_value' fix) ---
+
+    if args.chunk_size > 0:
+        # Streaming reads the input in place, so there is no need to copy it first
+        header_to_use = detect_header_row(args.data_file)
+        try:
+            md5 = preprocess_streaming(args.data_file, data_target, header_to_use, args.chunk_size)
+            print(f"Successfully preprocessed input file and saved to {data_target}")
+        except Exception as e:
+            print(f"Error during pandas processing: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        md5 = preprocess_in_memory(args.data_file, data_target)
+    # --- END OF DATA PREPROCESSING ---
+
     # Set up meta YAML
     meta_base = data_base + '-meta.yaml'
     meta_target = os.path.join(work_dir, meta_base)
@@ -1836,268 +1936,8 @@ def run_harmonizer(args, env):
         '-with-timeline', os.path.join(log_dir, 'harm-timeline.html'),
         '-with-trace', os.path.join(log_dir, 'harm-trace.txt'),
         '-with-dag', os.path.join(log_dir, 'harm-dag.html')
->>>>>>> be076ce9b6ce3c3e056304b37d89147b32711e88
     ]
-    for pkg, version in packages:
-        try:
-            importlib.import_module(pkg.replace('-', '_'))
-        except ImportError:
-            print(f"Installing {pkg}=={version}")
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', f"{pkg}=={version}"])
-    
-<<<<<<< HEAD
-    # Set environment
-    env = os.environ.copy()
-    env['PATH'] = f"{args.code_repo}:{env.get('PATH', '')}"
     
-    # Create temp bin directory and modify shebang for python scripts
-    original_bin = Path(args.code_repo) / 'bin'
-    if original_bin.exists():
-        with tempfile.TemporaryDirectory() as temp_bin_dir:
-            temp_bin = Path(temp_bin_dir)
-            shutil.copytree(original_bin, temp_bin / 'bin')
-            for py_file in (temp_bin / 'bin').rglob('*.py'):
-                with open(py_file, 'r') as f:
-                    lines = f.readlines()
-                if lines and lines[0].startswith('#!'):
-                    lines[0] = f"#!{sys.executable}\n"
-                    with open(py_file, 'w') as f:
-                        f.writelines(lines)
-                os.chmod(py_file, 0o755)
-            env['PATH'] = str(temp_bin / 'bin') + ':' + env['PATH']
-    
-            # Now run the nextflow with this env
-    
-            # Validate inputs
-            if not os.path.isdir(args.code_repo):
-                sys.exit(f"Error: Code repository not found: {args.code_repo}")
-            if not os.path.isdir(args.ref_dir):
-                sys.exit(f"Error: Reference directory not found: {args.ref_dir}")
-            if not os.path.exists(args.data_file):
-                sys.exit(f"Error: Data file not found: {args.data_file}")
-            if args.meta_file and not os.path.exists(args.meta_file):
-                sys.exit(f"Error: Meta file not found: {args.meta_file}")
-            
-            # Create output directory
-            os.makedirs(args.output_dir, exist_ok=True)
-            
-            # Set up work directory for inputs
-            work_dir = os.path.join(args.output_dir, 'input')
-            os.makedirs(work_dir, exist_ok=True)
-            
-            # Copy data file to work_dir with standard name
-            data_base = 'input.tsv'
-            data_target = os.path.join(work_dir, data_base)
-            shutil.copy2(args.data_file, data_target)
-            
-            # Preprocess the input file to standardize column names
-            df = pd.read_csv(data_target, sep='\t')
-            df.columns = df.columns.str.strip().str.lower()
-            
-            # If columns are 'column 1', 'column 2', etc., rename to standard headers
-            if all(col.startswith('column') for col in df.columns):
-                standard_headers = ['variant', 'minor_allele', 'minor_af', 'low_confidence_variant', 'n_complete_samples', 'ac', 'ytx', 'beta', 'se', 'tstat', 'pval']
-                if len(df.columns) == len(standard_headers):
-                    df.columns = standard_headers
-            
-            column_map = {
-                'chr': 'chromosome',
-                'chrom': 'chromosome',
-                'chromosome': 'chromosome',
-                'chrm': 'chromosome',
-                'pos': 'base_pair_location',
-                'bp': 'base_pair_location',
-                'position': 'base_pair_location',
-                'base_pair': 'base_pair_location',
-                'ea': 'effect_allele',
-                'a1': 'effect_allele',
-                'effect': 'effect_allele',
-                'alt': 'effect_allele',
-                'oa': 'other_allele',
-                'a2': 'other_allele',
-                'other': 'other_allele',
-                'ref': 'other_allele',
-                'snp': 'variant_id',
-                'rsid': 'rsid',
-                'id': 'variant_id',
-                'marker': 'variant_id',
-                'markername': 'variant_id',
-                'variant': 'variant_id'  # Added this
-            }
-            df.rename(columns=column_map, inplace=True)
-            
-            # If 'chromosome' and 'base_pair_location' are not present but 'variant_id' is, try to parse variant_id
-            if 'chromosome' not in df.columns and 'base_pair_location' not in df.columns and 'variant_id' in df.columns:
-                try:
-                    parsed = df['variant_id'].str.split(':', expand=True)
-                    if parsed.shape[1] >= 4:
-                        df['chromosome'] = parsed[0]
-                        df['base_pair_location'] = parsed[1]
-                        df['other_allele'] = parsed[2]
-                        df['effect_allele'] = parsed[3]
-                        df['base_pair_location'] = pd.to_numeric(df['base_pair_location'], errors='coerce')
-                    elif parsed.shape[1] >= 2:
-                        df['chromosome'] = parsed[0]
-                        df['base_pair_location'] = parsed[1]
-                        df['base_pair_location'] = pd.to_numeric(df['base_pair_location'], errors='coerce')
-                except Exception as e:
-                    print(f"Warning: Could not parse variant_id: {str(e)}")
-            
-            # Save the preprocessed file
-            df.to_csv(data_target, sep='\t', index=False)
-            
-            # Compute MD5
-            with open(data_target, 'rb') as f:
-                md5 = hashlib.md5(f.read()).hexdigest()
-            
-            # Set up meta YAML
-            meta_base = data_base + '-meta.yaml'
-            meta_target = os.path.join(work_dir, meta_base)
-            
-            if args.meta_file:
-                # Load provided meta, update fields
-                with open(args.meta_file, 'r') as f:
-                    meta_data = yaml.safe_load(f)
-                meta_data['data_file_name'] = data_base
-                meta_data['data_file_md5sum'] = md5
-                # Update date if not set
-                if 'date_metadata_last_modified' not in meta_data:
-                    meta_data['date_metadata_last_modified'] = datetime.datetime.now().strftime("%Y-%m-%d")
-            else:
-                # Generate default meta
-                meta_data = {
-                    'date_metadata_last_modified': datetime.datetime.now().strftime("%Y-%m-%d"),
-                    'genome_assembly': args.genome_assembly,
-                    'coordinate_system': args.coordinate_system,
-                    'data_file_name': data_base,
-                    'file_type': 'txt',
-                    'data_file_md5sum': md5,
-                    'is_harmonised': False,
-                    'is_sorted': False
-                }
-            
-            # Write meta YAML
-            with open(meta_target, 'w') as f:
-                yaml.safe_dump(meta_data, f)
-            
-            # Use absolute path to nextflow
-            nextflow_path = os.path.join(args.code_repo, 'nextflow')
-            if not os.path.exists(nextflow_path):
-                nextflow_path = shutil.which('nextflow')
-                if not nextflow_path:
-                    sys.exit("Error: Nextflow not found in code repo or PATH")
-            
-            # Create log directory inside output directory
-            log_dir = os.path.join(args.output_dir, "logs")
-            os.makedirs(log_dir, exist_ok=True)
-            
-            print(f"Starting GWAS Harmonizer")
-            print(f"Code repo: {args.code_repo}")
-            print(f"Reference dir: {args.ref_dir}")
-            print(f"Data file: {data_target}")
-            print(f"Meta file: {meta_target}")
-            print(f"Output dir: {args.output_dir}")
-            print(f"Log dir: {log_dir}")
-            print(f"Nextflow path: {nextflow_path}")
-            
-            # Build Nextflow command
-            cmd = [
-                nextflow_path, 'run', args.code_repo,
-                '-profile', 'standard',
-                '--harm',
-                '--ref', args.ref_dir,
-                '--file', data_target,
-                '--outdir', args.output_dir,
-                '-with-report', os.path.join(log_dir, 'harm-report.html'),
-                '-with-timeline', os.path.join(log_dir, 'harm-timeline.html'),
-                '-with-trace', os.path.join(log_dir, 'harm-trace.txt'),
-                '-with-dag', os.path.join(log_dir, 'harm-dag.html')
-            ]
-            
-            print(f"Nextflow command: {' '.join(cmd)}")
-            
-            # Run Nextflow
-            log_file = os.path.join(log_dir, 'harm.log')
-            try:
-                with open(log_file, 'w') as log_f:
-                    log_f.write(f"Command: {' '.join(cmd)}\n")
-                    log_f.write(f"Reference directory: {args.ref_dir}\n")
-                    log_f.write(f"Data file: {data_target}\n")
-                    log_f.write(f"Meta file: {meta_target}\n")
-                    log_f.write(f"Output directory: {args.output_dir}\n")
-                    log_f.write(f"Log directory: {log_dir}\n")
-                    log_f.flush()
-                    
-                    process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-                    
-                    # Stream output with timestamps
-                    line_count = 0
-                    for line in process.stdout:
-                        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        output_line = f"[{timestamp}] {line}"
-                        print(output_line, end='')
-                        log_f.write(output_line)
-                        log_f.flush()
-                        
-                        line_count += 1
-                        if line_count % 50 == 0:
-                            print(f"=== Processed {line_count} lines of output ===")
-                    
-                    return_code = process.wait()
-                    
-                if return_code != 0:
-                    print(f"Nextflow process failed with return code: {return_code}")
-                    sys.exit(return_code)
-                    
-                print("Harmonizer completed successfully!")
-                
-                # Debug: Print directory tree after Nextflow to locate files
-                print("Directory tree after Nextflow:")
-                for root, dirs, files in os.walk(args.output_dir):
-                    level = root.replace(args.output_dir, '').count(os.sep)
-                    indent = ' ' * 4 * level
-                    print(f"{indent}{os.path.basename(root)}/")
-                    subindent = ' ' * 4 * (level + 1)
-                    for f in files:
-                        print(f"{subindent}{f}")
-                
-                # Find the harmonized output file recursively (assuming pattern *.h.tsv.gz)
-                harmonized_files = list(Path(args.output_dir).rglob('*.h.tsv.gz'))
-                if not harmonized_files:
-                    harmonized_files = list(Path(args.output_dir).rglob('*.harmonised.tsv.gz'))
-                if not harmonized_files:
-                    print("Warning: No harmonized output file found")
-                else:
-                    primary_output = harmonized_files[0]
-                    shutil.copy2(primary_output, 'harmonized_output.tsv.gz')
-                    print(f"Copied primary output to harmonized_output.tsv.gz")
-                    
-                    # Also copy index if exists
-                    index_file = primary_output.with_suffix('.tsv.gz.tbi')
-                    if index_file.exists():
-                        shutil.copy2(index_file, 'harmonized_output.tsv.gz.tbi')
-                
-                # Create output files for Galaxy
-                with open('log_dir.txt', 'w') as f:
-                    f.write(log_dir)
-                    
-                # Copy report files to current directory for Galaxy outputs
-                report_files = {
-                    'harm-report.html': 'report',
-                    'harm-timeline.html': 'timeline'
-                }
-                
-                for src_file, dest_name in report_files.items():
-                    src = os.path.join(log_dir, src_file)
-                    if os.path.exists(src):
-                        shutil.copy2(src, dest_name)
-                        print(f"Copied {src} to {dest_name}")
-                    else:
-                        print(f"Warning: {src} not found")
-                        
-            except Exception as e:
-                sys.exit(f"Error running harmonizer: {str(e)}")
-=======
     print(f"Nextflow command: {' '.join(cmd)}")
     
     # Run Nextflow
@@ -2175,7 +2015,6 @@ def run_harmonizer(args, env):
                 
     except Exception as e:
         sys.exit(f"Error running harmonizer: {str(e)}")
->>>>>>> be076ce9b6ce3c3e056304b37d89147b32711e88
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,44 +1,81 @@
 #!/usr/bin/env python3
 import argparse
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
-def add_snp_identifier(input_path, output_path):
+DEFAULT_CHUNK_MB = 16
+
+def add_snp_identifier(input_path, output_path, chunk_mb=DEFAULT_CHUNK_MB):
     """
     Reads a munged sumstats file, creates a CHR:BP:A2:A1 ID,
     and saves the new file.
+
+    The file is streamed in blocks of about chunk_mb: every column is read
+    as text, the ID is built with Arrow string kernels and each block is
+    written out before the next is read, so memory stays a small multiple
+    of the block size. Column names are upper-cased; an existing ID column
+    is replaced in place, otherwise ID is appended.
     """
     print(f"Reading file: {input_path}")
     try:
         # MungeSumstats can produce columns with different capitalizations
-        # so we read it in and then normalize the column names to uppercase
-        df = pd.read_csv(input_path, sep='\t', low_memory=False)
-        df.columns = [col.upper() for col in df.columns]
+        # so we normalize the column names to uppercase
+        with open(input_path, 'rb') as f:
+            header = f.readline().decode().rstrip('\r\n').split('\t')
+        columns = [col.upper() for col in header]
 
         print("Generating new 'ID' column...")
         # Ensure required columns exist
         required_cols = ['CHR', 'BP', 'A1', 'A2']
-        if not all(col in df.columns for col in required_cols):
-            missing = [col for col in required_cols if col not in df.columns]
+        if not all(col in columns for col in required_cols):
+            missing = [col for col in required_cols if col not in columns]
             raise ValueError(f"Input file is missing required columns: {missing}")
+        id_index = columns.index('ID') if 'ID' in columns else len(columns)
+        out_columns = columns if id_index < len(columns) else columns + ['ID']
 
-        # Create the ID column by concatenating strings
-        df['ID'] = df['CHR'].astype(str) + ':' + \
-                   df['BP'].astype(str) + ':' + \
-                   df['A2'].astype(str) + ':' + \
-                   df['A1'].astype(str)
+        names = [f'c{i}' for i in range(len(columns))]
+        reader = pacsv.open_csv(
+            input_path,
+            read_options=pacsv.ReadOptions(column_names=names, skip_rows=1, block_size=chunk_mb << 20),
+            parse_options=pacsv.ParseOptions(delimiter='\t', quote_char=False),
+            convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names}),
+        )
 
         print(f"Saving modified file to: {output_path}")
-        df.to_csv(output_path, sep='\t', index=False)
-        print("Done.")
+        n_rows = 0
+        with open(output_path, 'wb') as out:
+            out.write(('\t'.join(out_columns) + '\n').encode())
+            for batch in reader:
+                # Create the ID column by joining the strings
+                snp_id = pc.binary_join_element_wise(
+                    *(batch.column(columns.index(col)) for col in ('CHR', 'BP', 'A2', 'A1')), ':')
+                fields = [batch.column(i) for i in range(len(columns))]
+                fields[id_index:id_index + 1] = [snp_id]
+                lines = pc.binary_join_element_wise(*fields, '\t')
+                out.write(_joined_lines(lines))
+                n_rows += batch.num_rows
+        print(f"Done ({n_rows} variants).")
 
     except Exception as e:
         # Exit with a clear error message if something goes wrong
         import sys
         sys.exit(f"An error occurred: {e}")
 
+def _joined_lines(lines):
+    """Newline-terminated lines of a string array, sliced from its value buffer without Python strings"""
+    if not len(lines):
+        return b''
+    lines = pc.binary_join_element_wise(lines, '\n', '')
+    offset_type = pa.int64() if pa.types.is_large_string(lines.type) else pa.int32()
+    offsets = pa.Array.from_buffers(offset_type, len(lines) + 1, [None, lines.buffers()[1]], offset=lines.offset)
+    return memoryview(lines.buffers()[2])[offsets[0].as_py():offsets[-1].as_py()]
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Add a SNP ID column to a summary statistics file.")
     parser.add_argument("--input", required=True, help="Path to the input summary statistics file.")
     parser.add_argument("--output", required=True, help="Path for the output file.")
+    parser.add_argument("--chunk_mb", required=False, type=int, default=DEFAULT_CHUNK_MB,
+                        help="Size of the blocks the file is streamed in (MB); bounds memory use.")
     args = parser.parse_args()
-    add_snp_identifier(args.input, args.output)
\ No newline at end of file
+    add_snp_identifier(args.input, args.output, chunk_mb=args.chunk_mb)
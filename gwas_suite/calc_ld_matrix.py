@@ -149,14 +149,24 @@
 
 #!/usr/bin/env python3
 import argparse
+import gzip
+import re
+import numpy as np
 import pandas as pd
 import subprocess
 import os
 import sys
 import shutil
+import time
 import urllib.request
 import zipfile
 import stat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bed_ld import BedFile, ld_band_pairs, ld_matrix
+from ld_cache import LDCache
+from ld_formats import LD_DTYPES, open_ld_binary, raw_row_blocks, write_ld_band, write_ld_binary
+from region_prune import DEFAULT_R2, DEFAULT_RADIUS_KB, DEFAULT_SIGNAL_Z, marginal_z, prune_region, summarize
 
 # ✅ PLINK download source (official S3 mirror from Shaun Purcell)
 PLINK_URL = "https://s3.amazonaws.com/plink1-assets/plink_linux_x86_64_20231211.zip"
@@ -181,38 +191,281 @@ def download_and_prepare_plink(download_dir):
     return plink_path
 
 
+def locate_plink():
+    """PLINK from PATH, the known local install, or a fresh download."""
+    plink_exec = shutil.which("plink")
+    if plink_exec is None:
+        hardcoded_path = "/home/icog-bioai2/miniconda3/bin/plink"
+        if os.path.exists(hardcoded_path):
+            plink_exec = hardcoded_path
+        else:
+            print("⚠️ PLINK not found in PATH. Attempting to download it automatically...")
+            plink_exec = download_and_prepare_plink(os.getcwd())
+
+    print(f"Using PLINK executable at: {plink_exec}")
+    return plink_exec
+
+
+def read_sumstats(sumstats_file):
+    """Read summary statistics with upper-cased columns; returns (df, SNP column name)."""
+    print("Reading summary statistics...")
+    df = pd.read_csv(sumstats_file, sep='\t', low_memory=False)
+    df.columns = [col.upper() for col in df.columns]
+
+    if 'SNP' in df.columns:
+        snp_col_name = 'SNP'
+    elif 'ID' in df.columns:
+        snp_col_name = 'ID'
+    else:
+        raise ValueError("Could not find a 'SNP' or 'ID' column in the summary statistics file.")
+    return df, snp_col_name
+
+
+LD_FORMATS = ['text', 'binary', 'banded']
+LD_ENGINES = ['plink', 'numpy']
+# PLINK's --ld-window is a SNP count; this is large enough to leave only the kb limit
+UNLIMITED_LD_WINDOW = 999999
+
+
+def run_plink_ld(plink_exec, plink_prefix, snps, output_ld_path, output_snps_path,
+                 work_dir=".", threads=None, ld_format="text", ld_dtype="float32",
+                 band_window_kb=1000, band_window_snps=None):
+    """
+    Runs PLINK --r square for the given SNPs and moves the matrix and SNP list
+    into place. Returns the number of SNPs in the matrix (0 when none of them
+    are in the reference panel).
+
+    ld_format 'text' keeps PLINK's gzipped matrix; 'binary' has PLINK write
+    float32 (bin4) and stores it in the memory-mappable format of ld_formats.py.
+    'banded' asks PLINK for the pair table within band_window_kb /
+    band_window_snps instead of a square matrix and stores it as a .ldband file.
+    """
+    extract_snps_file = os.path.join(work_dir, "snps_to_extract.txt")
+    with open(extract_snps_file, 'w') as f:
+        for snp_id in snps:
+            f.write(f"{snp_id}\n")
+    print(f"Found {len(snps)} SNPs to extract.")
+
+    output_prefix = os.path.join(work_dir, "ld_matrix_plink")
+    print(f"Running PLINK with reference: {plink_prefix}")
+    if ld_format == "banded":
+        ld_args = ["--r", "gz",
+                   "--ld-window-kb", str(band_window_kb),
+                   "--ld-window", str(band_window_snps or UNLIMITED_LD_WINDOW),
+                   "--ld-window-r2", "0"]
+    else:
+        ld_args = ["--r", "square", "bin4" if ld_format == "binary" else "gz"]
+    cmd = [
+        plink_exec, "--bfile", plink_prefix,
+        *ld_args,
+        "--extract", extract_snps_file,
+        "--out", output_prefix, "--make-bed"
+    ]
+    if threads:
+        cmd += ["--threads", str(threads)]
+
+    process = subprocess.run(cmd, capture_output=True, text=True)
+    if "No variants remain" in process.stdout or "No variants remain" in process.stderr:
+        print("PLINK Warning: No overlapping SNPs with reference panel.")
+        with open(output_ld_path, 'w') as f: f.write("")
+        with open(output_snps_path, 'w') as f: f.write("# No overlapping SNPs with reference\n")
+        return 0
+
+    if process.returncode != 0:
+        print(f"ERROR: PLINK command failed for {plink_prefix}.", file=sys.stderr)
+        print("--- STDOUT ---", file=sys.stderr); print(process.stdout, file=sys.stderr)
+        print("--- STDERR ---", file=sys.stderr); print(process.stderr, file=sys.stderr)
+        raise RuntimeError("PLINK execution failed.")
+
+    # --- Prepare outputs ---
+    plink_output_file = f"{output_prefix}.ld.bin" if ld_format == "binary" else f"{output_prefix}.ld.gz"
+    if not os.path.exists(plink_output_file):
+        raise FileNotFoundError(f"PLINK did not generate: {plink_output_file}")
+
+    plink_bim_file = f"{output_prefix}.bim"
+    if not os.path.exists(plink_bim_file):
+        raise FileNotFoundError(f"PLINK did not generate BIM file: {plink_bim_file}")
+    final_snps_df = pd.read_csv(plink_bim_file, sep='\t', header=None, usecols=[1])
+
+    if ld_format == "banded":
+        final_snps = write_band_from_plink(plink_output_file, plink_bim_file, output_ld_path,
+                                           band_window_kb, band_window_snps)
+        os.remove(plink_output_file)
+        final_snps_df = pd.DataFrame({1: final_snps})
+    elif ld_format == "binary":
+        final_snps = final_snps_df[1].astype(str).tolist()
+        write_ld_binary(output_ld_path, raw_row_blocks(plink_output_file, len(final_snps)),
+                        final_snps, dtype=ld_dtype)
+        os.remove(plink_output_file)
+    else:
+        shutil.move(plink_output_file, output_ld_path)
+    final_snps_df.to_csv(output_snps_path, header=False, index=False)
+    print(f"LD matrix + SNP list ready with {len(final_snps_df)} SNPs.")
+    return len(final_snps_df)
+
+
+def write_band_from_plink(pairs_file, bim_file, output_ld_path, window_kb, window_snps):
+    """Store PLINK's windowed pair table as a .ldband file; returns SNPs in position order."""
+    bim = pd.read_csv(bim_file, sep='\t', header=None, usecols=[1, 3], names=['SNP', 'BP'],
+                      dtype={'SNP': str})
+    pairs = pd.read_csv(pairs_file, sep=r'\s+', usecols=['SNP_A', 'SNP_B', 'R'],
+                        dtype={'SNP_A': str, 'SNP_B': str, 'R': 'float32'})
+    # A duplicated ID maps to its first row
+    first = bim['SNP'].drop_duplicates()
+    snp_index = pd.Index(first.to_numpy())
+    rows = snp_index.get_indexer(pairs['SNP_A'])
+    cols = snp_index.get_indexer(pairs['SNP_B'])
+    if (rows < 0).any() or (cols < 0).any():
+        raise ValueError("PLINK LD table references SNPs missing from its BIM file.")
+    rows, cols = first.index.to_numpy()[rows], first.index.to_numpy()[cols]
+    write_ld_band(output_ld_path, bim['SNP'].tolist(), bim['BP'].to_numpy(), rows, cols,
+                  pairs['R'].to_numpy(), window_kb=window_kb, window_snps=window_snps)
+    print(f"Stored {len(pairs)} SNP pairs within the LD window.")
+    return bim.sort_values('BP', kind='stable')['SNP'].tolist()
+
+
+def write_ld_outputs(matrix, snps, output_ld_path, output_snps_path, ld_format="text", ld_dtype="float32"):
+    """Write an in-memory LD matrix as PLINK-style gzipped text or the binary format."""
+    if ld_format == "binary":
+        write_ld_binary(output_ld_path, matrix, snps, dtype=ld_dtype)
+    else:
+        with gzip.open(output_ld_path, 'wt') as f:
+            np.savetxt(f, matrix, fmt='%.6g', delimiter='\t')
+    with open(output_snps_path, 'w') as f:
+        for snp in snps:
+            f.write(f"{snp}\n")
+
+
+def write_no_overlap(output_ld_path, output_snps_path):
+    print("Warning: No overlapping SNPs with reference panel.")
+    with open(output_ld_path, 'w') as f: f.write("")
+    with open(output_snps_path, 'w') as f: f.write("# No overlapping SNPs with reference\n")
+
+
+def plink_square_ld(plink_exec, plink_prefix, snps, work_dir=".", threads=None):
+    """(float32 matrix, SNPs) from PLINK --r square bin4, or None if no SNP is in the panel."""
+    fresh_ld = os.path.join(work_dir, "ld_matrix_fresh.ldm")
+    fresh_snps = os.path.join(work_dir, "ld_matrix_fresh.snps")
+    try:
+        if run_plink_ld(plink_exec, plink_prefix, snps, fresh_ld, fresh_snps,
+                        work_dir=work_dir, threads=threads, ld_format="binary") == 0:
+            return None
+        matrix, final_snps = open_ld_binary(fresh_ld, mmap=False)
+        return matrix, final_snps
+    finally:
+        for path in (fresh_ld, fresh_snps):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def numpy_square_ld(plink_prefix, snps):
+    """(float32 matrix, SNPs) computed in-process from the .bed, or None if no SNP is in the panel."""
+    bed = BedFile(plink_prefix)
+    indices = bed.snp_indices(snps)
+    print(f"Found {len(snps)} SNPs to extract; {len(indices)} are in {plink_prefix}.bim.")
+    if len(indices) == 0:
+        return None
+    return ld_matrix(bed, indices), bed.bim['SNP'].to_numpy()[indices].tolist()
+
+
+def numpy_band_ld(plink_prefix, snps, output_ld_path, output_snps_path, window_kb, window_snps):
+    """Banded whole-chromosome LD computed in-process; returns the number of SNPs."""
+    bed = BedFile(plink_prefix)
+    indices = bed.snp_indices(snps)
+    if len(indices) == 0:
+        write_no_overlap(output_ld_path, output_snps_path)
+        return 0
+    order, rows, cols, values = ld_band_pairs(bed, indices, window_kb, window_snps)
+    final_snps = bed.bim['SNP'].to_numpy()[order].tolist()
+    write_ld_band(output_ld_path, final_snps, bed.bim['BP'].to_numpy()[order], rows, cols, values,
+                  window_kb=window_kb, window_snps=window_snps)
+    with open(output_snps_path, 'w') as f:
+        for snp in final_snps:
+            f.write(f"{snp}\n")
+    print(f"Stored {len(values)} SNP pairs within the LD window for {len(final_snps)} SNPs.")
+    return len(final_snps)
+
+
+def run_ld(plink_exec, plink_prefix, snps, output_ld_path, output_snps_path, work_dir=".", threads=None,
+           ld_format="text", ld_dtype="float32", band_window_kb=1000, band_window_snps=None,
+           ld_cache=None, population=None, chromosome=None, region=None, ld_engine="plink"):
+    """
+    Compute LD for snps against plink_prefix and write the outputs; returns
+    the number of SNPs in the matrix (0 when none are in the panel).
+
+    ld_engine 'plink' runs PLINK; 'numpy' reads the .bed in-process (bed_ld.py).
+    Square matrices go through ld_cache when one is given: a hit (exact SNP
+    set, or a cached superset) skips the computation, a miss is stored.
+    region is (start, end) in bp, if known, to narrow the cache search.
+    """
+    if ld_format == "banded":
+        if ld_engine == "numpy":
+            return numpy_band_ld(plink_prefix, snps, output_ld_path, output_snps_path,
+                                 band_window_kb, band_window_snps)
+        return run_plink_ld(plink_exec, plink_prefix, snps, output_ld_path, output_snps_path,
+                            work_dir=work_dir, threads=threads, ld_format=ld_format,
+                            band_window_kb=band_window_kb, band_window_snps=band_window_snps)
+
+    if ld_cache is None and ld_engine == "plink":
+        return run_plink_ld(plink_exec, plink_prefix, snps, output_ld_path, output_snps_path,
+                            work_dir=work_dir, threads=threads, ld_format=ld_format, ld_dtype=ld_dtype)
+
+    start, end = region or (None, None)
+    result = ld_cache.lookup(plink_prefix, population, chromosome, snps, start, end) if ld_cache else None
+    if result is not None:
+        print(f"LD matrix served from cache for {len(result[1])} SNPs.")
+    else:
+        if ld_engine == "numpy":
+            result = numpy_square_ld(plink_prefix, snps)
+        else:
+            result = plink_square_ld(plink_exec, plink_prefix, snps, work_dir=work_dir, threads=threads)
+        if result is None:
+            write_no_overlap(output_ld_path, output_snps_path)
+            return 0
+        if ld_cache:
+            ld_cache.store(plink_prefix, population, chromosome, snps, result[0], result[1], start, end)
+
+    matrix, final_snps = result
+    write_ld_outputs(matrix, final_snps, output_ld_path, output_snps_path, ld_format, ld_dtype)
+    print(f"LD matrix + SNP list ready with {len(final_snps)} SNPs.")
+    return len(final_snps)
+
+
+def prune_region_snps(region_df, snp_col_name, plink_prefix, prune, lead, record_path):
+    """
+    Shrink a region to the SNPs region_prune.py keeps (prune holds its
+    signal_z/min_z/radius_kb/r2 options); the full kept/dropped record is
+    written to record_path. Returns the kept SNP IDs.
+    """
+    bed = BedFile(plink_prefix) if os.path.exists(f"{plink_prefix}.bed") else None
+    record = prune_region(region_df[snp_col_name], marginal_z(region_df), region_df['BP'], bed=bed,
+                          force_signals=[lead], **prune)
+    record.to_csv(record_path, sep='\t', index=False)
+    print(summarize(record))
+    return pd.unique(record.loc[record['kept'], 'SNP']).tolist()
+
+
 def calculate_ld_matrix(sumstats_file, plink_ref_dir, chromosome, population,
-                        output_ld_path, output_snps_path, lead_variant=None, window_kb=None):
+                        output_ld_path, output_snps_path, lead_variant=None, window_kb=None,
+                        ld_format="text", ld_dtype="float32", band_window_kb=1000, band_window_snps=None,
+                        ld_cache=None, ld_engine="plink", prune=None, prune_record=None):
     """
     Calculates an LD matrix and outputs a clean list of SNPs used.
     Supports:
       - Mode A: lead_variant + window (region around SNP)
       - Mode B: no lead_variant -> whole chromosome
+    ld_format: 'text' (PLINK .ld.gz), 'binary' (float32/float16, see ld_formats.py)
+    or 'banded' (Mode B only: pairs within band_window_kb/band_window_snps)
+    ld_cache: optional LDCache serving repeated/overlapping requests
+    ld_engine: 'plink' (subprocess) or 'numpy' (in-process from the .bed)
+    prune: optional region_prune options (Mode A only); the record of kept
+    and dropped SNPs goes to prune_record (default: <output_snps>.pruned.tsv)
     """
     try:
-        # --- Locate PLINK executable ---
-        plink_exec = shutil.which("plink")
-        if plink_exec is None:
-            hardcoded_path = "/home/icog-bioai2/miniconda3/bin/plink"
-            if os.path.exists(hardcoded_path):
-                plink_exec = hardcoded_path
-            else:
-                print("⚠️ PLINK not found in PATH. Attempting to download it automatically...")
-                plink_exec = download_and_prepare_plink(os.getcwd())
-
-        print(f"Using PLINK executable at: {plink_exec}")
-
-        # --- Read summary statistics ---
-        print("Reading summary statistics...")
-        df = pd.read_csv(sumstats_file, sep='\t', low_memory=False)
-        df.columns = [col.upper() for col in df.columns]
-
-        if 'SNP' in df.columns:
-            snp_col_name = 'SNP'
-        elif 'ID' in df.columns:
-            snp_col_name = 'ID'
-        else:
-            raise ValueError("Could not find a 'SNP' or 'ID' column in the summary statistics file.")
+        if ld_format == "banded" and lead_variant and lead_variant.strip():
+            raise ValueError("Banded LD output is for whole-chromosome mode; omit --lead_variant.")
+        plink_exec = locate_plink() if ld_engine == "plink" else None
+        df, snp_col_name = read_sumstats(sumstats_file)
 
         # --- Decide mode based on lead_variant ---
         lead_variant = lead_variant.strip() if lead_variant else None
@@ -220,12 +473,11 @@ def calculate_ld_matrix(sumstats_file, plink_ref_dir, chromosome, population,
         if lead_variant:
             # --- Mode A: Region around lead SNP ---
             print(f"Using lead variant mode: {lead_variant}")
-            df['id_lower'] = df[snp_col_name].str.lower()
-            lead_variant_row = df[df['id_lower'] == lead_variant.lower()]
-            if lead_variant_row.empty:
+            lead_row = resolve_lead_variants(df[snp_col_name], [lead_variant])[0]
+            if lead_row < 0:
                 raise ValueError(f"Lead variant '{lead_variant}' not found in the '{snp_col_name}' column.")
 
-            lead_info = lead_variant_row.iloc[0]
+            lead_info = df.iloc[lead_row]
             if str(lead_info['CHR']) != str(chromosome):
                 raise ValueError(f"Lead variant '{lead_variant}' is on CHR {lead_info['CHR']}, "
                                  f"but you provided reference for CHR {chromosome}.")
@@ -244,6 +496,7 @@ def calculate_ld_matrix(sumstats_file, plink_ref_dir, chromosome, population,
             # --- Mode B: All SNPs on chromosome ---
             print(f"No lead variant provided. Using ALL SNPs from chromosome {chromosome}.")
             region_df = df[df['CHR'] == int(chromosome)]
+            start_pos = end_pos = None
 
         # --- Collect SNPs ---
         snps_in_region = region_df[snp_col_name].unique().tolist()
@@ -253,71 +506,371 @@ def calculate_ld_matrix(sumstats_file, plink_ref_dir, chromosome, population,
             with open(output_snps_path, 'w') as f: f.write("# No SNPs found\n")
             sys.exit()
 
-        extract_snps_file = "snps_to_extract.txt"
-        with open(extract_snps_file, 'w') as f:
-            for snp_id in snps_in_region:
-                f.write(f"{snp_id}\n")
-        print(f"Found {len(snps_in_region)} SNPs to extract.")
-
-        # --- Run PLINK ---
         plink_prefix = os.path.join(plink_ref_dir, f"{population}.{chromosome}")
-        output_prefix = "ld_matrix_plink"
-
-        print(f"Running PLINK with reference: {plink_prefix}")
-        cmd = [
-            plink_exec, "--bfile", plink_prefix,
-            "--r", "square", "gz",
-            "--extract", extract_snps_file,
-            "--out", output_prefix, "--make-bed"
-        ]
-
-        process = subprocess.run(cmd, capture_output=True, text=True)
-        if "No variants remain" in process.stdout or "No variants remain" in process.stderr:
-            print("PLINK Warning: No overlapping SNPs with reference panel.")
-            with open(output_ld_path, 'w') as f: f.write("")
-            with open(output_snps_path, 'w') as f: f.write("# No overlapping SNPs with reference\n")
+        if prune and lead_variant:
+            snps_in_region = prune_region_snps(region_df, snp_col_name, plink_prefix, prune, lead_variant,
+                                               prune_record or f"{output_snps_path}.pruned.tsv")
+        cache_before = ld_cache.stats() if ld_cache else None
+        n_ld = run_ld(plink_exec, plink_prefix, snps_in_region, output_ld_path, output_snps_path,
+                      ld_format=ld_format, ld_dtype=ld_dtype,
+                      band_window_kb=band_window_kb, band_window_snps=band_window_snps,
+                      ld_cache=ld_cache, population=population, chromosome=chromosome,
+                      region=(start_pos, end_pos), ld_engine=ld_engine)
+        if ld_cache:
+            print(ld_cache.summary(cache_before))
+        if n_ld == 0:
             sys.exit()
 
-        if process.returncode != 0:
-            print("ERROR: PLINK command failed.", file=sys.stderr)
-            print("--- STDOUT ---", file=sys.stderr); print(process.stdout, file=sys.stderr)
-            print("--- STDERR ---", file=sys.stderr); print(process.stderr, file=sys.stderr)
-            sys.exit("PLINK execution failed.")
-
-        # --- Prepare outputs ---
-        plink_output_file = f"{output_prefix}.ld.gz"
-        if not os.path.exists(plink_output_file):
-            raise FileNotFoundError(f"PLINK did not generate: {plink_output_file}")
-        os.rename(plink_output_file, output_ld_path)
-
-        plink_bim_file = f"{output_prefix}.bim"
-        if os.path.exists(plink_bim_file):
-            final_snps_df = pd.read_csv(plink_bim_file, sep='\t', header=None, usecols=[1])
-            final_snps_df.to_csv(output_snps_path, header=False, index=False)
-            print(f"LD matrix + SNP list ready with {len(final_snps_df)} SNPs.")
+    except Exception as e:
+        sys.exit(f"An error occurred: {e}")
+
+
+def resolve_lead_variants(ids, leads):
+    """
+    Row positions of lead variant IDs in ids (first occurrence), -1 if absent.
+    Exact matches are looked up through a hash index; only leads that miss
+    fall back to a case-insensitive match.
+    """
+    ids = pd.Series(ids, dtype=str).reset_index(drop=True)
+    first = pd.Series(ids.index, index=ids)
+    first = first[~first.index.duplicated()]
+    found = first.reindex(pd.Index(leads)).to_numpy()
+    missing = np.isnan(found)
+    if missing.any():
+        lower = pd.Series(ids.index, index=ids.str.lower())
+        lower = lower[~lower.index.duplicated()]
+        found[missing] = lower.reindex(pd.Index([leads[i].lower() for i in np.flatnonzero(missing)])).to_numpy()
+    return np.where(np.isnan(found), -1, found).astype(np.int64)
+
+
+def read_lead_variants(path):
+    """Lead IDs from a file: one per line, or a table with a SNP/ID column (e.g. a COJO .jma)."""
+    table = pd.read_csv(path, sep=r'\s+', header=None, dtype=str, comment='#')
+    header = [str(v).upper() for v in table.iloc[0]] if len(table) else []
+    column = next((header.index(name) for name in ('SNP', 'ID', 'RSID', 'LEAD_VARIANT') if name in header), None)
+    if column is not None:
+        leads = table.iloc[1:, column]
+    else:
+        leads = table.iloc[:, 0]
+    return list(dict.fromkeys(v.strip() for v in leads.dropna() if v.strip()))
+
+
+def region_file_stem(lead):
+    """A file-name-safe version of a variant ID"""
+    return re.sub(r'[^\w.-]', '_', lead)
+
+
+def normalize_chromosome(value):
+    """'chr1', '1' and 1 all become '1'."""
+    value = str(value).strip()
+    if value.lower().startswith('chr'):
+        value = value[3:]
+    return value
+
+
+def parse_chromosomes(spec):
+    """Parse '1-22', '1,2,X' or 'all' (None = every chromosome in the sumstats)."""
+    if spec.strip().lower() == 'all':
+        return None
+    chromosomes = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            chromosomes.extend(str(c) for c in range(int(start), int(end) + 1))
         else:
-            raise FileNotFoundError(f"PLINK did not generate BIM file: {plink_bim_file}")
+            chromosomes.append(normalize_chromosome(part))
+    return chromosomes
 
+
+def _ld_task(plink_exec, plink_prefix, snps, output_ld_path, output_snps_path, work_dir, threads,
+             ld_options):
+    """One LD job on a pool worker. Never raises: failures end up in the timing report."""
+    start = time.perf_counter()
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        n_ld = run_ld(plink_exec, plink_prefix, snps, output_ld_path, output_snps_path,
+                      work_dir=work_dir, threads=threads, **ld_options)
+        status = "ok" if n_ld else "no_overlap"
     except Exception as e:
-        sys.exit(f"An error occurred: {e}")
+        n_ld, status = 0, f"failed: {e}"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return n_ld, status, time.perf_counter() - start
+
+
+def calculate_ld_matrices(sumstats_file, plink_ref_dir, chromosomes, population, output_dir,
+                          workers=4, threads=None, timing_report=None, ld_format="text", ld_dtype="float32",
+                          band_window_kb=1000, band_window_snps=None, ld_cache=None, ld_engine="plink"):
+    """
+    Multi-chromosome mode: reads the summary statistics once, partitions them
+    by CHR and runs one PLINK --r square job per chromosome on a pool of at
+    most `workers` processes. Writes chr{N}.ld.gz (chr{N}.ldm / chr{N}.ldband
+    in binary / banded format) and chr{N}.snps.txt to output_dir, plus a
+    per-chromosome timing report.
+
+    chromosomes: list of chromosome names, or None for every CHR in the sumstats.
+    threads: total PLINK threads, shared between the concurrent jobs.
+    ld_cache: optional LDCache; whole-chromosome matrices are cached like regions.
+    """
+    plink_exec = locate_plink() if ld_engine == "plink" else None
+    df, snp_col_name = read_sumstats(sumstats_file)
+    os.makedirs(output_dir, exist_ok=True)
+
+    chrom_keys = df['CHR'].map(normalize_chromosome)
+    groups = {chrom: group[snp_col_name].unique().tolist()
+              for chrom, group in df.groupby(chrom_keys, sort=False)}
+    if chromosomes is None:
+        chromosomes = sorted(groups, key=lambda c: (not c.isdigit(), int(c) if c.isdigit() else c))
+
+    ld_options = dict(ld_format=ld_format, ld_dtype=ld_dtype,
+                      band_window_kb=band_window_kb, band_window_snps=band_window_snps, ld_engine=ld_engine)
+    ld_ext = {"text": "ld.gz", "binary": "ldm", "banded": "ldband"}[ld_format]
+    workers = max(1, min(workers, len(chromosomes) or 1))
+    cache_before = ld_cache.stats() if ld_cache else None
+    threads_per_job = max(1, threads // workers) if threads else None
+    print(f"Computing LD for {len(chromosomes)} chromosome(s) with {workers} worker(s).")
+
+    report = []
+    futures = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chrom in chromosomes:
+            snps = groups.get(chrom, [])
+            output_ld_path = os.path.join(output_dir, f"chr{chrom}.{ld_ext}")
+            output_snps_path = os.path.join(output_dir, f"chr{chrom}.snps.txt")
+            plink_prefix = os.path.join(plink_ref_dir, f"{population}.{chrom}")
+
+            if not snps:
+                print(f"CHR {chrom}: no SNPs in the summary statistics.")
+                with open(output_ld_path, 'w') as f: f.write("")
+                with open(output_snps_path, 'w') as f: f.write("# No SNPs found\n")
+                report.append((chrom, 0, 0, 0.0, "no_snps"))
+                continue
+            if not os.path.exists(f"{plink_prefix}.bed"):
+                print(f"CHR {chrom}: reference {plink_prefix}.bed not found, skipping.")
+                report.append((chrom, len(snps), 0, 0.0, "missing_reference"))
+                continue
+
+            work_dir = os.path.join(output_dir, f".work_chr{chrom}")
+            task_options = dict(ld_options, ld_cache=ld_cache, population=population, chromosome=chrom)
+            future = pool.submit(_ld_task, plink_exec, plink_prefix, snps, output_ld_path,
+                                 output_snps_path, work_dir, threads_per_job, task_options)
+            futures[future] = (chrom, len(snps))
+
+        for future in as_completed(futures):
+            chrom, n_snps = futures[future]
+            n_ld, status, seconds = future.result()
+            print(f"CHR {chrom}: {status} ({n_ld}/{n_snps} SNPs, {seconds:.1f}s)")
+            report.append((chrom, n_snps, n_ld, round(seconds, 3), status))
+
+    order = {chrom: i for i, chrom in enumerate(chromosomes)}
+    report_df = pd.DataFrame(report, columns=['chromosome', 'n_snps', 'n_ld_snps', 'seconds', 'status'])
+    report_df = report_df.sort_values('chromosome', key=lambda s: s.map(order)).reset_index(drop=True)
+    report_path = timing_report or os.path.join(output_dir, "timing_report.tsv")
+    report_df.to_csv(report_path, sep='\t', index=False)
+    print(f"Timing report written to {report_path}")
+    if ld_cache:
+        print(ld_cache.summary(cache_before))
+
+    failed = report_df[report_df['status'].str.startswith('failed')]
+    if not failed.empty:
+        sys.exit(f"LD computation failed for chromosome(s): {', '.join(failed['chromosome'])}")
+    return report_df
+
+
+def calculate_ld_for_leads(sumstats_file, plink_ref_dir, lead_variants_file, population, window_kb,
+                           output_dir, workers=4, threads=None, timing_report=None, ld_format="text",
+                           ld_dtype="float32", ld_cache=None, ld_engine="plink", prune=None):
+    """
+    Batch Mode A: one LD matrix per lead variant in lead_variants_file.
+    The sumstats are read and sorted by CHR/BP once; every lead is resolved
+    through a hash index and its window through searchsorted on that
+    chromosome's positions, so N leads cost one sort instead of N scans.
+    Writes {lead}.ld.gz (or .ldm) and {lead}.snps.txt to output_dir, plus a
+    region report (lead, chromosome, window, SNP counts, seconds, status).
+    Reference files are expected as {population}.{chr}.bed/bim/fam.
+    With prune (region_prune options) each window is pruned first and its
+    record written to {lead}.pruned.tsv.
+    """
+    if ld_format == "banded":
+        raise ValueError("Banded LD output is for whole-chromosome mode, not lead variants.")
+    if not window_kb:
+        raise ValueError("Window size (--window) must be provided when using --lead_variants.")
+    plink_exec = locate_plink() if ld_engine == "plink" else None
+    df, snp_col_name = read_sumstats(sumstats_file)
+    leads = read_lead_variants(lead_variants_file)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Resolving {len(leads)} lead variant(s).")
+
+    df = df.assign(CHR=df['CHR'].map(normalize_chromosome), BP=pd.to_numeric(df['BP'], errors='coerce'))
+    df = df.dropna(subset=['BP']).sort_values(['CHR', 'BP'], kind='stable').reset_index(drop=True)
+    chroms = df['CHR'].to_numpy()
+    bp = df['BP'].to_numpy(dtype=np.int64)
+    ids = df[snp_col_name].astype(str).to_numpy()
+    chrom_names, chrom_starts = np.unique(chroms, return_index=True)
+    chrom_ranges = dict(zip(chrom_names, zip(chrom_starts, np.append(chrom_starts[1:], len(df)))))
+    lead_rows = resolve_lead_variants(ids, leads)
+
+    window_bp = window_kb * 1000
+    ld_ext = "ldm" if ld_format == "binary" else "ld.gz"
+    workers = max(1, min(workers, len(leads) or 1))
+    threads_per_job = max(1, threads // workers) if threads else None
+    cache_before = ld_cache.stats() if ld_cache else None
+
+    report = []
+    futures = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for lead, row in zip(leads, lead_rows):
+            if row < 0:
+                print(f"Lead variant '{lead}' not found in the '{snp_col_name}' column, skipping.")
+                report.append((lead, None, None, None, None, 0, 0, 0.0, "not_found"))
+                continue
+            chrom, position = chroms[row], int(bp[row])
+            lo, hi = chrom_ranges[chrom]
+            start_pos = max(0, position - window_bp)
+            end_pos = position + window_bp
+            first = lo + int(np.searchsorted(bp[lo:hi], start_pos, side='left'))
+            last = lo + int(np.searchsorted(bp[lo:hi], end_pos, side='right'))
+            snps = pd.unique(ids[first:last]).tolist()
+            entry = (lead, chrom, position, start_pos, end_pos, len(snps))
+
+            plink_prefix = os.path.join(plink_ref_dir, f"{population}.{chrom}")
+            if not os.path.exists(f"{plink_prefix}.bed"):
+                print(f"{lead}: reference {plink_prefix}.bed not found, skipping.")
+                report.append(entry + (0, 0.0, "missing_reference"))
+                continue
+
+            stem = region_file_stem(lead)
+            if prune:
+                snps = prune_region_snps(df.iloc[first:last], snp_col_name, plink_prefix, prune, ids[row],
+                                         os.path.join(output_dir, f"{stem}.pruned.tsv"))
+            task_options = dict(ld_format=ld_format, ld_dtype=ld_dtype, ld_cache=ld_cache, ld_engine=ld_engine,
+                                population=population, chromosome=chrom, region=(start_pos, end_pos))
+            future = pool.submit(_ld_task, plink_exec, plink_prefix, snps,
+                                 os.path.join(output_dir, f"{stem}.{ld_ext}"),
+                                 os.path.join(output_dir, f"{stem}.snps.txt"),
+                                 os.path.join(output_dir, f".work_{stem}"), threads_per_job, task_options)
+            futures[future] = entry
+
+        for future in as_completed(futures):
+            entry = futures[future]
+            n_ld, status, seconds = future.result()
+            print(f"{entry[0]} (CHR {entry[1]}:{entry[3]}-{entry[4]}): {status} "
+                  f"({n_ld}/{entry[5]} SNPs, {seconds:.1f}s)")
+            report.append(entry + (n_ld, round(seconds, 3), status))
+
+    order = {lead: i for i, lead in enumerate(leads)}
+    report_df = pd.DataFrame(report, columns=['lead_variant', 'chromosome', 'position', 'start', 'end',
+                                              'n_snps', 'n_ld_snps', 'seconds', 'status'])
+    report_df = report_df.sort_values('lead_variant', key=lambda s: s.map(order)).reset_index(drop=True)
+    report_df[['position', 'start', 'end']] = report_df[['position', 'start', 'end']].astype('Int64')
+    report_path = timing_report or os.path.join(output_dir, "regions.tsv")
+    report_df.to_csv(report_path, sep='\t', index=False)
+    print(f"Region report written to {report_path}")
+    if ld_cache:
+        print(ld_cache.summary(cache_before))
+
+    failed = report_df[report_df['status'].str.startswith('failed')]
+    if not failed.empty:
+        sys.exit(f"LD computation failed for lead variant(s): {', '.join(failed['lead_variant'])}")
+    return report_df
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Calculate LD Matrix using PLINK.")
     parser.add_argument("--sumstats", required=True)
     parser.add_argument("--plink_ref_dir", required=True)
-    parser.add_argument("--chromosome", required=True, type=int)
+    parser.add_argument("--chromosome", required=False, type=int, default=None)
     parser.add_argument("--population", required=True)
-    parser.add_argument("--output_ld", required=True)
-    parser.add_argument("--output_snps", required=True)
+    parser.add_argument("--output_ld", required=False, default=None)
+    parser.add_argument("--output_snps", required=False, default=None)
 
     # Optional
     parser.add_argument("--lead_variant", required=False, default=None)
     parser.add_argument("--window", required=False, type=int, default=None)
+    parser.add_argument("--ld_format", choices=LD_FORMATS, default="text",
+                        help="'text': PLINK gzipped matrix; 'binary': memory-mappable matrix with SNP order header; "
+                             "'banded': whole-chromosome pairs within --band_window_kb/--band_window_snps.")
+    parser.add_argument("--ld_dtype", choices=list(LD_DTYPES), default="float32",
+                        help="Value type of the binary LD matrix.")
+    parser.add_argument("--band_window_kb", required=False, type=int, default=1000,
+                        help="Banded format: keep pairs at most this many kb apart.")
+    parser.add_argument("--band_window_snps", required=False, type=int, default=None,
+                        help="Banded format: also limit pairs to this many SNPs apart.")
+    parser.add_argument("--ld_engine", choices=LD_ENGINES, default="plink",
+                        help="'plink': run PLINK per request; 'numpy': compute r in-process from the memory-mapped .bed.")
+    parser.add_argument("--ld_cache_dir", required=False, default=None,
+                        help="Persistent LD cache directory; repeated or overlapping requests skip PLINK.")
+    parser.add_argument("--ld_cache_max_gb", required=False, type=float, default=None,
+                        help="Size cap of the LD cache; least recently used entries are evicted.")
+
+    # Region pruning (lead variant modes)
+    parser.add_argument("--prune_min_z", required=False, type=float, default=None,
+                        help="Enable pruning: keep SNPs with |z| >= this, or in LD with a signal (see region_prune.py).")
+    parser.add_argument("--prune_signal_z", required=False, type=float, default=DEFAULT_SIGNAL_Z,
+                        help="|z| that makes a SNP a signal (the lead always is).")
+    parser.add_argument("--prune_radius_kb", required=False, type=float, default=DEFAULT_RADIUS_KB,
+                        help="LD-clump radius around each signal.")
+    parser.add_argument("--prune_r2", required=False, type=float, default=DEFAULT_R2,
+                        help="r^2 with a signal (within the radius) that keeps a low-|z| SNP.")
+    parser.add_argument("--prune_record", required=False, default=None,
+                        help="Record of kept/dropped SNPs (default: <output_snps>.pruned.tsv).")
+
+    # Batch lead variant mode
+    parser.add_argument("--lead_variants", required=False, default=None,
+                        help="File of lead variant IDs (one per line, or a table with a SNP/ID column); "
+                             "one LD matrix per lead with --window, written to --output_dir.")
+
+    # Multi-chromosome mode
+    parser.add_argument("--chromosomes", required=False, default=None,
+                        help="Chromosomes to process in one run, e.g. '1-22', '1,2,X' or 'all'. "
+                             "Reference files are expected as {population}.{chr}.bed/bim/fam.")
+    parser.add_argument("--output_dir", required=False, default="ld_matrices",
+                        help="Directory for chr{N}.ld.gz (or .ldm/.ldband) / chr{N}.snps.txt in multi-chromosome mode.")
+    parser.add_argument("--workers", required=False, type=int, default=4,
+                        help="Maximum number of concurrent PLINK jobs.")
+    parser.add_argument("--threads", required=False, type=int, default=None,
+                        help="Total PLINK threads, split evenly between concurrent jobs.")
+    parser.add_argument("--timing_report", required=False, default=None,
+                        help="Per-task timing report (default: <output_dir>/timing_report.tsv, "
+                             "or <output_dir>/regions.tsv with --lead_variants).")
 
     args = parser.parse_args()
-    calculate_ld_matrix(
-        args.sumstats, args.plink_ref_dir, args.chromosome, args.population,
-        args.output_ld, args.output_snps, lead_variant=args.lead_variant, window_kb=args.window
-    )
+    ld_cache = LDCache(args.ld_cache_dir, args.ld_cache_max_gb) if args.ld_cache_dir else None
+    prune = (dict(signal_z=args.prune_signal_z, min_z=args.prune_min_z, radius_kb=args.prune_radius_kb,
+                  r2=args.prune_r2) if args.prune_min_z is not None else None)
+    if args.lead_variants:
+        if args.lead_variant or args.chromosomes:
+            parser.error("--lead_variants cannot be combined with --lead_variant or --chromosomes.")
+        try:
+            calculate_ld_for_leads(
+                args.sumstats, args.plink_ref_dir, args.lead_variants, args.population, args.window,
+                args.output_dir, workers=args.workers, threads=args.threads, timing_report=args.timing_report,
+                ld_format=args.ld_format, ld_dtype=args.ld_dtype, ld_cache=ld_cache, ld_engine=args.ld_engine,
+                prune=prune
+            )
+        except ValueError as e:
+            sys.exit(f"An error occurred: {e}")
+    elif args.chromosomes:
+        if args.lead_variant:
+            parser.error("--lead_variant cannot be combined with --chromosomes.")
+        calculate_ld_matrices(
+            args.sumstats, args.plink_ref_dir, parse_chromosomes(args.chromosomes), args.population,
+            args.output_dir, workers=args.workers, threads=args.threads, timing_report=args.timing_report,
+            ld_format=args.ld_format, ld_dtype=args.ld_dtype,
+            band_window_kb=args.band_window_kb, band_window_snps=args.band_window_snps, ld_cache=ld_cache,
+            ld_engine=args.ld_engine
+        )
+    else:
+        if args.chromosome is None or not args.output_ld or not args.output_snps:
+            parser.error("--chromosome, --output_ld and --output_snps are required without --chromosomes.")
+        calculate_ld_matrix(
+            args.sumstats, args.plink_ref_dir, args.chromosome, args.population,
+            args.output_ld, args.output_snps, lead_variant=args.lead_variant, window_kb=args.window,
+            ld_format=args.ld_format, ld_dtype=args.ld_dtype,
+            band_window_kb=args.band_window_kb, band_window_snps=args.band_window_snps, ld_cache=ld_cache,
+            ld_engine=args.ld_engine, prune=prune, prune_record=args.prune_record
+        )
 
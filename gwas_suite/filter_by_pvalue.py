@@ -1,44 +1,111 @@
 #!/usr/bin/env python3
 import argparse
+import csv
+import gzip
+import io
+import os
+import shutil
+import subprocess
 import pandas as pd
 import sys
 
-def filter_by_p_value(input_path, output_path, p_threshold):
+BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def open_input(input_path, threads):
+    """Open the input as a binary stream, decompressing gzip/bgzip with bgzip -@ (or pigz) when available"""
+    with open(input_path, 'rb') as f:
+        is_compressed = f.read(2) == b'\x1f\x8b'
+    if not is_compressed:
+        return open(input_path, 'rb'), None
+    for cmd in (['bgzip', '-dc', '-@', str(threads)], ['pigz', '-dc', '-p', str(threads)]):
+        if shutil.which(cmd[0]):
+            proc = subprocess.Popen(cmd + [input_path], stdout=subprocess.PIPE)
+            return proc.stdout, proc
+    return gzip.open(input_path, 'rb'), None
+
+
+def read_blocks(stream, block_bytes=BLOCK_BYTES):
+    """Yield blocks of whole lines (bytes, each ending in a newline) of about block_bytes"""
+    rest = b''
+    while True:
+        data = stream.read(block_bytes)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            rest = data
+            continue
+        rest = data[cut:]
+        yield data[:cut]
+    if rest:
+        yield rest if rest.endswith(b'\n') else rest + b'\n'
+
+
+def filter_block(block, n_columns, p_index, sep, p_threshold):
+    """Lines of the block whose P (column p_index) is below the threshold; only that column is parsed"""
+    # Rows end at '\n' only and quotes are not special, so there is exactly one
+    # parsed row per physical line; the '\r' of CRLF lines is stripped from P
+    p = pd.read_csv(io.BytesIO(block), sep=sep, header=None, names=range(n_columns), usecols=[p_index],
+                    skip_blank_lines=False, dtype=str, quoting=csv.QUOTE_NONE, lineterminator='\n',
+                    engine='c')[p_index]
+    keep = (pd.to_numeric(p.str.rstrip('\r'), errors='coerce') < p_threshold).to_numpy()
+    lines = block.split(b'\n')
+    return [lines[i] for i in keep.nonzero()[0]], len(keep)
+
+
+def filter_by_p_value(input_path, output_path, p_threshold, threads=None):
     """
     Filters a summary statistics file based on a p-value threshold.
+    Streams the input in blocks: only the P column is parsed, and matching
+    lines (and the header) are written through unchanged. gzip/bgzip input
+    is decompressed in a separate, multi-threaded process when bgzip or pigz
+    is installed.
     """
     print(f"Reading file: {input_path}")
+    threads = threads or os.cpu_count() or 1
+    stream, proc = open_input(input_path, threads)
     try:
-        df = pd.read_csv(input_path, sep='\t', low_memory=False)
-        df.columns = [col.upper() for col in df.columns]
+        header = stream.readline()
+        columns = [col.strip().upper() for col in header.decode().rstrip('\r\n').split('\t')]
 
         # Ensure 'P' column exists
-        if 'P' not in df.columns:
+        if 'P' not in columns:
             raise ValueError("Input file is missing required column: 'P'")
-
-        # Ensure P-value column is numeric, coercing errors to NaN
-        df['P'] = pd.to_numeric(df['P'], errors='coerce')
-        df.dropna(subset=['P'], inplace=True) # Drop rows where P is not a number
+        p_index = columns.index('P')
 
         print(f"Filtering rows where P < {p_threshold}")
-        original_rows = len(df)
-
-        # Perform the filtering
-        filtered_df = df[df['P'] < p_threshold].copy()
-
-        print(f"Kept {len(filtered_df)} of {original_rows} rows.")
+        original_rows, kept_rows = 0, 0
+        with open(output_path, 'wb') as out:
+            out.write(header)
+            for block in read_blocks(stream):
+                lines, n_rows = filter_block(block, len(columns), p_index, '\t', p_threshold)
+                original_rows += n_rows
+                kept_rows += len(lines)
+                if lines:
+                    out.write(b'\n'.join(lines) + b'\n')
+        if proc is not None and proc.wait() != 0:
+            raise ValueError(f"decompressing {input_path} failed")
 
-        print(f"Saving filtered file to: {output_path}")
-        filtered_df.to_csv(output_path, sep='\t', index=False)
+        print(f"Kept {kept_rows} of {original_rows} rows.")
+        print(f"Saved filtered file to: {output_path}")
         print("Done.")
 
     except Exception as e:
         sys.exit(f"An error occurred: {e}")
+    finally:
+        stream.close()
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Filter a summary statistics file by P-value.")
     parser.add_argument("--input", required=True, help="Path to the input summary statistics file.")
     parser.add_argument("--output", required=True, help="Path for the output file.")
     parser.add_argument("--threshold", required=True, type=float, help="P-value threshold (e.g., 5e-8).")
+    parser.add_argument("--threads", required=False, type=int, default=None,
+                        help="Decompression threads for gzip/bgzip input (default: all CPUs).")
     args = parser.parse_args()
-    filter_by_p_value(args.input, args.output, args.threshold)
\ No newline at end of file
+    filter_by_p_value(args.input, args.output, args.threshold, threads=args.threads)
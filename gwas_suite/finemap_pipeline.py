@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Fine-map every COJO independent signal of a trait in one job:
+COJO signals -> LD per signal window -> SuSiE per region.
+
+Each signal is resolved in the summary statistics (hash index on the SNP
+ID, searchsorted on its chromosome's positions for the window), then goes
+through two worker pools with separate limits:
+  - LD:    at most --ld_workers PLINK (or NumPy .bed) jobs at once, sharing
+           --threads PLINK threads;
+  - SuSiE: at most --susie_workers fits at once (PySuSiE / R, or the
+           built-in NumPy SuSiE-RSS), each worker parsing the sumstats once.
+A region's fit is submitted as soon as its LD matrix is written, so the
+stages overlap. LD matrices are written in the binary format, which the
+SuSiE workers memory-map.
+
+Outputs: one credible-set table (signal, chromosome, cs, SNP, BP, PIP), the
+PIPs of every region tagged by signal, and a per-signal report with the
+LD and SuSiE timings and status.
+"""
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from calc_ld_matrix import (LD_ENGINES, _ld_task, locate_plink, normalize_chromosome, read_sumstats,
+                            region_file_stem, resolve_lead_variants)
+from ld_cache import LDCache
+from run_pysusie import BACKENDS, PRECISIONS, _finemap_region_task
+
+REPORT_COLUMNS = ['signal', 'chromosome', 'position', 'n_snps', 'n_ld_snps', 'ld_seconds',
+                  'n_credible_sets', 'susie_seconds', 'peak_mb', 'status']
+
+
+def read_cojo_signals(paths):
+    """
+    Independent signals from one or more COJO .jma.cojo files (or any table
+    with a SNP column). The COJO 'n' column, if present, is kept as the
+    per-signal sample size. Duplicated SNPs are listed once.
+    """
+    tables = []
+    for path in paths:
+        table = pd.read_csv(path, sep=r'\s+', dtype=str, comment='#')
+        cols = {c.upper(): c for c in table.columns}
+        snp_col = cols.get('SNP') or cols.get('ID')
+        if snp_col is None:
+            raise ValueError(f"{path} has no SNP (or ID) column.")
+        signals = pd.DataFrame({'SNP': table[snp_col].str.strip()})
+        signals['n'] = pd.to_numeric(table[cols['N']], errors='coerce') if 'N' in cols else np.nan
+        tables.append(signals)
+    signals = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=['SNP', 'n'])
+    return signals.dropna(subset=['SNP']).drop_duplicates('SNP').reset_index(drop=True)
+
+
+def run_pipeline(cojo_files, sumstats_file, plink_ref_dir, population, window_kb, output_creds, output_pips,
+                 output_report=None, n=None, ld_workers=4, susie_workers=2, threads=None, backend='numpy',
+                 precision='float64', ld_engine='plink', ld_cache=None, work_dir='finemap_work', keep_ld=False):
+    """
+    Fine-map the window_kb window around every COJO signal. Per-signal
+    failures are recorded in the report and do not stop the other signals;
+    the run exits non-zero at the end if any signal failed.
+    """
+    plink_exec = locate_plink() if ld_engine == "plink" else None
+    signals = read_cojo_signals(cojo_files)
+    df, snp_col_name = read_sumstats(sumstats_file)
+    missing = [col for col in ('CHR', 'BP', 'BETA', 'SE') if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing column(s) in {sumstats_file}: {', '.join(missing)}")
+    # The SuSiE workers read exactly SNP/BETA/SE: give them that view of the
+    # file, whatever the case of its columns and whether it is keyed by SNP or ID
+    os.makedirs(work_dir, exist_ok=True)
+    susie_sumstats = os.path.join(work_dir, "sumstats.snp_beta_se.tsv")
+    df[[snp_col_name, 'BETA', 'SE']].set_axis(['SNP', 'BETA', 'SE'], axis=1).to_csv(
+        susie_sumstats, sep='\t', index=False)
+    print(f"Fine-mapping {len(signals)} COJO signal(s): {ld_workers} LD worker(s), "
+          f"{susie_workers} SuSiE worker(s).")
+
+    df = df.assign(CHR=df['CHR'].map(normalize_chromosome), BP=pd.to_numeric(df['BP'], errors='coerce'))
+    df = df.dropna(subset=['BP']).sort_values(['CHR', 'BP'], kind='stable').reset_index(drop=True)
+    chroms = df['CHR'].to_numpy()
+    bp = df['BP'].to_numpy(dtype=np.int64)
+    ids = df[snp_col_name].astype(str).to_numpy()
+    chrom_names, chrom_starts = np.unique(chroms, return_index=True)
+    chrom_ranges = dict(zip(chrom_names, zip(chrom_starts, np.append(chrom_starts[1:], len(df)))))
+    signal_rows = resolve_lead_variants(ids, signals['SNP'].tolist())
+    positions = pd.Series(bp, index=ids)
+    positions = positions[~positions.index.duplicated()]
+    del df
+
+    ld_dir = os.path.join(work_dir, "ld")
+    os.makedirs(ld_dir, exist_ok=True)
+    window_bp = window_kb * 1000
+    ld_workers = max(1, min(ld_workers, len(signals) or 1))
+    threads_per_job = max(1, threads // ld_workers) if threads else None
+    cache_before = ld_cache.stats() if ld_cache else None
+
+    report = {}
+    pip_tables, cs_rows = [], []
+    with ProcessPoolExecutor(max_workers=ld_workers) as ld_pool, \
+            ProcessPoolExecutor(max_workers=max(1, susie_workers)) as susie_pool:
+        ld_futures = {}
+        for signal, sample_size, row in zip(signals['SNP'], signals['n'], signal_rows):
+            if row < 0:
+                print(f"Signal '{signal}' not found in the '{snp_col_name}' column, skipping.")
+                report[signal] = [signal, None, None, 0, 0, 0.0, 0, 0.0, 0, "not_found"]
+                continue
+            chrom, position = chroms[row], int(bp[row])
+            lo, hi = chrom_ranges[chrom]
+            first = lo + int(np.searchsorted(bp[lo:hi], max(0, position - window_bp), side='left'))
+            last = lo + int(np.searchsorted(bp[lo:hi], position + window_bp, side='right'))
+            snps = pd.unique(ids[first:last]).tolist()
+            report[signal] = [signal, chrom, position, len(snps), 0, 0.0, 0, 0.0, 0, "pending"]
+
+            sample_size = n or sample_size
+            if not sample_size or np.isnan(sample_size):
+                print(f"{signal}: no sample size (pass --n or use COJO output with an 'n' column), skipping.")
+                report[signal][-1] = "no_sample_size"
+                continue
+            plink_prefix = os.path.join(plink_ref_dir, f"{population}.{chrom}")
+            if not os.path.exists(f"{plink_prefix}.bed"):
+                print(f"{signal}: reference {plink_prefix}.bed not found, skipping.")
+                report[signal][-1] = "missing_reference"
+                continue
+
+            stem = region_file_stem(signal)
+            ld_path = os.path.join(ld_dir, f"{stem}.ldm")
+            snps_path = os.path.join(ld_dir, f"{stem}.snps.txt")
+            task_options = dict(ld_format="binary", ld_dtype="float32", ld_cache=ld_cache, ld_engine=ld_engine,
+                                population=population, chromosome=chrom,
+                                region=(max(0, position - window_bp), position + window_bp))
+            future = ld_pool.submit(_ld_task, plink_exec, plink_prefix, snps, ld_path, snps_path,
+                                    os.path.join(work_dir, f".work_{stem}"), threads_per_job, task_options)
+            ld_futures[future] = (signal, int(sample_size), ld_path, snps_path)
+
+        # Hand each region to the SuSiE pool as soon as its LD is ready
+        susie_futures = {}
+        for future in as_completed(ld_futures):
+            signal, sample_size, ld_path, snps_path = ld_futures[future]
+            n_ld, status, seconds = future.result()
+            entry = report[signal]
+            entry[4], entry[5] = n_ld, round(seconds, 3)
+            print(f"{signal}: LD {status} ({n_ld}/{entry[3]} SNPs, {seconds:.1f}s)")
+            if status != "ok":
+                entry[-1] = status if status.startswith("failed") else "no_ld_overlap"
+                continue
+            susie_futures[susie_pool.submit(_finemap_region_task, signal, susie_sumstats, ld_path, snps_path,
+                                            sample_size, backend, precision)] = (signal, ld_path, snps_path)
+
+        for future in as_completed(susie_futures):
+            signal, ld_path, snps_path = susie_futures[future]
+            pips, rows, summary = future.result()
+            entry = report[signal]
+            entry[6], entry[7], entry[8], entry[9] = summary[2], summary[3], summary[4], summary[5]
+            print(f"{signal}: SuSiE {summary[5]} ({summary[1]} SNPs, {summary[2]} credible sets, {summary[3]}s)")
+            if pips is not None:
+                pip_tables.append(pips)
+            cs_rows.extend(rows)
+            if not keep_ld:
+                for path in (ld_path, snps_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    if ld_cache:
+        print(ld_cache.summary(cache_before))
+    if not keep_ld:
+        shutil.rmtree(ld_dir, ignore_errors=True)
+    os.remove(susie_sumstats)
+
+    order = {signal: i for i, signal in enumerate(signals['SNP'])}
+    by_signal = lambda s: s.map(order)
+    pips = (pd.concat(pip_tables, ignore_index=True) if pip_tables
+            else pd.DataFrame(columns=['region', 'SNP', 'PIP']))
+    pips = pips.rename(columns={'region': 'signal'}).sort_values('signal', key=by_signal, kind='stable')
+    pips.to_csv(output_pips, sep='\t', index=False)
+
+    creds = pd.DataFrame(cs_rows, columns=['signal', 'cs', 'SNP'])
+    creds = creds.merge(pips, on=['signal', 'SNP'], how='left')
+    creds.insert(1, 'chromosome', creds['signal'].map({s: r[1] for s, r in report.items()}))
+    creds.insert(4, 'BP', creds['SNP'].map(positions).astype('Int64'))
+    creds = creds.sort_values(['signal', 'cs', 'PIP'], ascending=[True, True, False], kind='stable',
+                              key=lambda s: by_signal(s) if s.name == 'signal' else s)
+    creds.to_csv(output_creds, sep='\t', index=False)
+    print(f"{creds['SNP'].nunique()} SNP(s) in {len(creds.groupby(['signal', 'cs']))} credible set(s) "
+          f"written to {output_creds}")
+
+    report_df = pd.DataFrame(list(report.values()), columns=REPORT_COLUMNS)
+    report_df['position'] = report_df['position'].astype('Int64')
+    report_df = report_df.sort_values('signal', key=by_signal).reset_index(drop=True)
+    if output_report:
+        report_df.to_csv(output_report, sep='\t', index=False)
+        print(f"Signal report written to {output_report}")
+
+    failed = report_df[report_df['status'].str.startswith('failed')]
+    if not failed.empty:
+        print(f"Fine-mapping failed for {len(failed)} signal(s): {', '.join(failed['signal'])}", file=sys.stderr)
+        sys.exit(1)
+    return report_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-map COJO independent signals: LD and SuSiE per signal.")
+    parser.add_argument("--cojo", required=True, nargs='+',
+                        help="COJO .jma.cojo file(s), e.g. one per chromosome, or any table with a SNP column.")
+    parser.add_argument("--sumstats", required=True,
+                        help="Summary statistics with SNP (or ID), CHR, BP, BETA and SE columns.")
+    parser.add_argument("--plink_ref_dir", required=True,
+                        help="Reference panel directory with {population}.{chr}.bed/bim/fam.")
+    parser.add_argument("--population", required=True)
+    parser.add_argument("--window", type=int, default=500, help="Window around each signal, in kb.")
+    parser.add_argument("--n", type=int, default=None,
+                        help="GWAS sample size (default: the COJO 'n' column of each signal).")
+    parser.add_argument("--output_creds", required=True, help="Consolidated credible-set table (TSV).")
+    parser.add_argument("--output_pips", required=True, help="PIPs of every region, tagged by signal (TSV).")
+    parser.add_argument("--output_report", required=False, default=None, help="Per-signal status/timing table.")
+    parser.add_argument("--ld_workers", type=int, default=4, help="Maximum number of concurrent LD (PLINK) jobs.")
+    parser.add_argument("--susie_workers", type=int, default=2, help="Maximum number of concurrent SuSiE fits.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Total PLINK threads, split evenly between concurrent LD jobs.")
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy",
+                        help="pysusie, or numpy for the built-in SuSiE-RSS (no R/rpy2 needed).")
+    parser.add_argument("--precision", choices=list(PRECISIONS), default="float64",
+                        help="LD matrix precision for SuSiE; float32 halves its memory.")
+    parser.add_argument("--ld_engine", choices=LD_ENGINES, default="plink",
+                        help="'plink': run PLINK per signal; 'numpy': compute r in-process from the .bed.")
+    parser.add_argument("--ld_cache_dir", required=False, default=None,
+                        help="Persistent LD cache directory; overlapping signal windows skip PLINK.")
+    parser.add_argument("--ld_cache_max_gb", required=False, type=float, default=None)
+    parser.add_argument("--work_dir", default="finemap_work", help="Directory for the per-signal LD matrices.")
+    parser.add_argument("--keep_ld", action="store_true",
+                        help="Keep the per-signal LD matrices (<work_dir>/ld/<signal>.ldm) after fine-mapping.")
+    args = parser.parse_args()
+
+    ld_cache = LDCache(args.ld_cache_dir, args.ld_cache_max_gb) if args.ld_cache_dir else None
+    try:
+        run_pipeline(args.cojo, args.sumstats, args.plink_ref_dir, args.population, args.window,
+                     args.output_creds, args.output_pips, output_report=args.output_report, n=args.n,
+                     ld_workers=args.ld_workers, susie_workers=args.susie_workers, threads=args.threads,
+                     backend=args.backend, precision=args.precision, ld_engine=args.ld_engine, ld_cache=ld_cache,
+                     work_dir=args.work_dir, keep_ld=args.keep_ld)
+    except ValueError as e:
+        sys.exit(f"An error occurred: {e}")
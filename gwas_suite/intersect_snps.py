@@ -1,38 +1,97 @@
 #!/usr/bin/env python3
 import argparse
+import os
+import numpy as np
 import pandas as pd
 import sys
 
-def find_intersecting_snps(file1_path, col1, file2_path, col2, output_path):
+CHUNKSIZE = 2_000_000
+
+def read_id_column(file_path, col_index, skiprows, chunksize=None):
+    """The ID column of a TSV as strings (whole, or in chunks); only this column is parsed."""
+    return pd.read_csv(file_path, sep='\t', header=None, usecols=[col_index], skiprows=skiprows, dtype=str,
+                       chunksize=chunksize)
+
+def hash_ids(values):
+    """64-bit hashes of string IDs (vectorised; the IDs themselves stay an object array)"""
+    return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+
+def build_hash_index(ids):
+    """
+    The distinct IDs of the smaller file (row of the first occurrence of
+    each), sorted by their 64-bit hash. IDs whose hashes collide are all
+    kept, next to each other; probe() compares the strings themselves.
+    """
+    present = ids.notna().to_numpy()
+    first = present & ~ids.duplicated().to_numpy()
+    rows = np.flatnonzero(first)
+    values = ids.to_numpy(dtype=object)[rows]
+    hashes = hash_ids(values)
+    order = np.argsort(hashes, kind='stable')
+    return hashes[order], rows[order], values[order]
+
+def probe(index, ids, row_offset):
+    """(ID, row in the probed file, row in the indexed file) of the chunk's IDs found in the index"""
+    hashes, index_rows, index_values = index
+    present = ids.notna().to_numpy()
+    values = ids.to_numpy(dtype=object)[present]
+    rows = np.flatnonzero(present) + row_offset
+    if not len(hashes) or not len(values):
+        return values[:0], rows[:0], rows[:0]
+    h = hash_ids(values)
+    left = np.searchsorted(hashes, h, side='left')
+    counts = np.searchsorted(hashes, h, side='right') - left
+    # One candidate per index entry with the same hash (more than one only on a collision)
+    query = np.repeat(np.arange(len(values)), counts)
+    pos = np.repeat(left - np.cumsum(counts) + counts, counts) + np.arange(len(query))
+    hit = index_values[pos] == values[query]
+    return values[query[hit]], rows[query[hit]], index_rows[pos[hit]]
+
+def find_intersecting_snps(file1_path, col1, file2_path, col2, output_path, output_indices=None,
+                           chunksize=CHUNKSIZE):
     """
     Finds the intersection of SNP IDs from two files based on specified columns.
+    The IDs of the smaller file are hashed to 64-bit integers and indexed;
+    the larger file is streamed in chunks and probed against that index, so
+    only one file's IDs are ever held in memory. With output_indices, each
+    overlapping ID is also written with its 0-based data row in both files
+    (first occurrence).
     """
     try:
-        print(f"Reading SNP IDs from file 1: {file1_path}, column {col1}")
         # Adjust for 1-based column numbers from Galaxy to 0-based for pandas
-        col1_index = col1 - 1
-        df1 = pd.read_csv(file1_path, sep='\t', header=None, usecols=[col1_index], low_memory=False, skiprows=1)
-        snps_file1 = set(df1.iloc[:, 0].dropna().astype(str))
-        print(f"Found {len(snps_file1)} unique SNP IDs in file 1.")
+        # File 1 has a header line, file 2 (e.g. a .bim) does not
+        files = [(file1_path, col1 - 1, 1), (file2_path, col2 - 1, 0)]
+        small, large = (0, 1) if os.path.getsize(file1_path) <= os.path.getsize(file2_path) else (1, 0)
+
+        path, col_index, skiprows = files[small]
+        print(f"Indexing SNP IDs from file {small + 1}: {path}, column {col_index + 1}")
+        index = build_hash_index(read_id_column(path, col_index, skiprows).iloc[:, 0])
+        print(f"Found {len(index[0])} unique SNP IDs in file {small + 1}.")
 
-        print(f"Reading SNP IDs from file 2: {file2_path}, column {col2}")
-        col2_index = col2 - 1
-        df2 = pd.read_csv(file2_path, sep='\t', header=None, usecols=[col2_index], low_memory=False)
-        snps_file2 = set(df2.iloc[:, 0].dropna().astype(str))
-        print(f"Found {len(snps_file2)} unique SNP IDs in file 2.")
+        path, col_index, skiprows = files[large]
+        print(f"Streaming SNP IDs from file {large + 1}: {path}, column {col_index + 1}")
+        found, n_rows = [], 0
+        for chunk in read_id_column(path, col_index, skiprows, chunksize=chunksize):
+            ids, large_rows, small_rows = probe(index, chunk.iloc[:, 0], n_rows)
+            n_rows += len(chunk)
+            found.append(pd.DataFrame({'SNP': ids, f'row{large + 1}': large_rows, f'row{small + 1}': small_rows}))
+        print(f"Read {n_rows} rows from file {large + 1}.")
 
         print("Finding intersection...")
-        intersection = snps_file1.intersection(snps_file2)
-        
-        print(f"Found {len(intersection)} overlapping SNP IDs.")
+        matches = (pd.concat(found, ignore_index=True) if found
+                   else pd.DataFrame(columns=['SNP', 'row1', 'row2']))
+        matches = matches.drop_duplicates('SNP').sort_values('SNP').reset_index(drop=True)
+        print(f"Found {len(matches)} overlapping SNP IDs.")
 
         with open(output_path, 'w') as f:
-            if intersection:
-                for snp_id in sorted(list(intersection)):
-                    f.write(f"{snp_id}\n")
+            if len(matches):
+                matches['SNP'].to_csv(f, index=False, header=False)
             else:
                 f.write("No overlapping SNPs found between the two files.\n")
-        
+        if output_indices:
+            matches[['SNP', 'row1', 'row2']].to_csv(output_indices, sep='\t', index=False)
+            print(f"Row indices written to {output_indices}")
+
         print("Done.")
 
     except Exception as e:
@@ -45,6 +104,11 @@ if __name__ == "__main__":
     parser.add_argument("--file2", required=True, help="Second input file (e.g., BIM file).")
     parser.add_argument("--col2", required=True, type=int, help="1-based column number for SNP IDs in the second file.")
     parser.add_argument("--output", required=True, help="Path for the output file with intersecting IDs.")
-    
+    parser.add_argument("--output_indices", required=False, default=None,
+                        help="Optional TSV of overlapping IDs with their 0-based data row in each file (SNP, row1, row2).")
+    parser.add_argument("--chunksize", required=False, type=int, default=CHUNKSIZE,
+                        help="Rows of the larger file read per chunk.")
+
     args = parser.parse_args()
-    find_intersecting_snps(args.file1, args.col1, args.file2, args.col2, args.output)
+    find_intersecting_snps(args.file1, args.col1, args.file2, args.col2, args.output,
+                           output_indices=args.output_indices, chunksize=args.chunksize)
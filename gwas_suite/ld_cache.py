@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk cache of LD matrices, so repeated or overlapping region
+requests against the same reference panel do not rerun PLINK.
+
+Entries are keyed by the reference panel (bfile prefix plus the size/mtime
+of its .bed/.bim, so a replaced panel never serves stale LD), population,
+chromosome and the sorted set of requested SNPs. A request whose SNPs are a
+subset of a cached request (e.g. a narrower window around a nearby lead) is
+served by slicing that entry. The cache is capped in size and evicts least
+recently used entries; hit/miss/eviction counters persist with it.
+
+Layout under cache_dir:
+  index.sqlite                   entries + counters
+  entries/<key>/ld.npy           float32 matrix in result SNP order
+  entries/<key>/snps.txt         result SNPs (those found in the panel)
+  entries/<key>/requested.txt    SNPs that were asked for
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'GWAS_LD_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'gwas_suite', 'ld'))
+DEFAULT_MAX_GB = float(os.environ.get('GWAS_LD_CACHE_MAX_GB', 20))
+# How many candidate entries to check for a superset before giving up
+MAX_OVERLAP_CANDIDATES = 20
+
+
+def panel_fingerprint(plink_prefix):
+    """Identify a reference panel by real path, size and mtime of its .bed/.bim"""
+    parts = []
+    for ext in ('.bed', '.bim'):
+        path = os.path.realpath(plink_prefix + ext)
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}\0{st.st_size}\0{st.st_mtime_ns}")
+        except OSError:
+            parts.append(path)
+    return hashlib.sha1('\0'.join(parts).encode()).hexdigest()
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def _write_lines(path, values):
+    with open(path, 'w') as f:
+        for value in values:
+            f.write(f"{value}\n")
+
+
+class LDCache:
+    """LRU-evicting LD matrix cache shared by every process on the node.
+
+    Safe to pass to worker processes: the SQLite connection is opened lazily
+    and not pickled.
+    """
+
+    def __init__(self, cache_dir=None, max_gb=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = int((DEFAULT_MAX_GB if max_gb is None else max_gb) * 1024 ** 3)
+        self._db = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'] = None
+        return state
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(os.path.join(self.cache_dir, 'entries'), exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), timeout=60,
+                                       isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, panel TEXT, population TEXT, chromosome TEXT,
+                start INTEGER, end INTEGER, n_requested INTEGER, n_snps INTEGER,
+                bytes INTEGER, created REAL, last_used REAL, hits INTEGER DEFAULT 0)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_panel ON entries (panel, population, chromosome)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+        return self._db
+
+    def _count(self, name, n=1):
+        self.db.execute("INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                        (name, n, n))
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, 'entries', key)
+
+    @staticmethod
+    def make_key(panel, population, chromosome, snps):
+        digest = hashlib.sha1(f"{panel}\0{population}\0{chromosome}\0".encode())
+        for snp in sorted(set(map(str, snps))):
+            digest.update(snp.encode() + b'\0')
+        return digest.hexdigest()
+
+    def _load(self, key, requested=None):
+        """(matrix, snps) of an entry, restricted to the requested SNPs if given"""
+        entry = self._entry_dir(key)
+        snps = _read_lines(os.path.join(entry, 'snps.txt'))
+        matrix = np.load(os.path.join(entry, 'ld.npy'), mmap_mode='r')
+        if requested is not None:
+            idx = [i for i, snp in enumerate(snps) if snp in requested]
+            if len(idx) != len(snps):
+                snps = [snps[i] for i in idx]
+                matrix = matrix[np.ix_(idx, idx)]
+        self.db.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        return np.array(matrix, dtype=np.float32), snps
+
+    def lookup(self, plink_prefix, population, chromosome, snps, start=None, end=None):
+        """
+        Return (matrix, result SNPs) for the requested SNPs, or None on a miss.
+        start/end (bp) narrow the search for a covering entry; they are
+        optional, SNP membership is what decides a hit.
+        """
+        panel = panel_fingerprint(plink_prefix)
+        chromosome = str(chromosome)
+        requested = set(map(str, snps))
+        key = self.make_key(panel, population, chromosome, requested)
+
+        row = self.db.execute("SELECT key FROM entries WHERE key = ?", (key,)).fetchone()
+        if row:
+            try:
+                result = self._load(key)
+                self._count('hits')
+                return result
+            except OSError:
+                pass  # evicted by another process in the meantime
+
+        query = ("SELECT key FROM entries WHERE panel = ? AND population = ? AND chromosome = ? "
+                 "AND n_requested > ?")
+        params = [panel, population, chromosome, len(requested)]
+        if start is not None and end is not None:
+            query += " AND (start IS NULL OR start <= ?) AND (end IS NULL OR end >= ?)"
+            params += [start, end]
+        query += " ORDER BY n_requested LIMIT ?"
+        params.append(MAX_OVERLAP_CANDIDATES)
+        for (candidate,) in self.db.execute(query, params).fetchall():
+            try:
+                cached_request = set(_read_lines(os.path.join(self._entry_dir(candidate), 'requested.txt')))
+            except OSError:
+                continue
+            if requested <= cached_request:
+                try:
+                    result = self._load(candidate, requested)
+                except OSError:
+                    continue
+                self._count('hits')
+                self._count('overlap_hits')
+                return result
+
+        self._count('misses')
+        return None
+
+    def store(self, plink_prefix, population, chromosome, snps, matrix, result_snps, start=None, end=None):
+        """Add an LD matrix computed for the requested snps, then evict down to the size cap"""
+        panel = panel_fingerprint(plink_prefix)
+        chromosome = str(chromosome)
+        requested = sorted(set(map(str, snps)))
+        key = self.make_key(panel, population, chromosome, requested)
+
+        # Build the entry next to its final place and publish it with one rename
+        tmp = f"{self._entry_dir(key)}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, 'ld.npy'), np.asarray(matrix, dtype=np.float32))
+        _write_lines(os.path.join(tmp, 'snps.txt'), result_snps)
+        _write_lines(os.path.join(tmp, 'requested.txt'), requested)
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        try:
+            os.rename(tmp, self._entry_dir(key))
+        except OSError:
+            if self.db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                # Another process stored the same entry first
+                shutil.rmtree(tmp, ignore_errors=True)
+                return key
+            # Leftover directory without an index row: replace it
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            os.rename(tmp, self._entry_dir(key))
+
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                        (key, panel, population, chromosome, start, end, len(requested), len(result_snps),
+                         size, now, now))
+        self.evict()
+        return key
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+            evicted = []
+            if total > self.max_bytes:
+                for key, size in self.db.execute("SELECT key, bytes FROM entries ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    evicted.append(key)
+                    total -= size
+                if evicted:
+                    self._count('evictions', len(evicted))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        for key in evicted:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        return len(evicted)
+
+    def stats(self):
+        """Persistent counters plus current size"""
+        stats = {'hits': 0, 'overlap_hits': 0, 'misses': 0, 'evictions': 0}
+        stats.update(dict(self.db.execute("SELECT name, value FROM stats").fetchall()))
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        stats.update(entries=entries, bytes=size)
+        return stats
+
+    def summary(self, before=None):
+        """One-line report; with `before` (an earlier stats()) counts only the difference"""
+        now = self.stats()
+        delta = {k: now[k] - (before or {}).get(k, 0) for k in ('hits', 'overlap_hits', 'misses', 'evictions')}
+        return (f"LD cache: {delta['hits']} hit(s) ({delta['overlap_hits']} from overlapping regions), "
+                f"{delta['misses']} miss(es), {delta['evictions']} eviction(s); "
+                f"{now['entries']} entries, {now['bytes'] / 1024 ** 2:.1f} MB in {self.cache_dir}")
@@ -1,45 +1,105 @@
 #!/usr/bin/env python3
 import argparse
+import os
 import pandas as pd
 import sys
 
-def format_gwas_for_cojo(gwas_file, output_file):
+# Columns we need and their final names for GCTA
+COLUMN_MAP = {
+    'SNP': 'SNP',
+    'A1': 'A1',
+    'A2': 'A2',
+    'FRQ': 'freq',
+    'BETA': 'b',
+    'SE': 'se',
+    'P': 'p',
+    'N': 'N'
+}
+CHR_COLUMNS = ('CHR', 'CHROM', 'CHROMOSOME')
+DEFAULT_CHUNKSIZE = 500_000
+
+
+def _normalize_chromosome(value):
+    value = str(value).strip()
+    return value[3:] if value.lower().startswith('chr') else value
+
+
+def read_cojo_chunks(gwas_file, by_chromosome=False, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield the COJO columns of a GWAS file in chunks of `chunksize` rows,
+    renamed for GCTA (plus CHR first if by_chromosome). Only these columns
+    are parsed, all as strings, so values reach the output as written in the
+    input. Column names are matched case-insensitively.
+    """
+    header = pd.read_csv(gwas_file, sep='\t', nrows=0).columns
+    by_upper = {col.upper(): col for col in header}
+    missing = [col for col in COLUMN_MAP if col not in by_upper]
+    if missing:
+        raise ValueError(f"Missing column(s) in {gwas_file}: {', '.join(missing)}")
+    names = {by_upper[col]: new for col, new in COLUMN_MAP.items()}
+    if by_chromosome:
+        chr_col = next((by_upper[c] for c in CHR_COLUMNS if c in by_upper), None)
+        if chr_col is None:
+            raise ValueError(f"Writing per-chromosome files needs a CHR column in {gwas_file}.")
+        names[chr_col] = 'CHR'
+
+    reader = pd.read_csv(gwas_file, sep='\t', usecols=list(names), dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        yield chunk.rename(columns=names)
+
+
+def format_gwas_for_cojo(gwas_file, output_file=None, output_dir=None, chunksize=DEFAULT_CHUNKSIZE):
     """
     Reads a GWAS summary statistics file and formats it for GCTA-COJO.
-    Selects and renames the required columns.
+    Selects and renames the required columns, streaming chunks to
+    output_file, or to output_dir/chr{N}.ma (one file per chromosome) when
+    output_dir is given. Memory use is bounded by the chunk size.
     """
+    columns = list(COLUMN_MAP.values())
+    outputs = {}
+    n_rows = 0
     try:
-        # Read the input GWAS file
-        df = pd.read_csv(gwas_file, sep='\t', low_memory=False)
-
-        # Normalize column names to uppercase for easier matching
-        df.columns = [col.upper() for col in df.columns]
-
-        # Define the columns we need and their final names for GCTA
-        column_map = {
-            'SNP': 'SNP',
-            'A1': 'A1',
-            'A2': 'A2',
-            'FRQ': 'freq',
-            'BETA': 'b',
-            'SE': 'se',
-            'P': 'p',
-            'N': 'N'
-        }
-
-        # Select and rename the columns
-        cojo_df = df[list(column_map.keys())].rename(columns=column_map)
-
-        # Save the formatted file
-        cojo_df.to_csv(output_file, sep='\t', index=False)
-        print(f"Successfully formatted GWAS data for COJO and saved to {output_file}")
-
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        for chunk in read_cojo_chunks(gwas_file, by_chromosome=bool(output_dir), chunksize=chunksize):
+            n_rows += len(chunk)
+            if not output_dir:
+                chunk[columns].to_csv(output_file, sep='\t', index=False, header=not outputs,
+                                      mode='a' if outputs else 'w')
+                outputs[output_file] = True
+                continue
+            for chrom, group in chunk.groupby(chunk['CHR'].map(_normalize_chromosome), sort=False):
+                path = os.path.join(output_dir, f"chr{chrom}.ma")
+                if path not in outputs:
+                    outputs[path] = open(path, 'w')
+                    outputs[path].write('\t'.join(columns) + '\n')
+                group[columns].to_csv(outputs[path], sep='\t', index=False, header=False)
+        if not outputs and output_file:
+            # Header-only output for an input without data rows
+            pd.DataFrame(columns=columns).to_csv(output_file, sep='\t', index=False)
     except Exception as e:
         sys.exit(f"An error occurred during data formatting: {e}")
+    finally:
+        for handle in outputs.values():
+            if hasattr(handle, 'close'):
+                handle.close()
+
+    if output_dir:
+        print(f"Successfully formatted {n_rows} variants for COJO into {len(outputs)} per-chromosome "
+              f"file(s) in {output_dir}")
+    else:
+        print(f"Successfully formatted GWAS data for COJO and saved to {output_file}")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Format GWAS summary statistics for GCTA-COJO.")
     parser.add_argument("--gwas", required=True, help="Input GWAS summary statistics file.")
-    parser.add_argument("--output", required=True, help="Path for the formatted output file.")
+    parser.add_argument("--output", required=False, default=None, help="Path for the formatted output file.")
+    parser.add_argument("--output_dir", required=False, default=None,
+                        help="Write one COJO input per chromosome (chr{N}.ma) here instead; needs a CHR column.")
+    parser.add_argument("--chunksize", required=False, type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Rows parsed per chunk; bounds memory use.")
     args = parser.parse_args()
-    format_gwas_for_cojo(args.gwas, args.output)
+    if bool(args.output) == bool(args.output_dir):
+        parser.error("Exactly one of --output and --output_dir is required.")
+    format_gwas_for_cojo(args.gwas, args.output, output_dir=args.output_dir, chunksize=args.chunksize)
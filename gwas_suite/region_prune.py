@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Pre-filter a fine-mapping region before LD is computed, so SuSiE sees only
+variants that can matter.
+
+Signals are the SNPs with |z| >= signal_z (always including any forced
+lead; the top SNP if none reaches the threshold). A SNP is kept if
+  - its own |z| >= min_z, or
+  - it lies within radius_kb of a signal and has r^2 >= r2 with it
+    (r from the reference .bed; without genotypes the radius alone decides).
+With a .bed, SNPs missing from it are only kept on their own |z|, and none
+are rescued if no signal is in it.
+Everything else is dropped. The returned record lists every input SNP with
+the reason it was kept or dropped, so results on the pruned set can be
+expanded back to the full SNP list (dropped SNPs get PIP 0).
+
+Run as a script to prune a sumstats region and write the kept SNP list and
+the record.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SIGNAL_Z = 5.45   # two-sided p = 5e-8
+DEFAULT_MIN_Z = 2.0
+DEFAULT_RADIUS_KB = 250
+DEFAULT_R2 = 0.1
+BLOCK_SNPS = 2048
+
+RECORD_COLUMNS = ['SNP', 'BP', 'Z', 'kept', 'reason', 'signal', 'r2_signal']
+
+
+def marginal_z(df):
+    """Z from a Z column, or BETA/SE (columns matched case-insensitively)"""
+    cols = {c.upper(): c for c in df.columns}
+    if 'Z' in cols:
+        return pd.to_numeric(df[cols['Z']], errors='coerce').to_numpy(dtype=np.float64)
+    if 'BETA' in cols and 'SE' in cols:
+        beta = pd.to_numeric(df[cols['BETA']], errors='coerce').to_numpy(dtype=np.float64)
+        se = pd.to_numeric(df[cols['SE']], errors='coerce').to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return beta / se
+    raise ValueError("Pruning needs a Z column or BETA and SE columns in the summary statistics.")
+
+
+def prune_region(snps, z, bp, bed=None, signal_z=DEFAULT_SIGNAL_Z, min_z=DEFAULT_MIN_Z,
+                 radius_kb=DEFAULT_RADIUS_KB, r2=DEFAULT_R2, force_signals=()):
+    """
+    Decide which SNPs of a region to keep. bed is an optional bed_ld.BedFile
+    of the reference panel for r^2 with the signals. Returns the record as
+    a DataFrame (RECORD_COLUMNS, in input order).
+    """
+    snps = np.asarray(snps, dtype=str)
+    z = np.nan_to_num(np.asarray(z, dtype=np.float64))
+    bp = np.asarray(bp, dtype=np.int64)
+    abs_z = np.abs(z)
+    n = len(snps)
+
+    is_signal = abs_z >= signal_z
+    is_signal |= np.isin(snps, list(force_signals))
+    if not is_signal.any() and n:
+        is_signal[np.argmax(abs_z)] = True
+    signals = np.flatnonzero(is_signal)
+
+    reason = np.where(is_signal, 'signal', np.where(abs_z >= min_z, 'z', 'dropped')).astype(object)
+    best_signal = np.full(n, -1)
+    best_r2 = np.full(n, np.nan)
+
+    candidates = np.flatnonzero(reason == 'dropped')
+    radius_bp = radius_kb * 1000
+    if len(candidates) and len(signals):
+        if bed is not None:
+            cand_rows = bed.snp_rows(snps[candidates])
+            sig_rows = bed.snp_rows(snps[signals])
+            signals, sig_rows = signals[sig_rows >= 0], sig_rows[sig_rows >= 0]
+            candidates, cand_rows = candidates[cand_rows >= 0], cand_rows[cand_rows >= 0]
+            # No signal in the panel: there is no r^2 to rescue a SNP by
+            if not len(signals):
+                candidates = candidates[:0]
+            z_sig = bed.standardized(sig_rows) if len(signals) else None
+        for start in range(0, len(candidates), BLOCK_SNPS):
+            block = candidates[start:start + BLOCK_SNPS]
+            near = np.abs(bp[block][:, None] - bp[signals][None, :]) <= radius_bp
+            if bed is not None:
+                r = bed.standardized(cand_rows[start:start + BLOCK_SNPS]) @ z_sig.T
+                score = np.where(near, np.nan_to_num(r.astype(np.float64) ** 2), -1.0)
+                hit = score.max(axis=1) >= r2
+            else:
+                score = np.where(near, 1.0, -1.0)
+                hit = near.any(axis=1)
+            best = score.argmax(axis=1)
+            best_signal[block] = np.where(score.max(axis=1) >= 0, signals[best], -1)
+            if bed is not None:
+                best_r2[block] = np.where(score.max(axis=1) >= 0, score.max(axis=1), np.nan)
+            reason[block[hit]] = 'ld' if bed is not None else 'radius'
+
+    kept = reason != 'dropped'
+    return pd.DataFrame({
+        'SNP': snps, 'BP': bp, 'Z': z, 'kept': kept, 'reason': reason,
+        'signal': np.where(best_signal >= 0, snps[np.maximum(best_signal, 0)], ''),
+        'r2_signal': np.round(best_r2, 4),
+    }, columns=RECORD_COLUMNS)
+
+
+def summarize(record):
+    counts = record['reason'].value_counts()
+    return (f"Pruning kept {int(record['kept'].sum())} of {len(record)} SNPs "
+            f"({counts.get('signal', 0)} signal(s), {counts.get('z', 0)} by |z|, "
+            f"{counts.get('ld', 0) + counts.get('radius', 0)} by LD/radius; "
+            f"{counts.get('dropped', 0)} dropped).")
+
+
+def expand_to_full(result, record, snp_col='SNP', fill=None):
+    """
+    Report a per-SNP result table of the kept SNPs on the full SNP list:
+    dropped SNPs are appended with the fill values (e.g. {'PIP': 0.0}) and a
+    PRUNED column marks them. Kept rows keep their order and come first.
+    """
+    dropped = record.loc[~record['kept'], 'SNP']
+    extra = pd.DataFrame({snp_col: dropped.to_numpy()})
+    for col, value in (fill or {}).items():
+        extra[col] = value
+    return pd.concat([result.assign(PRUNED=False), extra.assign(PRUNED=True)], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune a fine-mapping region by marginal z and LD with its signals.")
+    parser.add_argument("--sumstats", required=True, help="Region summary statistics (SNP, BP and Z or BETA/SE)")
+    parser.add_argument("--bfile", required=False, default=None, help="Reference PLINK prefix for r^2 (optional)")
+    parser.add_argument("--signal_z", type=float, default=DEFAULT_SIGNAL_Z)
+    parser.add_argument("--min_z", type=float, default=DEFAULT_MIN_Z)
+    parser.add_argument("--radius_kb", type=float, default=DEFAULT_RADIUS_KB)
+    parser.add_argument("--r2", type=float, default=DEFAULT_R2)
+    parser.add_argument("--output_snps", required=True, help="Kept SNP IDs, one per line")
+    parser.add_argument("--output_record", required=True, help="Per-SNP record of what was kept or dropped")
+    args = parser.parse_args()
+
+    try:
+        df = pd.read_csv(args.sumstats, sep=None, engine='python')
+        cols = {c.upper(): c for c in df.columns}
+        snp_col = cols.get('SNP') or cols.get('ID')
+        if snp_col is None or 'BP' not in cols:
+            raise ValueError("Summary statistics need SNP (or ID) and BP columns.")
+        bed = None
+        if args.bfile:
+            from bed_ld import BedFile
+            bed = BedFile(args.bfile)
+        record = prune_region(df[snp_col], marginal_z(df), df[cols['BP']], bed=bed, signal_z=args.signal_z,
+                              min_z=args.min_z, radius_kb=args.radius_kb, r2=args.r2)
+        record.to_csv(args.output_record, sep='\t', index=False)
+        record.loc[record['kept'], 'SNP'].to_csv(args.output_snps, index=False, header=False)
+        print(summarize(record))
+    except Exception as e:
+        sys.exit(f"An error occurred: {e}")
@@ -46,16 +46,42 @@
 
 
 #!/usr/bin/env python3
+"""
+Run GCTA-COJO (--cojo-slct).
+
+Without arguments this runs a single job on plink_input.* / cojo_input.dat
+as the Galaxy wrapper expects. With --plink_ref_dir the COJO input is split
+by chromosome and one gcta64 job per chromosome runs on a pool of at most
+--workers jobs, largest chromosome first, sharing --threads between them.
+The per-chromosome .jma.cojo / .ldr.cojo outputs are merged into one table
+of independent signals indexed by SNP and one long table of the LD r
+between them, with a per-chromosome timing report.
+
+With a cache directory (--cache_dir or GWAS_COJO_CACHE) every finished
+chromosome is kept under a key made of its COJO input checksum, the
+reference panel (path, size and mtime of .bed/.bim/.fam), population,
+chromosome, MAF and extra COJO flags. A rerun only runs the chromosomes
+whose key changed (or that failed before); the rest are read from the cache.
+"""
+import argparse
+import hashlib
 import os
+import shutil
 import subprocess
+import time
 import urllib.request
 import zipfile
 import stat
 import sys
 import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
 
 # GCTA_URL = "http://cnsgenomics.com/software/gcta/gcta_1.93.2beta.zip"
 GCTA_URL = "https://yanglab.westlake.edu.cn/software/gcta/bin/gcta-1.95.0-linux-kernel-3-x86_64.zip"
+DEFAULT_CACHE_DIR = os.environ.get('GWAS_COJO_CACHE') or None
+COJO_OUTPUTS = ('jma.cojo', 'ldr.cojo', 'cma.cojo', 'log')
 
 
 def download_and_prepare_gcta(download_dir):
@@ -80,6 +106,259 @@ def download_and_prepare_gcta(download_dir):
     os.chmod(gcta_bin, st.st_mode | stat.S_IEXEC)
     return gcta_bin
 
+
+def locate_gcta(download_dir=None):
+    """gcta64 (or gcta) from PATH, or a fresh download."""
+    gcta_exec = shutil.which("gcta64") or shutil.which("gcta")
+    if gcta_exec is None:
+        print("⚠️ GCTA not found in PATH. Attempting to download it automatically...")
+        gcta_exec = download_and_prepare_gcta(download_dir or os.getcwd())
+    print(f"Using GCTA executable at: {gcta_exec}")
+    return gcta_exec
+
+
+def normalize_chromosome(value):
+    """'chr1', '1' and 1 all become '1'."""
+    value = str(value).strip()
+    if value.lower().startswith('chr'):
+        value = value[3:]
+    return value
+
+
+def parse_chromosomes(spec):
+    """Parse '1-22' or '1,2,X'."""
+    chromosomes = []
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            chromosomes.extend(str(c) for c in range(int(start), int(end) + 1))
+        elif part:
+            chromosomes.append(normalize_chromosome(part))
+    return chromosomes
+
+
+def split_cojo_input(cojo_file, plink_ref_dir, population, chromosomes, work_dir):
+    """
+    Write one COJO input per chromosome to work_dir/chr{N}.ma. SNPs are
+    assigned by a CHR column if the input has one, otherwise by the SNP IDs
+    of each reference .bim. Returns {chromosome: (path, number of SNPs)}.
+    """
+    cojo = pd.read_csv(cojo_file, sep=r'\s+', dtype=str)
+    chr_col = next((c for c in cojo.columns if c.upper() in ('CHR', 'CHROM', 'CHROMOSOME')), None)
+    if chr_col is not None:
+        chrom_keys = cojo[chr_col].map(normalize_chromosome)
+        cojo = cojo.drop(columns=[chr_col])
+    else:
+        chrom_keys = pd.Series(None, index=cojo.index, dtype=object)
+        for chrom in chromosomes:
+            bim_path = os.path.join(plink_ref_dir, f"{population}.{chrom}.bim")
+            if os.path.exists(bim_path):
+                bim_snps = pd.read_csv(bim_path, sep=r'\s+', header=None, usecols=[1], dtype=str)[1]
+                chrom_keys[cojo.iloc[:, 0].isin(bim_snps) & chrom_keys.isna()] = chrom
+
+    os.makedirs(work_dir, exist_ok=True)
+    inputs = {}
+    for chrom, group in cojo.groupby(chrom_keys, sort=False):
+        if chrom not in chromosomes:
+            continue
+        path = os.path.join(work_dir, f"chr{chrom}.ma")
+        group.to_csv(path, sep='\t', index=False)
+        inputs[chrom] = (path, len(group))
+    return inputs
+
+
+def _cojo_task(gcta_exec, bfile, chrom, cojo_input, out_prefix, maf, threads, extra_flags):
+    """One gcta64 --cojo-slct job. Never raises: failures end up in the timing report."""
+    cmd = [gcta_exec, "--bfile", bfile, "--chr", chrom, "--cojo-file", cojo_input, "--cojo-slct",
+           "--out", out_prefix]
+    if maf is not None:
+        cmd += ["--maf", str(maf)]
+    if threads:
+        cmd += ["--thread-num", str(threads)]
+    cmd += list(extra_flags)
+    # Outputs of an earlier run in the same work_dir must not be mistaken for this one's
+    for ext in COJO_OUTPUTS:
+        if os.path.exists(f"{out_prefix}.{ext}"):
+            os.remove(f"{out_prefix}.{ext}")
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        lines = (result.stderr or result.stdout).strip().splitlines()
+        return f"failed: {lines[-1] if lines else result.returncode}", seconds
+    if not os.path.exists(f"{out_prefix}.jma.cojo"):
+        return "no_signals", seconds
+    return "ok", seconds
+
+
+def read_ldr(path, chrom):
+    """An .ldr.cojo r matrix as long (Chr, SNP1, SNP2, r) rows, each pair once"""
+    ldr = pd.read_csv(path, sep=r'\s+', index_col=0)
+    ldr = ldr.loc[:, [c for c in ldr.columns if not c.startswith('Unnamed')]]
+    pairs = ldr.stack().rename_axis(['SNP1', 'SNP2']).reset_index(name='r')
+    order = {snp: i for i, snp in enumerate(ldr.index)}
+    pairs = pairs[pairs['SNP1'].map(order) < pairs['SNP2'].map(order)]
+    return pairs.assign(Chr=chrom)[['Chr', 'SNP1', 'SNP2', 'r']]
+
+
+def file_checksum(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def panel_fingerprint(bfile):
+    """Identify a reference panel by real path, size and mtime of its .bed/.bim/.fam"""
+    parts = []
+    for ext in ('.bed', '.bim', '.fam'):
+        path = os.path.realpath(bfile + ext)
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}\0{st.st_size}\0{st.st_mtime_ns}")
+        except OSError:
+            parts.append(path)
+    return '\0'.join(parts)
+
+
+def cojo_cache_key(cojo_input, bfile, population, chrom, maf, extra_flags):
+    """Cache key of one chromosome's COJO run; thread counts do not change results and are left out"""
+    fields = [file_checksum(cojo_input), panel_fingerprint(bfile), population, chrom, repr(maf),
+              ' '.join(extra_flags)]
+    return hashlib.sha1('\0'.join(fields).encode()).hexdigest()
+
+
+def load_cached(cache_dir, key, out_prefix):
+    """Copy a cached chromosome's outputs to out_prefix; returns its status, or None on a miss"""
+    entry = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(entry, 'status')) as f:
+            status = f.read().strip()
+    except OSError:
+        return None
+    for ext in COJO_OUTPUTS:
+        if os.path.exists(os.path.join(entry, f"cojo.{ext}")):
+            shutil.copyfile(os.path.join(entry, f"cojo.{ext}"), f"{out_prefix}.{ext}")
+    return status
+
+
+def store_cached(cache_dir, key, out_prefix, status):
+    """Keep a finished chromosome's outputs; built in a temporary directory and published with one rename"""
+    entry = os.path.join(cache_dir, key)
+    tmp = f"{entry}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for ext in COJO_OUTPUTS:
+        if os.path.exists(f"{out_prefix}.{ext}"):
+            shutil.copyfile(f"{out_prefix}.{ext}", os.path.join(tmp, f"cojo.{ext}"))
+    with open(os.path.join(tmp, 'status'), 'w') as f:
+        f.write(f"{status}\n")
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # Stored by a concurrent run already
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run_cojo_by_chromosome(cojo_file, plink_ref_dir, population, output_jma, output_ldr=None,
+                           timing_report=None, chromosomes=None, maf=0.01, workers=4, threads=None,
+                           work_dir="cojo_work", extra_flags=(), gcta_exec=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Per-chromosome COJO on a pool of `workers` gcta64 jobs. Reference files
+    are expected as {population}.{chr}.bed/bim/fam in plink_ref_dir.
+    Returns the merged .jma.cojo table indexed by SNP.
+
+    threads: total GCTA threads (default: all CPUs). Each running job gets
+    an equal share; chromosomes are started largest first so the biggest
+    job does not start last.
+    cache_dir: optional per-chromosome results cache (see module docstring);
+    cached chromosomes are reported with cached = True and 0 threads.
+    """
+    chromosomes = chromosomes or [str(c) for c in range(1, 23)]
+    inputs = split_cojo_input(cojo_file, plink_ref_dir, population, chromosomes, work_dir)
+
+    report = [(chrom, 0, 0, 0, 0.0, False, "no_snps") for chrom in chromosomes if chrom not in inputs]
+    jma_tables, ldr_tables = [], []
+
+    def collect(chrom, n_snps, out_prefix, status, seconds, threads_used, cached):
+        n_signals = 0
+        if status == "ok":
+            jma = pd.read_csv(f"{out_prefix}.jma.cojo", sep='\t')
+            jma['Chr'] = jma['Chr'].astype(str)
+            n_signals = len(jma)
+            jma_tables.append(jma)
+            if os.path.exists(f"{out_prefix}.ldr.cojo"):
+                ldr_tables.append(read_ldr(f"{out_prefix}.ldr.cojo", chrom))
+        source = "cached" if cached else f"{seconds:.1f}s"
+        print(f"CHR {chrom}: {status} ({n_signals} signal(s) from {n_snps} SNPs, {source})")
+        report.append((chrom, n_snps, n_signals, threads_used, round(seconds, 3), cached, status))
+
+    jobs = []
+    for chrom in sorted(inputs, key=lambda c: inputs[c][1], reverse=True):
+        path, n_snps = inputs[chrom]
+        bfile = os.path.join(plink_ref_dir, f"{population}.{chrom}")
+        if not os.path.exists(f"{bfile}.bed"):
+            print(f"CHR {chrom}: reference {bfile}.bed not found, skipping.")
+            report.append((chrom, n_snps, 0, 0, 0.0, False, "missing_reference"))
+            continue
+        out_prefix = os.path.join(work_dir, f"chr{chrom}")
+        key = cojo_cache_key(path, bfile, population, chrom, maf, extra_flags) if cache_dir else None
+        status = load_cached(cache_dir, key, out_prefix) if cache_dir else None
+        if status is not None:
+            collect(chrom, n_snps, out_prefix, status, 0.0, 0, True)
+        else:
+            jobs.append((chrom, path, n_snps, bfile, out_prefix, key))
+
+    workers = max(1, min(workers, len(jobs) or 1))
+    threads_per_job = max(1, (threads or os.cpu_count() or 1) // workers)
+    if jobs:
+        gcta_exec = gcta_exec or locate_gcta()
+        print(f"Running COJO on {len(jobs)} chromosome(s): {workers} job(s) at once, "
+              f"{threads_per_job} thread(s) each.")
+    if cache_dir:
+        print(f"COJO cache: {sum(r[5] for r in report)} chromosome(s) reused, {len(jobs)} to run ({cache_dir})")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chrom, path, n_snps, bfile, out_prefix, key in jobs:
+            future = pool.submit(_cojo_task, gcta_exec, bfile, chrom, path, out_prefix, maf, threads_per_job,
+                                 extra_flags)
+            futures[future] = (chrom, n_snps, out_prefix, key)
+
+        for future in as_completed(futures):
+            chrom, n_snps, out_prefix, key = futures[future]
+            status, seconds = future.result()
+            if cache_dir and not status.startswith("failed"):
+                store_cached(cache_dir, key, out_prefix, status)
+            collect(chrom, n_snps, out_prefix, status, seconds, threads_per_job, False)
+
+    order = {chrom: i for i, chrom in enumerate(chromosomes)}
+    by_chrom = lambda s: s.map(lambda c: order.get(str(c), len(order)))
+    merged = pd.concat(jma_tables, ignore_index=True) if jma_tables else pd.DataFrame(columns=['Chr', 'SNP', 'bp'])
+    merged = merged.sort_values(['Chr', 'bp'], key=lambda s: by_chrom(s) if s.name == 'Chr' else s)
+    merged = merged.drop_duplicates('SNP').set_index('SNP')
+    merged.to_csv(output_jma, sep='\t')
+    print(f"{len(merged)} independent signal(s) written to {output_jma}")
+    if output_ldr:
+        ldr = (pd.concat(ldr_tables, ignore_index=True) if ldr_tables
+               else pd.DataFrame(columns=['Chr', 'SNP1', 'SNP2', 'r']))
+        ldr.sort_values('Chr', key=by_chrom, kind='stable').to_csv(output_ldr, sep='\t', index=False)
+
+    report_df = pd.DataFrame(report, columns=['chromosome', 'n_snps', 'n_signals', 'threads', 'seconds', 'cached',
+                                              'status'])
+    report_df = report_df.sort_values('chromosome', key=by_chrom).reset_index(drop=True)
+    report_path = timing_report or os.path.join(work_dir, "timing_report.tsv")
+    report_df.to_csv(report_path, sep='\t', index=False)
+    print(f"Timing report written to {report_path}")
+
+    failed = report_df[report_df['status'].str.startswith('failed')]
+    if not failed.empty:
+        sys.exit(f"COJO failed for chromosome(s): {', '.join(failed['chromosome'])}")
+    return merged
+
+
 def main():
     temp_dir = os.getcwd()
     gcta_path = download_and_prepare_gcta(temp_dir)
@@ -101,4 +380,35 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run GCTA-COJO, optionally per chromosome in parallel.")
+    parser.add_argument("--cojo_file", default="cojo_input.dat",
+                        help="COJO input (SNP A1 A2 freq b se p N, optionally with a CHR column).")
+    parser.add_argument("--plink_ref_dir", default=None,
+                        help="Per-chromosome mode: directory with {population}.{chr}.bed/bim/fam.")
+    parser.add_argument("--population", default="EUR")
+    parser.add_argument("--chromosomes", default="1-22", help="Chromosomes to run, e.g. '1-22' or '1,2,X'.")
+    parser.add_argument("--maf", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent gcta64 jobs.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Total GCTA threads (default: all CPUs), split evenly between concurrent jobs.")
+    parser.add_argument("--cojo_flags", default="",
+                        help="Extra GCTA flags passed to every job, e.g. '--cojo-p 5e-8 --cojo-collinear 0.9'.")
+    parser.add_argument("--work_dir", default="cojo_work", help="Per-chromosome inputs and GCTA outputs.")
+    parser.add_argument("--output_jma", default="cojo_output.jma.cojo",
+                        help="Merged independent signals of all chromosomes, indexed by SNP.")
+    parser.add_argument("--output_ldr", default=None, help="Merged LD r between the selected SNPs (long format).")
+    parser.add_argument("--timing_report", default=None,
+                        help="Per-chromosome timing report (default: <work_dir>/timing_report.tsv).")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Per-chromosome results cache; reruns skip chromosomes whose input and "
+                             "parameters are unchanged (default: $GWAS_COJO_CACHE, if set).")
+    args = parser.parse_args()
+
+    if args.plink_ref_dir:
+        run_cojo_by_chromosome(args.cojo_file, args.plink_ref_dir, args.population, args.output_jma,
+                               output_ldr=args.output_ldr, timing_report=args.timing_report,
+                               chromosomes=parse_chromosomes(args.chromosomes), maf=args.maf,
+                               workers=args.workers, threads=args.threads, work_dir=args.work_dir,
+                               extra_flags=args.cojo_flags.split(), cache_dir=args.cache_dir)
+    else:
+        main()
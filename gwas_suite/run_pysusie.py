@@ -1,19 +1,59 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
+import resource
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import gzip
-from pysusie import susie  # adjust import based on your PySuSiE installation
+from ld_formats import is_ld_binary, open_ld_binary
+import susie_rss
+from region_prune import expand_to_full
+try:
+    from pysusie import susie  # adjust import based on your PySuSiE installation
+except ImportError:  # only needed for --backend pysusie
+    susie = None
+
+BACKENDS = ['pysusie', 'numpy']
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+SUMSTATS_COLUMNS = {'SNP': str, 'BETA': np.float64, 'SE': np.float64}
+
+def _open_text(file_path):
+    """Open plain or gzipped text (detected by magic bytes, Galaxy datasets have no .gz suffix)."""
+    with open(file_path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    return gzip.open(file_path, 'rt') if gzipped else open(file_path)
+
+def detect_separator(file_path):
+    """Tab, comma or whitespace, from the header line (replaces the python engine's sniffing)."""
+    with _open_text(file_path) as f:
+        header = f.readline()
+    if '\t' in header:
+        return '\t'
+    if ',' in header:
+        return ','
+    return r'\s+'
 
 def load_sumstats(file_path):
-    """Load summary statistics, skip duplicate headers if present."""
+    """Load SNP/BETA/SE from summary statistics with the C parser; skip duplicate headers if present."""
     try:
-        sumstats = pd.read_csv(file_path, sep=None, engine='python')
-        # Detect actual header row if there are duplicates
-        if sumstats.iloc[0,0] == 'SNP':
-            sumstats = sumstats[1:]  # remove duplicated header row
+        sep = detect_separator(file_path)
+        with _open_text(file_path) as f:
+            try:
+                sumstats = pd.read_csv(f, sep=sep, engine='c', usecols=list(SUMSTATS_COLUMNS),
+                                       dtype=SUMSTATS_COLUMNS)
+            except ValueError:
+                sumstats = None
+        if sumstats is None:
+            # Typed parse failed, e.g. a duplicated header row inside the data
+            with _open_text(file_path) as f:
+                sumstats = pd.read_csv(f, sep=sep, engine='c', usecols=list(SUMSTATS_COLUMNS), dtype=str)
+            sumstats = sumstats[sumstats['SNP'] != 'SNP']  # remove duplicated header rows
+            sumstats = sumstats.astype(SUMSTATS_COLUMNS)
         sumstats = sumstats.reset_index(drop=True)
         return sumstats
     except Exception as e:
@@ -21,47 +61,109 @@ def load_sumstats(file_path):
         sys.exit(1)
 
 def load_snp_list(file_path):
-    """Load SNP list and detect first column automatically."""
+    """Load SNP list (first column, '#' lines ignored)."""
     try:
-        snp_df = pd.read_csv(file_path, sep=None, engine='python', header=None)
-        snp_df.columns = ['SNP']  # assume first column contains SNPs
+        with _open_text(file_path) as f:
+            snp_df = pd.read_csv(f, sep=r'\s+', engine='c', header=None, usecols=[0], dtype=str, comment='#')
+        snp_df.columns = ['SNP']
         return snp_df
     except Exception as e:
         print(f"Error loading SNP list: {e}", file=sys.stderr)
         sys.exit(1)
 
-def load_ld_matrix(file_path):
-    """Load LD matrix as a numpy array. Supports plain text or gzipped files."""
+def peak_memory_mb():
+    """Peak resident memory of this process so far (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_ld_matrix(file_path, dtype=np.float64):
+    """
+    Load LD matrix as a numpy array. Binary (.ldm) matrices and .npy files
+    are memory-mapped; plain text or gzipped text goes through the C parser
+    straight into `dtype`. Returns (matrix, SNP order from the file header or None).
+    """
     try:
-        if file_path.endswith('.gz'):
-            with gzip.open(file_path, 'rt') as f:
-                return np.loadtxt(f)
-        else:
-            return np.loadtxt(file_path)
+        if is_ld_binary(file_path):
+            return open_ld_binary(file_path)
+        with open(file_path, 'rb') as f:
+            if f.read(6) == b'\x93NUMPY':
+                return np.load(file_path, mmap_mode='r'), None
+        with _open_text(file_path) as f:
+            matrix = pd.read_csv(f, sep=r'\s+', engine='c', header=None, dtype=dtype).to_numpy()
+        return matrix, None
     except Exception as e:
         print(f"Error loading LD matrix: {e}", file=sys.stderr)
         sys.exit(1)
 
-def run_susier_analysis(sumstats_file, ld_matrix_file, snp_list_file, n, output_creds, output_pips):
-    print("--- Step 1: Loading input data ---")
-    sumstats = load_sumstats(sumstats_file)
-    snp_list = load_snp_list(snp_list_file)
-    ld_matrix = load_ld_matrix(ld_matrix_file)
+def align_to_ld(sumstats, ld_matrix, ld_snps, dtype=np.float64):
+    """
+    Index-join sumstats onto the LD SNP order. SNPs of the LD matrix that are
+    missing from the sumstats are dropped from the matrix as well, so
+    beta/se/R always line up. Returns (aligned sumstats, R as `dtype`); R is
+    only copied if SNPs are dropped or the dtype differs.
+    """
+    if len(ld_snps) != ld_matrix.shape[0]:
+        raise ValueError(f"LD matrix has {ld_matrix.shape[0]} rows but the SNP list has {len(ld_snps)} SNPs.")
+    by_snp = sumstats.drop_duplicates('SNP').set_index('SNP')
+    aligned = by_snp.reindex(pd.Index(ld_snps, name='SNP'))
+    keep = aligned['BETA'].notna().to_numpy() & aligned['SE'].notna().to_numpy()
+    if not keep.all():
+        print(f"{(~keep).sum()} LD SNPs have no summary statistics and are dropped.")
+        idx = np.flatnonzero(keep)
+        ld_matrix = ld_matrix[np.ix_(idx, idx)].astype(dtype, copy=False)
+        aligned = aligned[keep]
+    return aligned.reset_index(), np.asarray(ld_matrix, dtype=dtype)
 
-    # Filter sumstats to SNPs in the list
-    filtered_sumstats = sumstats[sumstats['SNP'].isin(snp_list['SNP'])]
+def load_region(sumstats, ld_matrix_file, snp_list_file=None, dtype=np.float64):
+    """
+    Load one region's LD matrix (and SNP list, optional for binary LD) and
+    align the sumstats to it. Returns (aligned sumstats, R); raises
+    ValueError if the SNPs cannot be matched.
+    """
+    ld_matrix, ld_snps = load_ld_matrix(ld_matrix_file, dtype=dtype)
+    if ld_snps is None:
+        if not snp_list_file:
+            raise ValueError(f"A SNP list is required for the text LD matrix {ld_matrix_file}.")
+        ld_snps = load_snp_list(snp_list_file)['SNP'].tolist()
+    elif snp_list_file and ld_snps != load_snp_list(snp_list_file)['SNP'].tolist():
+        print("SNP list differs from the order stored in the binary LD matrix; using the matrix order.")
+
+    # Align sumstats to the LD matrix order
+    filtered_sumstats, ld_matrix = align_to_ld(sumstats, ld_matrix, ld_snps, dtype=dtype)
     if filtered_sumstats.empty:
-        print("No SNPs matched between sumstats and SNP list.", file=sys.stderr)
+        raise ValueError("No SNPs matched between sumstats and SNP list.")
+    return filtered_sumstats, ld_matrix
+
+def fit_susie(beta, se, ld_matrix, n, backend='pysusie'):
+    """
+    SuSiE on one region with PySuSiE or the built-in NumPy SuSiE-RSS (no R
+    needed). The NumPy backend works in ld_matrix's precision and may
+    overwrite it.
+    """
+    if backend == 'numpy':
+        return susie_rss.susie_rss(bhat=beta, shat=se, R=ld_matrix, n=n, dtype=ld_matrix.dtype, overwrite_R=True)
+    if susie is None:
+        raise ImportError("pysusie is not installed; use --backend numpy")
+    return susie(bhat=beta, shat=se, R=ld_matrix, n=n)
+
+def run_susier_analysis(sumstats_file, ld_matrix_file, snp_list_file, n, output_creds, output_pips, backend='pysusie',
+                        precision='float64', prune_record=None):
+    print("--- Step 1: Loading input data ---")
+    sumstats = load_sumstats(sumstats_file)
+    try:
+        filtered_sumstats, ld_matrix = load_region(sumstats, ld_matrix_file, snp_list_file,
+                                                   dtype=PRECISIONS[precision])
+    except ValueError as e:
+        print(f"Error aligning SNPs: {e}", file=sys.stderr)
         sys.exit(1)
 
     # Extract effect sizes and standard errors
-    beta = filtered_sumstats['BETA'].astype(float).to_numpy()
-    se = filtered_sumstats['SE'].astype(float).to_numpy()
+    beta = filtered_sumstats['BETA'].to_numpy()
+    se = filtered_sumstats['SE'].to_numpy()
 
     # Run SuSiE
     print("--- Step 2: Running SuSiE ---")
     try:
-        susie_res = susie(bhat=beta, shat=se, R=ld_matrix, n=n)
+        susie_res = fit_susie(beta, se, ld_matrix, n, backend=backend)
     except Exception as e:
         print(f"Error running SuSiE: {e}", file=sys.stderr)
         sys.exit(1)
@@ -70,26 +172,167 @@ def run_susier_analysis(sumstats_file, ld_matrix_file, snp_list_file, n, output_
     print("--- Step 3: Saving outputs ---")
     try:
         pd.DataFrame(susie_res['sets']['cs']).to_csv(output_creds, index=False)
-        pd.DataFrame(susie_res['pip'], columns=['PIP']).to_csv(output_pips, index=False)
+        pips = pd.DataFrame({'SNP': filtered_sumstats['SNP'], 'PIP': susie_res['pip']})
+        if prune_record:
+            # Report on the full region: SNPs dropped before LD get PIP 0
+            pips = expand_to_full(pips, pd.read_csv(prune_record, sep='\t'), fill={'PIP': 0.0})
+        pips.to_csv(output_pips, index=False)
     except Exception as e:
         print(f"Error saving outputs: {e}", file=sys.stderr)
         sys.exit(1)
+    print(f"Peak memory: {peak_memory_mb():.0f} MB ({len(filtered_sumstats)} SNPs, {precision} LD)")
+
+# --- Batch mode: many regions per process start ---
+
+MANIFEST_COLUMNS = ['region', 'sumstats', 'ld_matrix', 'snp_list', 'n']
+_worker_sumstats = {}
+
+def read_manifest(manifest_file, default_n=None):
+    """
+    Regions to fine-map, one per row (tab-separated, with header):
+    region, sumstats, ld_matrix, snp_list (optional for binary LD), n
+    (optional if --n is given). Relative paths are resolved against the
+    manifest's directory.
+    """
+    manifest = pd.read_csv(manifest_file, sep='\t', dtype=str, comment='#')
+    missing = {'sumstats', 'ld_matrix'} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"Manifest is missing column(s): {', '.join(sorted(missing))}")
+    manifest = manifest.reindex(columns=MANIFEST_COLUMNS)
+    base = os.path.dirname(os.path.abspath(manifest_file))
+    for col in ('sumstats', 'ld_matrix', 'snp_list'):
+        manifest[col] = manifest[col].map(lambda p: os.path.join(base, p) if isinstance(p, str) and p else None)
+    manifest['region'] = manifest['region'].fillna(
+        manifest['ld_matrix'].map(lambda p: os.path.basename(p).split('.')[0]))
+    if manifest['region'].duplicated().any():
+        raise ValueError("Region names in the manifest must be unique.")
+    if default_n is not None:
+        manifest['n'] = manifest['n'].fillna(str(default_n))
+    if manifest['n'].isna().any():
+        raise ValueError("Every region needs a sample size: add an 'n' column or pass --n.")
+    manifest['n'] = manifest['n'].astype(float).astype(int)
+    return manifest
+
+def credible_set_rows(region, credible_sets, snps):
+    """(region, credible set, SNP) rows from susie's sets['cs'] (list or dict of index arrays)"""
+    items = credible_sets.items() if isinstance(credible_sets, dict) else enumerate(credible_sets or [], start=1)
+    rows = []
+    for cs_id, members in items:
+        if members is None:
+            continue
+        for idx in np.atleast_1d(members):
+            rows.append((region, cs_id, snps[int(idx)]))
+    return rows
+
+def _finemap_region_task(region, sumstats_file, ld_matrix_file, snp_list_file, n, backend='pysusie',
+                         precision='float64'):
+    """One region on a pool worker; the parsed sumstats are reused across regions sharing a file."""
+    start = time.perf_counter()
+    try:
+        if sumstats_file not in _worker_sumstats:
+            _worker_sumstats.clear()
+            _worker_sumstats[sumstats_file] = load_sumstats(sumstats_file)
+        aligned, ld_matrix = load_region(_worker_sumstats[sumstats_file], ld_matrix_file, snp_list_file,
+                                         dtype=PRECISIONS[precision])
+        susie_res = fit_susie(aligned['BETA'].to_numpy(), aligned['SE'].to_numpy(), ld_matrix, n, backend=backend)
+        snps = aligned['SNP'].tolist()
+        pips = pd.DataFrame({'region': region, 'SNP': snps, 'PIP': susie_res['pip']})
+        cs_rows = credible_set_rows(region, susie_res['sets']['cs'], snps)
+        status = "ok"
+    except SystemExit:
+        pips, cs_rows, status = None, [], "failed: see log"
+    except Exception as e:
+        pips, cs_rows, status = None, [], f"failed: {e}"
+    n_snps = 0 if pips is None else len(pips)
+    n_cs = len({row[1] for row in cs_rows})
+    # ru_maxrss is the worker's peak so far, i.e. an upper bound for this region
+    return pips, cs_rows, (region, n_snps, n_cs, round(time.perf_counter() - start, 3),
+                           round(peak_memory_mb()), status)
+
+def run_batch(manifest_file, output_creds, output_pips, output_report=None, n=None, workers=4, backend='pysusie',
+              precision='float64'):
+    """
+    Fine-map every region of a manifest on a pool of `workers` processes that
+    import pysusie/pandas once, and write combined credible-set and PIP
+    tables tagged by region, plus a per-region report.
+    """
+    try:
+        manifest = read_manifest(manifest_file, default_n=n)
+    except Exception as e:
+        print(f"Error loading manifest: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Fine-mapping {len(manifest)} region(s) with {workers} worker(s).")
+
+    pip_tables, cs_rows, report = [], [], []
+    order = {region: i for i, region in enumerate(manifest['region'])}
+    by_region = lambda s: s.map(order)
+    # Group regions of the same sumstats file so workers can reuse the parse
+    manifest = manifest.sort_values('sumstats', kind='stable')
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_finemap_region_task, row.region, row.sumstats, row.ld_matrix, row.snp_list, row.n,
+                               backend, precision)
+                   for row in manifest.itertuples(index=False)]
+        for future in as_completed(futures):
+            pips, rows, summary = future.result()
+            print(f"Region {summary[0]}: {summary[5]} ({summary[1]} SNPs, {summary[2]} credible sets, {summary[3]}s, "
+                  f"peak {summary[4]} MB)")
+            if pips is not None:
+                pip_tables.append(pips)
+            cs_rows.extend(rows)
+            report.append(summary)
+
+    pips = (pd.concat(pip_tables, ignore_index=True) if pip_tables
+            else pd.DataFrame(columns=['region', 'SNP', 'PIP']))
+    pips.sort_values('region', key=by_region, kind='stable').to_csv(output_pips, index=False)
+    creds = pd.DataFrame(cs_rows, columns=['region', 'cs', 'SNP'])
+    creds.sort_values('region', key=by_region, kind='stable').to_csv(output_creds, index=False)
+    report_df = pd.DataFrame(report, columns=['region', 'n_snps', 'n_credible_sets', 'seconds', 'peak_mb', 'status'])
+    report_df = report_df.sort_values('region', key=by_region).reset_index(drop=True)
+    if output_report:
+        report_df.to_csv(output_report, sep='\t', index=False)
+
+    failed = report_df[report_df['status'].str.startswith('failed')]
+    if not failed.empty:
+        print(f"Fine-mapping failed for {len(failed)} region(s): {', '.join(failed['region'])}", file=sys.stderr)
+        sys.exit(1)
+    return report_df
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run PySuSiE fine-mapping")
-    parser.add_argument("--sumstats", required=True)
-    parser.add_argument("--ld_matrix", required=True)
-    parser.add_argument("--snp_list", required=True)
-    parser.add_argument("--n", type=int, required=True)
+    parser.add_argument("--sumstats")
+    parser.add_argument("--ld_matrix")
+    parser.add_argument("--snp_list")
+    parser.add_argument("--n", type=int)
     parser.add_argument("--output_creds", required=True)
     parser.add_argument("--output_pips", required=True)
+    parser.add_argument("--backend", choices=BACKENDS, default="pysusie",
+                        help="pysusie, or numpy for the built-in SuSiE-RSS (no R/rpy2 needed).")
+    parser.add_argument("--prune_record",
+                        help="Pruned SNP record from calc_ld_matrix.py; PIPs are reported on the full region.")
+    parser.add_argument("--precision", choices=list(PRECISIONS), default="float64",
+                        help="LD matrix precision; float32 halves its memory (in-place with --backend numpy).")
+    # Batch mode
+    parser.add_argument("--manifest", help="TSV of regions (region, sumstats, ld_matrix, snp_list, n) "
+                                           "fine-mapped in one run; outputs are combined and tagged by region.")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes for --manifest.")
+    parser.add_argument("--output_report", help="Per-region status/timing table for --manifest.")
     args = parser.parse_args()
 
-    run_susier_analysis(
-        args.sumstats,
-        args.ld_matrix,
-        args.snp_list,
-        args.n,
-        args.output_creds,
-        args.output_pips
-    )
+    if args.manifest:
+        run_batch(args.manifest, args.output_creds, args.output_pips,
+                  output_report=args.output_report, n=args.n, workers=args.workers, backend=args.backend,
+                  precision=args.precision)
+    else:
+        if not (args.sumstats and args.ld_matrix and args.snp_list and args.n):
+            parser.error("--sumstats, --ld_matrix, --snp_list and --n are required without --manifest.")
+        run_susier_analysis(
+            args.sumstats,
+            args.ld_matrix,
+            args.snp_list,
+            args.n,
+            args.output_creds,
+            args.output_pips,
+            backend=args.backend,
+            precision=args.precision,
+            prune_record=args.prune_record
+        )
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+SuSiE-RSS in NumPy: the IBSS loop on summary statistics (z-scores or
+bhat/shat and an LD matrix R), following susieR's susie_rss ->
+susie_suff_stat path, so fine-mapping needs neither R nor rpy2.
+
+With a sample size n, z is adjusted as in susieR
+(z * sqrt((n-1) / (z^2 + n - 2))) and the model is fitted on the
+sufficient statistics XtX = (n-1) R, Xty = sqrt(n-1) z, yty = n-1, with
+standardized columns, unit residual variance and the prior variance of
+each effect re-estimated every iteration (1-D maximisation over log V, the
+'optim' method). Credible sets and PIPs follow susie_get_cs/susie_get_pip;
+credible-set indices are 0-based.
+
+Defaults match susieR (L=10, scaled prior variance 0.2, tol 1e-3,
+max_iter 100, coverage 0.95, min_abs_corr 0.5).
+
+For large regions, dtype=np.float32 keeps the p x p matrix in single
+precision (the per-SNP vectors stay float64) and overwrite_R=True scales a
+writable float32/float64 R in place instead of copying it, so the fit
+holds a single p x p array.
+"""
+import numpy as np
+
+PRIOR_TOL = 1e-9
+BLOCK_SIZE = 2048
+# log(V) search interval, as in susieR's optimize_prior_variance
+LOG_V_BOUNDS = (-30.0, 15.0)
+_GOLDEN = (np.sqrt(5) - 1) / 2
+
+
+def _log_bf(betahat, shat2, V):
+    """Per-SNP log Bayes factors of a single effect with prior variance V"""
+    if V <= 0:
+        return np.zeros_like(betahat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lbf = 0.5 * np.log(shat2 / (V + shat2)) + 0.5 * betahat ** 2 * V / (shat2 * (V + shat2))
+    return np.where(np.isfinite(shat2), lbf, 0.0)
+
+
+def _log_weighted_sum(lbf, prior_weights):
+    m = lbf.max()
+    return m + np.log(np.sum(prior_weights * np.exp(lbf - m)))
+
+
+def _optimize_prior_variance(betahat, shat2, prior_weights, V):
+    """Maximise the single-effect marginal likelihood over log V (golden section)"""
+    def loglik(log_v):
+        return _log_weighted_sum(_log_bf(betahat, shat2, np.exp(log_v)), prior_weights)
+
+    lo, hi = LOG_V_BOUNDS
+    a, b = hi - _GOLDEN * (hi - lo), lo + _GOLDEN * (hi - lo)
+    fa, fb = loglik(a), loglik(b)
+    while hi - lo > 1e-5:
+        if fa > fb:
+            hi, b, fb = b, a, fa
+            a = hi - _GOLDEN * (hi - lo)
+            fa = loglik(a)
+        else:
+            lo, a, fa = a, b, fb
+            b = lo + _GOLDEN * (hi - lo)
+            fb = loglik(b)
+    best = (a, fa) if fa > fb else (b, fb)
+    # Keep the starting value if it is better, and drop the effect if V = 0 is
+    if V > 0 and loglik(np.log(V)) > best[1]:
+        best = (np.log(V), loglik(np.log(V)))
+    return np.exp(best[0]) if best[1] > 0 else 0.0
+
+
+def _single_effect(XtR, dXtX, sigma2, V, prior_weights, estimate_prior_variance=True):
+    """Bayesian single-effect regression on sufficient statistics"""
+    shat2 = sigma2 / dXtX
+    betahat = XtR / dXtX
+    if estimate_prior_variance:
+        V = _optimize_prior_variance(betahat, shat2, prior_weights, V)
+
+    lbf = _log_bf(betahat, shat2, V)
+    w = prior_weights * np.exp(lbf - lbf.max())
+    alpha = w / w.sum()
+    lbf_model = lbf.max() + np.log(w.sum())
+    if V > 0:
+        post_var = 1 / (1 / V + dXtX / sigma2)
+        mu = post_var * XtR / sigma2
+        mu2 = post_var + mu ** 2
+    else:
+        mu = mu2 = np.zeros_like(XtR)
+    return alpha, mu, mu2, V, lbf_model
+
+
+def symmetrize_inplace(A, block=BLOCK_SIZE):
+    """A <- (A + A.T) / 2 block by block, without a transposed copy of A"""
+    n = A.shape[0]
+    for i0 in range(0, n, block):
+        i1 = min(n, i0 + block)
+        diag = A[i0:i1, i0:i1]
+        diag += diag.T.copy()
+        diag *= 0.5
+        for j0 in range(i1, n, block):
+            j1 = min(n, j0 + block)
+            upper = A[i0:i1, j0:j1]
+            upper += A[j0:j1, i0:i1].T
+            upper *= 0.5
+            A[j0:j1, i0:i1] = upper.T
+    return A
+
+
+def _expected_rss(XtX, Xty, yty, alpha, mu, mu2, XtXr, dXtX):
+    """E[||y - Xb||^2] under the variational posterior"""
+    B = alpha * mu
+    betabar = B.sum(axis=0)
+    # Cast the small operand so XtX is never upcast (copied) to float64
+    XB2 = np.einsum('lj,lj->', B.astype(XtX.dtype) @ XtX, B)
+    return yty - 2 * betabar @ Xty + betabar @ XtXr - XB2 + np.sum(dXtX * (alpha * mu2))
+
+
+def susie_rss(z=None, R=None, n=None, bhat=None, shat=None, L=10, scaled_prior_variance=0.2,
+              estimate_prior_variance=True, max_iter=100, tol=1e-3, coverage=0.95, min_abs_corr=0.5,
+              model_init=None, verbose=False, dtype=np.float64, overwrite_R=False):
+    """
+    Fit SuSiE to summary statistics. Give z, or bhat and shat; n is
+    required. model_init is an earlier fit to start from (its effects are
+    kept and, if L is larger, new effects start at zero).
+
+    Returns a dict like susieR's fit: alpha, mu, mu2 (L x p), V, elbo
+    (per iteration), niter, converged, sigma2, pip and sets (from
+    susie_get_cs on the standardized R). With overwrite_R the caller's R is
+    symmetrized and scaled in place and must not be reused.
+    """
+    if z is None:
+        if bhat is None or shat is None:
+            raise ValueError("Provide z, or both bhat and shat.")
+        z = np.asarray(bhat, dtype=np.float64) / np.asarray(shat, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64).ravel()
+    if n is None or n <= 1:
+        raise ValueError("The sample size n must be given (n > 1).")
+    dtype = np.dtype(dtype)
+    R = np.asarray(R)
+    p = len(z)
+    if R.shape != (p, p):
+        raise ValueError(f"R has shape {R.shape} but there are {p} z-scores")
+    if np.isnan(z).any():
+        print("Warning: NA values in z-scores are replaced with 0.")
+        z = np.nan_to_num(z)
+
+    z = z * np.sqrt((n - 1) / (z ** 2 + n - 2))
+    # The only p x p working array: R itself if allowed, otherwise one copy
+    if overwrite_R and R.dtype == dtype and R.flags.writeable and R.flags.c_contiguous:
+        XtX = R
+    else:
+        XtX = np.array(R, dtype=dtype, order='C')
+    symmetrize_inplace(XtX)
+    # Standardize columns, as susie_suff_stat(standardize = TRUE)
+    csd = np.sqrt(np.diagonal(XtX).astype(np.float64))
+    csd[csd == 0] = 1
+    scale = (np.sqrt(n - 1) / csd).astype(dtype)
+    XtX *= scale[:, None]
+    XtX *= scale[None, :]
+    Xty = np.sqrt(n - 1) * z / csd
+    yty = float(n - 1)
+    dXtX = np.diagonal(XtX).astype(np.float64)
+    var_y = yty / (n - 1)
+    sigma2 = var_y
+    prior_weights = np.full(p, 1 / p)
+
+    alpha = np.full((L, p), 1 / p)
+    mu = np.zeros((L, p))
+    mu2 = np.zeros((L, p))
+    V = np.full(L, scaled_prior_variance * var_y)
+    if model_init is not None:
+        k = min(L, len(model_init['V']))
+        alpha[:k] = model_init['alpha'][:k]
+        mu[:k] = model_init['mu'][:k] * csd
+        mu2[:k] = model_init['mu2'][:k] * csd ** 2
+        V[:k] = model_init['V'][:k]
+    KL = np.zeros(L)
+    XtXr = (XtX @ (alpha * mu).sum(axis=0).astype(dtype)).astype(np.float64)
+
+    elbo = [-np.inf]
+    converged = False
+    for iteration in range(1, max_iter + 1):
+        for l in range(L):
+            XtXr -= XtX @ (alpha[l] * mu[l]).astype(dtype)
+            XtR = Xty - XtXr
+            alpha[l], mu[l], mu2[l], V[l], lbf_model = _single_effect(
+                XtR, dXtX, sigma2, V[l], prior_weights, estimate_prior_variance)
+            Eb, Eb2 = alpha[l] * mu[l], alpha[l] * mu2[l]
+            KL[l] = -lbf_model - 0.5 / sigma2 * (-2 * Eb @ XtR + dXtX @ Eb2)
+            XtXr += XtX @ Eb.astype(dtype)
+        er2 = _expected_rss(XtX, Xty, yty, alpha, mu, mu2, XtXr, dXtX)
+        elbo.append(-n / 2 * np.log(2 * np.pi * sigma2) - er2 / (2 * sigma2) - KL.sum())
+        if verbose:
+            print(f"Iteration {iteration}: ELBO {elbo[-1]}")
+        if elbo[-1] - elbo[-2] < tol:
+            converged = True
+            break
+    if not converged:
+        print(f"Warning: IBSS did not converge in {max_iter} iterations.")
+
+    fit = {'alpha': alpha, 'mu': mu / csd, 'mu2': mu2 / csd ** 2, 'V': V, 'KL': KL, 'sigma2': sigma2,
+           'elbo': np.array(elbo[1:]), 'niter': iteration, 'converged': converged}
+    fit['pip'] = susie_get_pip(fit)
+    # XtX / (n-1) is the standardized R: use it for purity instead of keeping R
+    fit['sets'] = susie_get_cs(fit, Xcorr=XtX, coverage=coverage, min_abs_corr=min_abs_corr, xcorr_scale=1 / (n - 1))
+    return fit
+
+
+def susie_get_pip(fit, prior_tol=PRIOR_TOL):
+    """1 - prod(1 - alpha) over the effects with non-zero prior variance"""
+    alpha = fit['alpha'][fit['V'] > prior_tol]
+    if len(alpha) == 0:
+        return np.zeros(fit['alpha'].shape[1])
+    return 1 - np.prod(1 - alpha, axis=0)
+
+
+def susie_get_cs(fit, Xcorr=None, coverage=0.95, min_abs_corr=0.5, prior_tol=PRIOR_TOL, xcorr_scale=1.0):
+    """
+    Credible sets: per effect, the fewest SNPs whose alpha sums to coverage.
+    Duplicate sets are merged; with Xcorr, sets whose minimum absolute
+    correlation is below min_abs_corr are dropped (Xcorr * xcorr_scale is
+    the correlation, so a scaled matrix need not be copied). Returns a dict with cs
+    (list of 0-based index arrays), cs_index (effect of each set), coverage
+    and purity (min/mean/median abs corr).
+    """
+    cs, cs_index, claimed = [], [], []
+    for l in np.flatnonzero(fit['V'] > prior_tol):
+        order = np.argsort(-fit['alpha'][l], kind='stable')
+        cumulative = np.cumsum(fit['alpha'][l][order])
+        size = min(int(np.sum(cumulative < coverage)) + 1, len(order))
+        members = np.sort(order[:size])
+        if any(np.array_equal(members, other) for other in cs):
+            continue
+        cs.append(members)
+        cs_index.append(int(l))
+        claimed.append(float(cumulative[size - 1]))
+
+    purity = []
+    if Xcorr is not None:
+        kept = []
+        for i, members in enumerate(cs):
+            corr = np.abs(np.asarray(Xcorr)[np.ix_(members, members)].astype(np.float64) * xcorr_scale)
+            # Off-diagonal pairs only, as susieR get_purity (upper.tri)
+            values = corr[np.triu_indices(len(members), 1)] if len(members) > 1 else np.ones(1)
+            row = (values.min(), values.mean(), np.median(values))
+            if row[0] >= min_abs_corr:
+                kept.append(i)
+                purity.append(row)
+        cs = [cs[i] for i in kept]
+        cs_index = [cs_index[i] for i in kept]
+        claimed = [claimed[i] for i in kept]
+    return {'cs': cs, 'cs_index': cs_index, 'coverage': claimed, 'purity': purity}
+
+
+def select_L(z, R, n, max_L=20, elbo_tol=0.1, coverage=0.95, min_abs_corr=0.5, **kwargs):
+    """
+    Warm-started L sweep (as gwas_suite.susie_search.sweep_susie_L, natively):
+    returns (L, fit) for the last L whose extra effect still improved the
+    ELBO and added a credible set.
+    """
+    best = None
+    for L in range(1, max_L + 1):
+        fit = susie_rss(z=z, R=R, n=n, L=L, coverage=coverage, min_abs_corr=min_abs_corr,
+                        model_init=best, **kwargs)
+        n_cs = len(fit['sets']['cs'])
+        print(f"L = {L}: ELBO {fit['elbo'][-1]}, {n_cs} credible set(s), {fit['niter']} iterations")
+        if best is not None and (not fit['converged'] or fit['elbo'][-1] <= best['elbo'][-1] + elbo_tol
+                                 or n_cs <= len(best['sets']['cs'])):
+            break
+        best = fit
+    L = len(best['V'])
+    print(f"Selected L = {L} with ELBO {best['elbo'][-1]}")
+    return L, best
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Parallel search over the number of SuSiE effects (L) for one region.
+
+The z-scores and LD matrix are written once to .npy files in a scratch
+directory; each worker process memory-maps them and converts them to R
+matrices a single time (pool initializer), so trials only pay for the
+susie_rss fit itself. Optuna proposes L values through its ask/tell
+interface while up to n_jobs fits run at once.
+
+Every fit is saved as an .rds next to the shared matrices and cached by L:
+an L proposed twice is not refitted, and the best fit is read back with
+readRDS instead of being fitted again. Trials whose IBSS did not converge
+are pruned, and the study stops early once the best ELBO has not improved
+by more than elbo_tol for `patience` completed trials.
+
+sweep_susie_L is the deterministic alternative: it fits L = 1, 2, ... in
+order, starting each fit from the previous one (model_init, so the first
+L-1 effects keep their alpha/mu and only the new effect starts cold), and
+stops as soon as one more effect no longer raises the ELBO by elbo_tol or
+no longer adds a credible set.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+DEFAULT_MAX_L = 20
+DEFAULT_N_TRIALS = 10
+DEFAULT_PATIENCE = 4
+DEFAULT_ELBO_TOL = 0.1
+
+# Per-worker state set by _init_worker
+_worker = {}
+
+
+def _init_worker(z_path, ld_path, num_samples, seed):
+    import rpy2.robjects as ro
+    from rpy2.robjects import numpy2ri
+    from rpy2.robjects.packages import importr
+
+    with (ro.default_converter + numpy2ri.converter).context():
+        convert = ro.conversion.get_conversion().py2rpy
+        z_r = convert(np.asarray(np.load(z_path, mmap_mode='r'), dtype=np.float64))
+        ld_r = convert(np.asarray(np.load(ld_path, mmap_mode='r'), dtype=np.float64))
+    _worker.update(ro=ro, susieR=importr('susieR'), z=z_r, R=ld_r, n=num_samples, seed=seed)
+
+
+def _fit_L(L, fit_path):
+    """Fit susie_rss with L effects on the shared data, save it to fit_path and summarise it"""
+    ro, susieR = _worker['ro'], _worker['susieR']
+    start = time.perf_counter()
+    ro.r(f'set.seed({_worker["seed"]})')
+    fit = susieR.susie_rss(z=_worker['z'], R=_worker['R'], L=L, n=_worker['n'])
+    ro.r['saveRDS'](fit, fit_path)
+    elbo = list(fit.rx2('elbo'))
+    return {'L': L, 'elbo': elbo[-1], 'converged': bool(fit.rx2('converged')[0]),
+            'niter': len(elbo), 'path': fit_path, 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def search_susie_L(zhat, ld_matrix, num_samples, seed=42, n_trials=DEFAULT_N_TRIALS, n_jobs=4,
+                   max_L=DEFAULT_MAX_L, patience=DEFAULT_PATIENCE, elbo_tol=DEFAULT_ELBO_TOL, work_dir=None):
+    """
+    Search L in 1..max_L for the highest converged ELBO.
+
+    Returns (best L, best fit as an R object, list of trial summaries). The
+    best fit is read back from its saved .rds in the calling process (which
+    must have rpy2 and susieR available), so it is never refitted.
+    """
+    import optuna
+    import rpy2.robjects as ro
+
+    scratch = tempfile.mkdtemp(prefix='susie_L_', dir=work_dir)
+    z_path = os.path.join(scratch, 'z.npy')
+    ld_path = os.path.join(scratch, 'ld.npy')
+    np.save(z_path, np.asarray(zhat, dtype=np.float64).reshape(-1, 1))
+    np.save(ld_path, np.asarray(ld_matrix, dtype=np.float64))
+
+    study = optuna.create_study(direction="maximize", sampler=optuna.samplers.TPESampler(seed=seed))
+    fits = {}       # L -> summary, shared by trials proposing the same L
+    pending = {}    # future -> L being fitted
+    waiting = {}    # L -> trials waiting on an in-flight fit of that L
+    trials_log = []
+    best_elbo, stale = -np.inf, 0
+
+    def finish(trial, summary):
+        nonlocal best_elbo, stale
+        trials_log.append(dict(summary, trial=trial.number))
+        if not summary['converged']:
+            print(f"L = {summary['L']} did not converge; pruned.")
+            study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+            return
+        print(f"Running with L = {summary['L']}. Converged with ELBO {summary['elbo']} ({summary['seconds']}s)")
+        study.tell(trial, summary['elbo'])
+        if summary['elbo'] > best_elbo + elbo_tol:
+            best_elbo, stale = summary['elbo'], 0
+        else:
+            stale += 1
+
+    # spawn: R is not fork-safe once the parent has embedded it
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, n_jobs), mp_context=context, initializer=_init_worker,
+                                 initargs=(z_path, ld_path, num_samples, seed)) as pool:
+            asked = 0
+            while asked < n_trials or pending:
+                while asked < n_trials and len(pending) < n_jobs and stale < patience:
+                    trial = study.ask()
+                    L = trial.suggest_int("L", 1, max_L)
+                    asked += 1
+                    if L in fits:
+                        print(f"L = {L} already fitted; reusing the cached fit.")
+                        finish(trial, fits[L])
+                    elif L in waiting:
+                        waiting[L].append(trial)
+                    else:
+                        waiting[L] = [trial]
+                        pending[pool.submit(_fit_L, L, os.path.join(scratch, f"fit_L{L}.rds"))] = L
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    L = pending.pop(future)
+                    fits[L] = future.result()
+                    for trial in waiting.pop(L):
+                        finish(trial, fits[L])
+                if stale >= patience and asked < n_trials:
+                    print(f"Best ELBO unchanged for {patience} trials; stopping the L search early.")
+                    asked = n_trials
+
+        converged = [s for s in fits.values() if s['converged']]
+        if not converged:
+            raise RuntimeError("No SuSiE fit converged for any L tried.")
+        best = max(converged, key=lambda s: s['elbo'])
+        print(f"Best L found: {best['L']} with ELBO {best['elbo']} "
+              f"({len(fits)} distinct fits for {len(trials_log)} trials)")
+        return best['L'], ro.r['readRDS'](best['path']), trials_log
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _n_credible_sets(susieR, fit, R, coverage, min_abs_corr):
+    cs = susieR.susie_get_cs(fit, coverage=coverage, min_abs_corr=min_abs_corr, Xcorr=R).rx2('cs')
+    return 0 if cs is None else len(cs)
+
+
+def sweep_susie_L(susieR, zhat, R, num_samples, seed=42, max_L=DEFAULT_MAX_L, elbo_tol=DEFAULT_ELBO_TOL,
+                  coverage=0.95, min_abs_corr=0.5):
+    """
+    Warm-started L sweep on R objects in the calling process.
+
+    Returns (selected L, its fit, list of per-L summaries). The selected fit
+    is the last one whose extra effect still improved the ELBO and produced
+    a credible set.
+    """
+    import rpy2.robjects as ro
+
+    best_fit, best_L, best_elbo, best_cs = None, 0, -np.inf, 0
+    sweep_log = []
+    for L in range(1, max_L + 1):
+        start = time.perf_counter()
+        ro.r(f'set.seed({seed})')
+        if best_fit is None:
+            fit = susieR.susie_rss(z=zhat, R=R, L=L, n=num_samples)
+        else:
+            fit = susieR.susie_rss(z=zhat, R=R, L=L, n=num_samples, model_init=best_fit)
+        elbo_trace = list(fit.rx2('elbo'))
+        converged = bool(fit.rx2('converged')[0])
+        n_cs = _n_credible_sets(susieR, fit, R, coverage, min_abs_corr)
+        summary = {'L': L, 'elbo': elbo_trace[-1], 'converged': converged, 'niter': len(elbo_trace),
+                   'n_cs': n_cs, 'seconds': round(time.perf_counter() - start, 3)}
+        sweep_log.append(summary)
+        print(f"L = {L}: ELBO {summary['elbo']}, {n_cs} credible set(s), {summary['niter']} iterations "
+              f"({summary['seconds']}s)")
+
+        if best_fit is not None:
+            if not converged or summary['elbo'] <= best_elbo + elbo_tol:
+                print(f"Adding effect {L} does not improve the ELBO; keeping L = {best_L}.")
+                break
+            if n_cs <= best_cs:
+                print(f"Effect {L} adds no credible set; keeping L = {best_L}.")
+                break
+        elif not converged:
+            print("L = 1 did not converge; keeping it as the starting point.")
+        best_fit, best_L, best_elbo, best_cs = fit, L, summary['elbo'], n_cs
+
+    print(f"Selected L = {best_L} with ELBO {best_elbo} after {len(sweep_log)} warm-started fits")
+    return best_L, best_fit, sweep_log
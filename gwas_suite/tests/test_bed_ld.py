@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from bed_ld import BED_MAGIC, BedFile, ld_matrix  # noqa: E402
+
+
+def write_bfile(prefix, snp_ids, genotypes):
+    """PLINK 1 fileset from A1 dosages (rows = SNPs, -1 = missing)"""
+    codes = {2: 0b00, -1: 0b01, 1: 0b10, 0: 0b11}
+    n_samples = genotypes.shape[1]
+    with open(f"{prefix}.bed", 'wb') as f:
+        f.write(BED_MAGIC)
+        for row in genotypes:
+            packed = bytearray((n_samples + 3) // 4)
+            for i, g in enumerate(row):
+                packed[i // 4] |= codes[int(g)] << (2 * (i % 4))
+            f.write(bytes(packed))
+    with open(f"{prefix}.bim", 'w') as f:
+        for i, snp in enumerate(snp_ids):
+            f.write(f"1\t{snp}\t0\t{1000 * (i + 1)}\tA\tG\n")
+    with open(f"{prefix}.fam", 'w') as f:
+        for i in range(n_samples):
+            f.write(f"f{i} i{i} 0 0 0 -9\n")
+
+
+def test_duplicate_bim_ids_map_to_first_occurrence(tmp_path):
+    rng = np.random.default_rng(1)
+    genotypes = rng.integers(0, 3, size=(5, 50))
+    prefix = str(tmp_path / "ref")
+    write_bfile(prefix, ['rs1', 'rs2', 'rs1', 'rs3', 'rs2'], genotypes)
+
+    bed = BedFile(prefix)
+    assert list(bed.snp_indices(['rs3', 'rs2', 'rs1', 'rs9'])) == [0, 1, 3]
+    assert list(bed.snp_rows(['rs2', 'rs9', 'rs1', 'rs3'])) == [1, -1, 0, 3]
+    np.testing.assert_array_equal(bed.dosages([0, 3]), genotypes[[0, 3]])
+
+    r = ld_matrix(bed, bed.snp_indices(['rs1', 'rs3']))
+    np.testing.assert_allclose(r, np.corrcoef(genotypes[[0, 3]]), atol=1e-5)
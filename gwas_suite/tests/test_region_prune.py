@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from bed_ld import BedFile  # noqa: E402
+from region_prune import prune_region  # noqa: E402
+from test_bed_ld import write_bfile  # noqa: E402
+
+
+def test_signal_missing_from_panel(tmp_path):
+    rng = np.random.default_rng(2)
+    prefix = str(tmp_path / "ref")
+    write_bfile(prefix, ['rs1', 'rs2'], rng.integers(0, 3, size=(2, 40)))
+    bed = BedFile(prefix)
+
+    record = prune_region(['rs1', 'rs2', 'rsX'], [0.1, 0.2, 8], [1000, 2000, 3000], bed=bed)
+    assert list(record['reason']) == ['dropped', 'dropped', 'signal']
+    assert list(record['kept']) == [False, False, True]
+    assert list(record['signal']) == ['', '', '']
+
+
+def test_ld_rescue_with_panel(tmp_path):
+    rng = np.random.default_rng(3)
+    g = rng.integers(0, 3, size=(1, 60))
+    genotypes = np.vstack([g, g, rng.integers(0, 3, size=(1, 60))])
+    prefix = str(tmp_path / "ref")
+    write_bfile(prefix, ['rs1', 'rs2', 'rs3'], genotypes)
+    bed = BedFile(prefix)
+
+    record = prune_region(['rs1', 'rs2', 'rs3'], [8, 0.1, 0.1], [1000, 2000, 3000], bed=bed, r2=0.5)
+    assert list(record['reason'][:2]) == ['signal', 'ld']
+    assert record['signal'][1] == 'rs1'
+    assert record['r2_signal'][1] == 1.0
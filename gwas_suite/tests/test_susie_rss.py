@@ -0,0 +1,76 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from susie_rss import susie_get_cs, susie_rss  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'test-data')
+N = 5000
+
+
+def load_fixture():
+    z = pd.read_csv(os.path.join(TEST_DATA, 'susie_rss_z.tsv'), sep='\t')
+    R = np.loadtxt(os.path.join(TEST_DATA, 'susie_rss_R.ld'))
+    return z, R
+
+
+def test_purity_excludes_diagonal():
+    z, R = load_fixture()
+    sets = susie_rss(z=z['Z'].to_numpy(), R=R, n=N)['sets']
+    assert len(sets['cs']) == 2
+    for members, (lo, mean, median) in zip(sets['cs'], sets['purity']):
+        corr = np.abs(R[np.ix_(members, members)])
+        pairs = corr[np.triu_indices(len(members), 1)]  # upper.tri in susieR
+        assert lo == pytest.approx(pairs.min(), abs=1e-6)
+        assert mean == pytest.approx(pairs.mean(), abs=1e-6)
+        assert median == pytest.approx(np.median(pairs), abs=1e-6)
+
+    fit = {'alpha': np.eye(3)[[0]], 'V': np.ones(1)}
+    assert susie_get_cs(fit, Xcorr=np.eye(3))['purity'] == [(1.0, 1.0, 1.0)]
+
+
+def test_single_effect_pip_closed_form():
+    # With L = 1 and a fixed prior variance V, susieR's PIP is the softmax of
+    # the single-effect log Bayes factors on the adjusted z-scores
+    z, R = load_fixture()
+    z = z['Z'].to_numpy()
+    fit = susie_rss(z=z, R=R, n=N, L=1, estimate_prior_variance=False)
+    z_adj = z * np.sqrt((N - 1) / (z ** 2 + N - 2))
+    V, shat2 = 0.2, 1 / (N - 1)
+    betahat = z_adj / np.sqrt(N - 1)
+    lbf = 0.5 * np.log(shat2 / (V + shat2)) + 0.5 * betahat ** 2 * V / (shat2 * (V + shat2))
+    w = np.exp(lbf - lbf.max())
+    np.testing.assert_allclose(fit['pip'], w / w.sum(), rtol=1e-8, atol=1e-12)
+
+
+def test_matches_stored_susieR_output():
+    pip_path = os.path.join(TEST_DATA, 'susie_rss_susieR_pip.tsv')
+    cs_path = os.path.join(TEST_DATA, 'susie_rss_susieR_cs.tsv')
+    missing = [os.path.basename(p) for p in (pip_path, cs_path) if not os.path.exists(p)]
+    if missing:
+        pytest.fail(f"susieR reference output missing ({', '.join(missing)}); "
+                    "generate it with test-data/susie_rss_susieR.R and commit it")
+    z, R = load_fixture()
+    fit = susie_rss(z=z['Z'].to_numpy(), R=R, n=N)
+
+    expected_pip = pd.read_csv(pip_path, sep='\t')
+    assert list(expected_pip['SNP']) == list(z['SNP'])
+    np.testing.assert_allclose(fit['pip'], expected_pip['PIP'], atol=1e-4)
+
+    # susieR orders sets by purity; compare them by membership
+    expected = pd.read_csv(cs_path, sep='\t')
+    expected = {tuple(int(i) - 1 for i in str(v).split(',')): row for v, row in
+                zip(expected['variants'], expected.itertuples())}
+    sets = fit['sets']
+    got = {tuple(members): (cov, pur) for members, cov, pur in
+           zip(sets['cs'], sets['coverage'], sets['purity'])}
+    assert set(got) == set(expected)
+    for members, (cov, (lo, mean, median)) in got.items():
+        row = expected[members]
+        assert cov == pytest.approx(row.coverage, abs=1e-4)
+        assert (lo, mean, median) == pytest.approx(
+            (row.min_abs_corr, row.mean_abs_corr, row.median_abs_corr), abs=1e-6)
@@ -0,0 +1,20 @@
+import filecmp
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+# Modules copied into several tool directories, which are shipped independently
+COPIES = [
+    ('gwas_suite/ld_formats.py', 'fine/ld_formats.py'),
+    ('gwas_harm_test/hashing_writer.py', 'gwas_harmonizer/hashing_writer.py'),
+]
+
+
+@pytest.mark.parametrize('original, copy', COPIES)
+def test_copies_are_identical(original, copy):
+    copy_path = os.path.join(ROOT, copy)
+    assert not os.path.islink(copy_path), f"{copy} must be a real file, not a link"
+    assert filecmp.cmp(os.path.join(ROOT, original), copy_path, shallow=False), \
+        f"{copy} differs from {original}; apply the change to both"
@@ -138,11 +138,15 @@ def _(mo):
 @app.cell
 def _(os, pd, sp):
     import tempfile
+    from gwas_suite.run_gcta_cojo import run_cojo_by_chromosome
 
     def run_gcta_cojo_analysis(sumstats_file: pd.DataFrame, 
                                plink_dir: str, 
                                maf: float, 
-                               population: str) -> pd.DataFrame:
+                               population: str,
+                               workers: int = 4,
+                               threads: int = None,
+                               cache_dir: str = "./data/gcta_cojo_cache") -> pd.DataFrame:
         """
         Run GCTA COJO analysis on the given summary statistics file.
     
@@ -151,13 +155,15 @@ def _(os, pd, sp):
         - plink_dir: Directory containing PLINK files.
         - maf: Minor allele frequency threshold.
         - population: Population for which the analysis is run.
+        - workers: Chromosomes run concurrently.
+        - threads: Total GCTA threads shared by the concurrent jobs (default: all CPUs).
+        - cache_dir: Per-chromosome COJO results kept across runs (None to disable); only
+          chromosomes whose input, reference, MAF or flags changed are rerun.
         """
 
-        # Add and ID column with chr:bp:ref:alt consistent with plink
-        cojo_df = sumstats_file[["A1", "A2", "FRQ", "BETA", "SE", "P", "N"]].copy()
-        cojo_df["SNP"] = sumstats_file.index
-        # Move SNP column to the front
-        cojo_df = cojo_df[['SNP', 'A1', 'A2', 'FRQ', 'BETA', 'SE', 'P', 'N']]
+        # The index (ID column with chr:bp:ref:alt consistent with plink) is written as the
+        # SNP column; CHR lets the driver split the input without reading the reference .bim files
+        cojo_columns = ['CHR', 'A1', 'A2', 'FRQ', 'BETA', 'SE', 'P', 'N']
 
         # Create temp directory for COJO results
         with tempfile.TemporaryDirectory() as gcta_out_dir:
@@ -165,44 +171,20 @@ def _(os, pd, sp):
         # if not os.path.exists(gcta_out_dir):
         #     os.makedirs(gcta_out_dir)
             cojo_sumstats_file_path = os.path.join(gcta_out_dir, "cojo_sumstats.txt")
-            cojo_df.to_csv(cojo_sumstats_file_path, sep='\t', index=False)
-        
-            gcta_cojo_script = "./scripts/6_gcta_cojo_analysis.sh"
-            # Run GCTA COJO analysis
-            gcta_cojo_cmd = [
-                "bash", gcta_cojo_script, 
-                  gcta_out_dir,
-                  plink_dir,
-                  cojo_sumstats_file_path,
-                  str(maf),
-                  population
-            ]
-        
-            print(f"Running GCTA COJO command: {' '.join(gcta_cojo_cmd)}")
-            gcta_cojo_result = sp.run(gcta_cojo_cmd, capture_output=True, text=True)
-            if gcta_cojo_result.returncode != 0:
-                print(f"Error running GCTA COJO: {gcta_cojo_result.stderr}")
-            else:
-                print(f"Successfully ran GCTA COJO: {gcta_cojo_result.stdout}")
-                print(f"Results saved to {gcta_out_dir}")
-    
-            # Read the combined results   
-            # Merge COJO files
-            combined_cojo_res = []
-            for i in range(1, 23):
-                cojo_result_file = f"{gcta_out_dir}/{population}.{i}.cojo_sumstats.txt.maf.{maf}.jma.cojo"
-                if os.path.exists(cojo_result_file):
-                    cojo_df_tmp = pd.read_csv(cojo_result_file, sep='\t', low_memory=False)
-                    combined_cojo_res.append(cojo_df_tmp)
-                else:
-                    print(f"File {cojo_result_file} does not exist. Skipping.")
-        
-            combined_cojo_df = pd.concat(combined_cojo_res, ignore_index=True, axis=0)
-            combined_cojo_df.rename(columns={"SNP": "ID"}, inplace=True)
-            # Set the SNP column as index
-            combined_cojo_df.reset_index()
-            combined_cojo_df.set_index('ID', inplace=True)
-            combined_cojo_df.drop_duplicates()
+            # Written straight from the sumstats frame, without building a copy of it
+            sumstats_file.to_csv(cojo_sumstats_file_path, sep='\t', columns=cojo_columns,
+                                 index_label='SNP', chunksize=500_000)
+
+            # One gcta64 --cojo-slct job per chromosome, run concurrently; the
+            # .jma.cojo outputs come back merged and indexed by SNP
+            combined_cojo_df = run_cojo_by_chromosome(
+                cojo_sumstats_file_path, plink_dir, population,
+                output_jma=os.path.join(gcta_out_dir, "combined.jma.cojo"),
+                maf=maf, workers=workers, threads=threads,
+                work_dir=os.path.join(gcta_out_dir, "by_chromosome"), cache_dir=cache_dir)
+            print(pd.read_csv(os.path.join(gcta_out_dir, "by_chromosome", "timing_report.tsv"), sep='\t'))
+
+            combined_cojo_df.index.name = "ID"
             # combined_cojo_df.to_csv(combined_cojo_file_path, sep='\t', index=True)
             print(f"Combined COJO: {combined_cojo_df.shape}")
             return combined_cojo_df
@@ -214,8 +196,17 @@ app._unparsable_cell(
     from rpy2.robjects import numpy2ri, r
     import optuna 
     from typing import Tuple, Any
+    from gwas_suite.ld_cache import LDCache
+    from gwas_suite.susie_search import search_susie_L, sweep_susie_L
+    from gwas_suite import susie_rss as susie_np
+    from gwas_suite.bed_ld import BedFile
+    from gwas_suite.region_prune import prune_region, summarize
+    import resource
+
+    # Persistent across sessions; overlapping windows around nearby leads reuse LD
+    ld_cache = LDCache()
 
-    def calculate_ld_for_region(sumstats: pd.DataFrame, chr: int, position: int, window: int = 500, population: str = \"EUR\") -> pd.DataFrame:
+    def calculate_ld_for_region(sumstats: pd.DataFrame, chr: int, position: int, window: int = 500, population: str = \"EUR\", ld_cache: LDCache = ld_cache) -> pd.DataFrame:
         # window size is in kb
         window = window * 1000
        # Filter the sumstats data for all snps around the posion
@@ -227,6 +218,13 @@ app._unparsable_cell(
     
         filtered_ids = filtered_region.index.tolist()
         print(f\"Filtered {len(filtered_ids)} SNPs in the region around position {position} on chromosome {chr}.\")
+        plink_prefix = f\"{plink_dir}/{population}/{population}.{chr}.1000Gp3.20130502\"
+        if ld_cache is not None:
+            cached = ld_cache.lookup(plink_prefix, population, chr, filtered_ids, start, end)
+            if cached is not None:
+                ld_matrix, snp_ids = cached
+                print(f\"LD for {len(snp_ids)} SNPs served from cache. {ld_cache.summary()}\")
+                return pd.DataFrame(ld_matrix, index=snp_ids).fillna(0)
         # Create a temporary file to store the IDs and use tmp file for ld
         with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as tmp_file:
             for snp_id in filtered_ids:
@@ -236,7 +234,7 @@ app._unparsable_cell(
                 tmp_file_ld_path = tmp_file_ld.name
                 plink_cmd = [
                     \"plink2\",
-                    \"--bfile\", f\"{plink_dir}/{population}/{population}.{chr}.1000Gp3.20130502\",
+                    \"--bfile\", plink_prefix,
                     \"--keep-allele-order\",
                     \"--r-unphased\", \"square\",
                     \"--extract\", tmp_file_path,
@@ -259,6 +257,8 @@ app._unparsable_cell(
             
                 ld_df = pd.read_csv(ld_out_path, sep='\t', header=None)
                 ld_df.index = snp_ids
+                if ld_cache is not None:
+                    ld_cache.store(plink_prefix, population, chr, filtered_ids, ld_df.values, snp_ids, start, end)
                 ld_df.fillna(0, inplace=True)
                 #Clean up temporary files
                 os.remove(tmp_file_path)
@@ -289,35 +289,77 @@ app._unparsable_cell(
 
         return -np.inf
 
-    def finemap_region(seed: int, sumstats: pd.DataFrame, chr: int, lead_variant_position: str, window: int, population: str = \"EUR\", L: int = 5, coverage: float = 0.95, min_abs_corr: float = 0.5) -> Tuple[Any]:
+    def peak_memory_mb() -> float:
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def with_pruned(sub_region: pd.DataFrame, pruned_rows: pd.DataFrame) -> pd.DataFrame:
+        # Report PIPs on the full region: pruned SNPs follow the fine-mapped ones with PIP 0,
+        # so credible-set indices still refer to the first rows
+        if pruned_rows is None:
+            return sub_region
+        return pd.concat([sub_region.assign(PRUNED=False), pruned_rows.assign(PIP=0.0, PRUNED=True)])
+
+    def finemap_region(seed: int, sumstats: pd.DataFrame, chr: int, lead_variant_position: str, window: int, population: str = \"EUR\", L: int = 5, coverage: float = 0.95, min_abs_corr: float = 0.5, n_trials: int = 10, n_jobs: int = 4, l_search: str = \"optuna\", backend: str = \"susieR\", precision: str = \"float64\", prune: dict = None) -> Tuple[Any]:
+
+        pruned_rows = None
+        if prune is not None:
+            # Drop low-|z| SNPs outside the LD-clump radius of every signal before
+            # computing LD; prune holds region_prune options (min_z, signal_z, radius_kb, r2)
+            region = sumstats[(sumstats[\"CHR\"] == chr) &
+                              (sumstats[\"BP\"] >= lead_variant_position - window * 1000) &
+                              (sumstats[\"BP\"] <= lead_variant_position + window * 1000)]
+            bed = BedFile(f\"{plink_dir}/{population}/{population}.{chr}.1000Gp3.20130502\")
+            lead_ids = region.index[region[\"BP\"] == lead_variant_position]
+            record = prune_region(region.index, region[\"Z\"], region[\"BP\"], bed=bed, force_signals=lead_ids, **prune)
+            print(summarize(record))
+            kept = record[\"kept\"].to_numpy()
+            pruned_rows = region[~kept]
+            sumstats = region[kept]
 
         ld_df = calculate_ld_for_region(sumstats, chr, lead_variant_position, 
                                    window)
         sub_region_sumstats_ld = sumstats.loc[ld_df.index]
+        # precision=\"float32\" halves the LD matrix; the DataFrame copy is dropped once extracted
+        LD_mat = ld_df.to_numpy(dtype=precision)
+        del ld_df
         print(f\"Sub-region sumstats shape after filtering by LD: {sub_region_sumstats_ld.shape}\")
         num_samples = int(sub_region_sumstats_ld[\"N\"].iloc[0])
+        if backend == \"numpy\":
+            # In-process SuSiE-RSS: no R session or numpy2ri copies of the LD matrix
+            zhat = sub_region_sumstats_ld[\"Z\"].values
+            if L <= 0:
+                L, susie_fit = susie_np.select_L(zhat, LD_mat, num_samples, coverage=coverage, min_abs_corr=min_abs_corr, dtype=LD_mat.dtype)
+            else:
+                # Scales LD_mat in place: a single p x p array for the whole fit
+                susie_fit = susie_np.susie_rss(z=zhat, R=LD_mat, n=num_samples, L=L, coverage=coverage, min_abs_corr=min_abs_corr, dtype=LD_mat.dtype, overwrite_R=True)
+            sub_region_sumstats_ld[\"PIP\"] = susie_fit[\"pip\"]
+            sub_region_sumstats_ld = with_pruned(sub_region_sumstats_ld, pruned_rows)
+            print(f\"Peak memory: {peak_memory_mb():.0f} MB ({len(zhat)} SNPs, {precision} LD)\")
+            # 1-based like susieR's cs list, so downstream cells work with either backend
+            credible_sets = [[cs + 1 for cs in susie_fit[\"sets\"][\"cs\"]]]
+            print(f\"Credible sets found: {len(credible_sets[0])}\")
+            return susie_fit, sub_region_sumstats_ld, credible_sets
         try:
             susieR = importr('susieR')
 
             ro.r(f'set.seed({seed})')
-            zhat = sub_region_sumstats_ld[\"Z\"].values.reshape(len(ld_df), 1)
-            LD_mat = ld_df.values
+            zhat = sub_region_sumstats_ld[\"Z\"].values.reshape(len(LD_mat), 1)
         
             with (ro.default_converter + numpy2ri.converter).context():
                 # Enable conversion between numpy arrays and R matrices
                 zhat_r  = ro.conversion.get_conversion().py2rpy(zhat)
                 R_r  = ro.conversion.get_conversion().py2rpy(LD_mat)
     
-            if L <= 0: # Do hyper-paramter search
-                study = optuna.create_study(direction=\"maximize\")
-                study.optimize(lambda trial: objective_susie(trial, seed, susieR, zhat_r, R_r, num_samples), n_trials=10)
-                L = study.best_params[\"L\"]
-                print(f\"Best L found: {L} with ELBO {study.best_value}\")
-                susie_fit = susieR.susie_rss(
-                    z=zhat_r,
-                    R=R_r,
-                    L=L,
-                    n=num_samples)
+            if L <= 0 and l_search == \"sweep\":
+                # Deterministic: L = 1, 2, ... warm-started from the previous fit
+                L, susie_fit, _ = sweep_susie_L(susieR, zhat_r, R_r, num_samples, seed=seed,
+                                                coverage=coverage, min_abs_corr=min_abs_corr)
+            elif L <= 0: # Do hyper-paramter search
+                # Trials run in n_jobs worker processes sharing the LD matrix;
+                # the best trial's fit is reused, not refitted
+                L, susie_fit, _ = search_susie_L(zhat, LD_mat, num_samples, seed=seed,
+                                                 n_trials=n_trials, n_jobs=n_jobs)
 
             else:
                 susie_fit = susieR.susie_rss(
@@ -329,6 +371,8 @@ app._unparsable_cell(
             credible_sets = susieR.susie_get_cs(susie_fit, coverage=coverage, min_abs_corr=min_abs_corr, Xcorr=R_r)
             pips = susieR.susie_get_pip(susie_fit)
             sub_region_sumstats_ld[\"PIP\"] = pips
+            sub_region_sumstats_ld = with_pruned(sub_region_sumstats_ld, pruned_rows)
+            print(f\"Peak memory: {peak_memory_mb():.0f} MB ({len(zhat)} SNPs, {precision} LD)\")
             print(f\"Credible sets found: {len(credible_sets[0])}\")
             return susie_fit, sub_region_sumstats_ld, credible_sets
         except RuntimeError as e:
@@ -336,7 +380,18 @@ app._unparsable_cell(
             print(\"Please ensure MungeSumstats is installed in your R environment.\")
             exit()
 
-    def finemap_cojo_result(seed: int, sumstats: pd.DataFrame,)
+    def finemap_cojo_result(seed: int, sumstats: pd.DataFrame, cojo_df: pd.DataFrame, window: int, population: str = \"EUR\", **finemap_kwargs) -> pd.DataFrame:
+        # One region per COJO signal (indexed by ID, with Chr/bp columns); for a whole
+        # trait in parallel use gwas_suite/finemap_pipeline.py instead
+        cs_tables = []
+        for signal_id, signal in cojo_df.iterrows():
+            _, region, credible_sets = finemap_region(seed, sumstats, int(signal[\"Chr\"]), int(signal[\"bp\"]), window, population=population, **finemap_kwargs)
+            for cs_id, members in enumerate(credible_sets[0], start=1):
+                cs_rows = region.iloc[[int(i) - 1 for i in members]]
+                cs_tables.append(cs_rows[[\"CHR\", \"BP\", \"PIP\"]].assign(signal=signal_id, cs=cs_id))
+        if not cs_tables:
+            return pd.DataFrame(columns=[\"signal\", \"cs\", \"CHR\", \"BP\", \"PIP\"])
+        return pd.concat(cs_tables)[[\"signal\", \"cs\", \"CHR\", \"BP\", \"PIP\"]]
     """,
     name="_"
 )
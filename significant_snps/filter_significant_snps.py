@@ -2,26 +2,92 @@
 
 import pandas as pd
 import argparse
+import csv
+import gzip
+import io
+import os
+import shutil
+import subprocess
 
-def filter_snps(input_file, output_file, pval_column, pval_threshold):
-    # Load the summary statistics file
-    df = pd.read_csv(input_file, sep=None, engine="python") 
+BLOCK_BYTES = 16 * 1024 * 1024
 
-    if pval_column not in df.columns:
-        raise ValueError(f"Column '{pval_column}' not found in input file. Available columns: {', '.join(df.columns)}")
+def open_input(input_file, threads):
+    """Binary stream of the input; gzip/bgzip is decompressed by bgzip -@ or pigz -p when available"""
+    with open(input_file, 'rb') as f:
+        is_compressed = f.read(2) == b'\x1f\x8b'
+    if not is_compressed:
+        return open(input_file, 'rb'), None
+    for cmd in (['bgzip', '-dc', '-@', str(threads)], ['pigz', '-dc', '-p', str(threads)]):
+        if shutil.which(cmd[0]):
+            proc = subprocess.Popen(cmd + [input_file], stdout=subprocess.PIPE)
+            return proc.stdout, proc
+    return gzip.open(input_file, 'rb'), None
 
-    # Filter based on p-value threshold
-    filtered_df = df[df[pval_column] < pval_threshold]
+def detect_separator(header):
+    """Tab, comma or whitespace, from the header line (replaces the slow sep=None sniffer)"""
+    if '\t' in header:
+        return '\t'
+    if ',' in header:
+        return ','
+    return r'\s+'
 
-    # Write filtered SNPs to output
-    filtered_df.to_csv(output_file, sep="\t", index=False)
+def read_blocks(stream, block_bytes=BLOCK_BYTES):
+    """Blocks of whole lines of about block_bytes"""
+    rest = b''
+    while True:
+        data = stream.read(block_bytes)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b'\n') + 1
+        rest = data[cut:]
+        if cut:
+            yield data[:cut]
+    if rest:
+        yield rest + b'\n'
+
+def filter_snps(input_file, output_file, pval_column, pval_threshold, threads=None):
+    # Stream the summary statistics: only the p-value column is parsed and
+    # matching lines are written through unchanged
+    stream, proc = open_input(input_file, threads or os.cpu_count() or 1)
+    try:
+        header = stream.readline()
+        sep = detect_separator(header.decode())
+        columns = header.decode().split() if sep == r'\s+' else header.decode().rstrip('\r\n').split(sep)
+
+        if pval_column not in columns:
+            raise ValueError(f"Column '{pval_column}' not found in input file. Available columns: {', '.join(columns)}")
+        p_index = columns.index(pval_column)
+
+        # Filter based on p-value threshold
+        with open(output_file, 'wb') as out:
+            out.write(header)
+            for block in read_blocks(stream):
+                # Rows end at '\n' only and quotes are not special, so there is exactly one
+                # parsed row per physical line; the '\r' of CRLF lines is stripped from P
+                p = pd.read_csv(io.BytesIO(block), sep=sep, header=None, names=range(len(columns)),
+                                usecols=[p_index], skip_blank_lines=False, dtype=str,
+                                quoting=csv.QUOTE_NONE, lineterminator='\n', engine='c')[p_index]
+                keep = (pd.to_numeric(p.str.rstrip('\r'), errors='coerce') < pval_threshold).to_numpy().nonzero()[0]
+                if len(keep):
+                    lines = block.split(b'\n')
+                    out.write(b'\n'.join(lines[i] for i in keep) + b'\n')
+        if proc is not None and proc.wait() != 0:
+            raise RuntimeError(f"Decompressing {input_file} failed")
+    finally:
+        stream.close()
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Filter significant SNPs based on p-value threshold.")
-    parser.add_argument("--input", required=True, help="Input summary statistics file (TSV/CSV)")
+    parser.add_argument("--input", required=True, help="Input summary statistics file (TSV/CSV, optionally gzipped)")
     parser.add_argument("--output", required=True, help="Output file for significant SNPs")
     parser.add_argument("--pval_column", default="P", help="Name of the p-value column (default: P)")
     parser.add_argument("--pval_threshold", type=float, default=5e-8, help="P-value threshold (default: 5e-8)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Decompression threads for gzip/bgzip input (default: all CPUs)")
 
     args = parser.parse_args()
-    filter_snps(args.input, args.output, args.pval_column, args.pval_threshold)
+    filter_snps(args.input, args.output, args.pval_column, args.pval_threshold, threads=args.threads)